@@ -0,0 +1 @@
+"""Benchmarks for openai_image_api."""
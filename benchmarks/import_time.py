@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+节点导入耗时基准测试
+
+在全新的子进程中多次导入节点模块并读取 INPUT_TYPES（ComfyUI 启动时注册节点所做的事情），
+报告导入耗时的中位数与最大值，并检查 torch、numpy、PIL、openai 等重型依赖没有被导入。
+
+用法：
+    python -m benchmarks.import_time --runs 10
+    python -m benchmarks.import_time --max-ms 500   # 超过阈值或导入了重型依赖时返回非零
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import List
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 注册节点时不应导入的模块（首次执行时才需要）
+HEAVY_MODULES = ["torch", "numpy", "PIL", "openai", "httpx", "dotenv"]
+
+PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+from src.openai_image_api.nodes import NODE_CLASS_MAPPINGS
+for node in NODE_CLASS_MAPPINGS.values():
+    node.INPUT_TYPES()
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def measure(runs: int) -> dict:
+    """在子进程中测量导入耗时"""
+    seconds: List[float] = []
+    loaded: List[str] = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, capture_output=True, text=True, check=True)
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        seconds.append(result["seconds"])
+        loaded = sorted(set(loaded) | set(result["loaded"]))
+    return {
+        "runs": runs,
+        "median_ms": round(statistics.median(seconds) * 1000, 1),
+        "max_ms": round(max(seconds) * 1000, 1),
+        "heavy_modules_loaded": loaded,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure the import time of the node module")
+    parser.add_argument("--runs", type=int, default=5, help="Number of fresh interpreter runs")
+    parser.add_argument("--max-ms", type=float, help="Fail if the median import time exceeds this many milliseconds")
+    args = parser.parse_args(argv)
+
+    result = measure(args.runs)
+    print(json.dumps(result))
+    if result["heavy_modules_loaded"]:
+        print(f"Heavy modules imported at registration: {', '.join(result['heavy_modules_loaded'])}", file=sys.stderr)
+        return 1
+    if args.max_ms is not None and result["median_ms"] > args.max_ms:
+        print(f"Median import time {result['median_ms']}ms exceeds {args.max_ms}ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+本地模拟图像 API 服务
+
+模拟 OpenAI / Azure OpenAI 的图像生成与编辑端点，用于基准测试与回归测试，包括：
+- 可配置的响应延迟（固定值 + 随机抖动）
+- 可配置的返回图像尺寸（即响应负载大小）
+- 按比例注入 429（带 Retry-After）与 500 错误
+- 支持 n 参数与流式部分图像（SSE）
+
+支持的路径：
+- /v1/images/generations、/v1/images/edits（OpenAI）
+- /openai/deployments/<deployment>/images/generations|edits（Azure OpenAI）
+
+用法：
+    python -m benchmarks.mock_image_api --port 8765 --latency 2.0 --rate-limit-ratio 0.1
+"""
+
+import argparse
+import base64
+import io
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+
+@dataclass
+class MockSettings:
+    """模拟服务配置"""
+    latency: float = 0.0
+    jitter: float = 0.0
+    width: int = 1024
+    height: int = 1024
+    rate_limit_ratio: float = 0.0
+    error_ratio: float = 0.0
+    retry_after_ms: int = 100
+    partial_images_delay: float = 0.0
+
+
+class MockImageAPIServer:
+    """在后台线程中运行的模拟图像 API 服务"""
+
+    def __init__(self, settings: Optional[MockSettings] = None, host: str = "127.0.0.1", port: int = 0):
+        self.settings = settings or MockSettings()
+        self.stats = {"requests": 0, "rate_limited": 0, "errors": 0, "bytes_in": 0, "bytes_out": 0}
+        self._stats_lock = threading.Lock()
+        self._png_b64 = self._make_payload(self.settings.width, self.settings.height)
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def base_url(self) -> str:
+        """OpenAI 客户端使用的 base_url"""
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    @property
+    def azure_endpoint(self) -> str:
+        """Azure OpenAI 客户端使用的 azure_endpoint"""
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def payload_bytes(self) -> int:
+        return len(base64.b64decode(self._png_b64))
+
+    def start(self) -> "MockImageAPIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-image-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockImageAPIServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    @staticmethod
+    def _make_payload(width: int, height: int) -> str:
+        """生成带噪声的 PNG（接近真实图像的压缩率）"""
+        rng = np.random.default_rng(0)
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        noise = rng.normal(0, 24, size=(height, width, 3)).astype(np.float32)
+        pixels = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format="PNG")
+        return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("content-length") or 0)
+                body = self.rfile.read(length)
+                server._count("requests")
+                server._count("bytes_in", length)
+
+                path = self.path.split("?")[0]
+                if not (path.endswith("/images/generations") or path.endswith("/images/edits")):
+                    return self._send_json(404, {"error": {"message": f"Unknown path {path}"}})
+
+                settings = server.settings
+                time.sleep(max(0.0, settings.latency + random.uniform(-settings.jitter, settings.jitter)))
+
+                roll = random.random()
+                if roll < settings.rate_limit_ratio:
+                    server._count("rate_limited")
+                    return self._send_json(429, {"error": {"message": "Rate limit exceeded", "code": "429"}},
+                                           {"retry-after-ms": str(settings.retry_after_ms)})
+                if roll < settings.rate_limit_ratio + settings.error_ratio:
+                    server._count("errors")
+                    return self._send_json(500, {"error": {"message": "Injected server error"}})
+
+                params = self._parse_params(body)
+                n = int(params.get("n") or 1)
+                if str(params.get("stream", "")).lower() == "true":
+                    return self._send_stream(path, int(params.get("partial_images") or 0))
+                data = [{"b64_json": server._png_b64} for _ in range(n)]
+                self._send_json(200, {"created": int(time.time()), "data": data,
+                                      "usage": {"input_tokens": 50, "output_tokens": 4160, "total_tokens": 4210,
+                                                "input_tokens_details": {"text_tokens": 50, "image_tokens": 0}}})
+
+            def _parse_params(self, body: bytes) -> dict:
+                content_type = self.headers.get("content-type") or ""
+                if content_type.startswith("application/json"):
+                    return json.loads(body or b"{}")
+                # multipart/form-data：只提取简单字段
+                params = {}
+                for part in body.split(b"--"):
+                    header, _, value = part.partition(b"\r\n\r\n")
+                    marker = b'name="'
+                    if marker in header and b"filename=" not in header:
+                        name = header.split(marker, 1)[1].split(b'"', 1)[0].decode()
+                        params[name] = value.rstrip(b"\r\n").decode(errors="replace")
+                return params
+
+            def _send_stream(self, path: str, partial_images: int) -> None:
+                prefix = "image_edit" if path.endswith("/edits") else "image_generation"
+                self.send_response(200)
+                self.send_header("content-type", "text/event-stream")
+                self.send_header("connection", "close")
+                self.end_headers()
+                common = {"created_at": int(time.time()), "size": "1024x1024", "quality": "low",
+                          "background": "opaque", "output_format": "png", "b64_json": server._png_b64}
+                for i in range(partial_images):
+                    time.sleep(server.settings.partial_images_delay)
+                    event = dict(common, type=f"{prefix}.partial_image", partial_image_index=i)
+                    self._write_event(event)
+                event = dict(common, type=f"{prefix}.completed",
+                             usage={"input_tokens": 50, "output_tokens": 4160, "total_tokens": 4210,
+                                    "input_tokens_details": {"text_tokens": 50, "image_tokens": 0}})
+                self._write_event(event)
+                self.close_connection = True
+
+            def _write_event(self, event: dict) -> None:
+                data = f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode()
+                server._count("bytes_out", len(data))
+                self.wfile.write(data)
+                self.wfile.flush()
+
+            def _send_json(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+                data = json.dumps(payload).encode()
+                server._count("bytes_out", len(data))
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a local mock OpenAI/Azure OpenAI image API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random latency jitter in seconds")
+    parser.add_argument("--width", type=int, default=1024, help="Width of returned images")
+    parser.add_argument("--height", type=int, default=1024, help="Height of returned images")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--error-ratio", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--retry-after-ms", type=int, default=100)
+    args = parser.parse_args()
+
+    settings = MockSettings(latency=args.latency, jitter=args.jitter, width=args.width, height=args.height,
+                            rate_limit_ratio=args.rate_limit_ratio, error_ratio=args.error_ratio,
+                            retry_after_ms=args.retry_after_ms)
+    server = MockImageAPIServer(settings, args.host, args.port).start()
+    print(f"Mock image API listening on {server.base_url} (Azure endpoint: {server.azure_endpoint})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+图像 API 节点基准测试
+
+针对本地模拟图像 API（benchmarks/mock_image_api.py）测量节点的端到端开销，包括：
+- single: 顺序执行单张生成
+- batch: 批量节点一次并发生成多张
+- concurrent: 多个线程同时调用单张节点（模拟多个工作流）
+- edit: 带输入图像的编辑请求（包含上传编码）
+- codec: ImageProcessor 编码/解码耗时
+
+输出吞吐量、p50/p95/p99 延迟、编码/解码耗时与峰值 RSS。
+
+用法：
+    python -m benchmarks.run_benchmarks --requests 32 --latency 0.5 --concurrency 8
+    python -m benchmarks.run_benchmarks --modes single,codec --output bench_output.txt
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import torch  # noqa: E402
+
+from benchmarks.mock_image_api import MockImageAPIServer, MockSettings  # noqa: E402
+from src.openai_image_api.image_utils import ImageProcessor  # noqa: E402
+from src.openai_image_api.nodes import OpenAIImageAPI, OpenAIImageBatchAPI  # noqa: E402
+
+MODES = ["single", "batch", "concurrent", "edit", "codec"]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """线性插值百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def peak_rss_mb() -> float:
+    """进程峰值常驻内存（MB）"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 返回 KB，macOS 返回字节
+    return usage / 1024 / 1024 if sys.platform == "darwin" else usage / 1024
+
+
+def summarize(mode: str, latencies: List[float], wall: float, images: int) -> Dict[str, float]:
+    """汇总一种模式的结果"""
+    return {
+        "mode": mode,
+        "requests": len(latencies),
+        "images": images,
+        "wall_s": round(wall, 4),
+        "throughput_img_s": round(images / wall, 3) if wall > 0 else 0.0,
+        "p50_s": round(percentile(latencies, 50), 4),
+        "p95_s": round(percentile(latencies, 95), 4),
+        "p99_s": round(percentile(latencies, 99), 4),
+        "mean_s": round(statistics.fmean(latencies), 4) if latencies else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def timed(call: Callable[[], object]) -> float:
+    started = time.perf_counter()
+    call()
+    return time.perf_counter() - started
+
+
+def node_kwargs(args: argparse.Namespace, server: MockImageAPIServer) -> dict:
+    """单张节点的公共参数"""
+    kwargs = {"model": "gpt-image-1", "size": "1024x1024", "quality": "low", "use_cache": False}
+    if args.provider == "azure":
+        kwargs.update(provider="azure", api_key="benchmark-key", azure_endpoint=server.azure_endpoint)
+    else:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        kwargs.update(provider="openai", api_key="benchmark-key")
+    return kwargs
+
+
+def bench_single(args, server) -> Dict[str, float]:
+    node = OpenAIImageAPI()
+    kwargs = node_kwargs(args, server)
+    started = time.perf_counter()
+    latencies = [timed(lambda i=i: node.generate_image(prompt=f"single {i}", **kwargs)) for i in range(args.requests)]
+    return summarize("single", latencies, time.perf_counter() - started, args.requests)
+
+
+def bench_batch(args, server) -> Dict[str, float]:
+    node = OpenAIImageBatchAPI()
+    kwargs = node_kwargs(args, server)
+    prompts = "\n".join(f"batch {i}" for i in range(args.requests))
+    started = time.perf_counter()
+    latency = timed(lambda: node.generate_batch(prompts=prompts, n=1, max_concurrency=args.concurrency, **kwargs))
+    return summarize("batch", [latency], time.perf_counter() - started, args.requests)
+
+
+def bench_concurrent(args, server) -> Dict[str, float]:
+    node = OpenAIImageAPI()
+    kwargs = node_kwargs(args, server)
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def one(i: int) -> None:
+        latency = timed(lambda: node.generate_image(prompt=f"concurrent {i}", **kwargs))
+        with lock:
+            latencies.append(latency)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(one, range(args.requests)))
+    return summarize("concurrent", latencies, time.perf_counter() - started, args.requests)
+
+
+def bench_edit(args, server) -> Dict[str, float]:
+    node = OpenAIImageAPI()
+    kwargs = node_kwargs(args, server)
+    image = torch.rand(args.edit_images, 1024, 1024, 3)
+    started = time.perf_counter()
+    latencies = [
+        timed(lambda i=i: node.generate_image(prompt=f"edit {i}", image=image, **kwargs))
+        for i in range(max(1, args.requests // 4))
+    ]
+    return summarize("edit", latencies, time.perf_counter() - started, len(latencies))
+
+
+def bench_codec(args, server) -> Dict[str, float]:
+    image = torch.rand(args.edit_images, 1024, 1024, 3)
+    encode = [timed(lambda: ImageProcessor.prepare_images_for_api(image)) for _ in range(3)]
+    payload = ImageProcessor.prepare_images_for_api(image)
+    frames = [data for _, data in payload]
+    decode = [timed(lambda: ImageProcessor.decode_images(frames)) for _ in range(3)]
+    result = summarize("codec", encode + decode, sum(encode) + sum(decode), 0)
+    result.update({
+        "encode_batch_s": round(min(encode), 4),
+        "decode_batch_s": round(min(decode), 4),
+        "frames": len(frames),
+        "upload_bytes": sum(len(f) for f in frames),
+    })
+    return result
+
+
+BENCHMARKS = {
+    "single": bench_single,
+    "batch": bench_batch,
+    "concurrent": bench_concurrent,
+    "edit": bench_edit,
+    "codec": bench_codec,
+}
+
+
+# 基准测试的状态目录，避免模拟调用计入用户的预算、任务日志与共享帧存储
+STATE_ENV = {
+    "OPENAI_IMAGE_API_BUDGET_DB": "budget.sqlite",
+    "OPENAI_IMAGE_API_JOURNAL_DIR": "journal",
+    "OPENAI_IMAGE_API_SHARED_FRAMES_DIR": "frames",
+    "OPENAI_IMAGE_API_CACHE_DIR": "responses",
+}
+
+
+def run(args: argparse.Namespace) -> List[Dict[str, float]]:
+    """启动模拟服务并在临时状态目录中运行所选模式"""
+    settings = MockSettings(latency=args.latency, jitter=args.jitter, width=args.width, height=args.height,
+                            rate_limit_ratio=args.rate_limit_ratio, error_ratio=args.error_ratio)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="openai-image-bench-") as state_dir, MockImageAPIServer(settings) as server:
+        for name, path in STATE_ENV.items():
+            os.environ[name] = os.path.join(state_dir, path)
+        for mode in args.modes:
+            result = BENCHMARKS[mode](args, server)
+            result["server_requests"] = server.stats["requests"]
+            results.append(result)
+    return results
+
+
+def format_table(results: List[Dict[str, float]]) -> str:
+    columns = ["mode", "requests", "images", "wall_s", "throughput_img_s", "p50_s", "p95_s", "p99_s", "peak_rss_mb"]
+    lines = ["  ".join(f"{c:>16}" for c in columns)]
+    for result in results:
+        lines.append("  ".join(f"{str(result.get(c, '')):>16}" for c in columns))
+    for result in results:
+        if result["mode"] == "codec":
+            lines.append(f"codec: encode {result['frames']} frames {result['encode_batch_s']}s, "
+                         f"decode {result['decode_batch_s']}s, upload {result['upload_bytes']} bytes")
+    return "\n".join(lines)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the OpenAI Image API node against a local mock server")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"Comma-separated modes: {', '.join(MODES)}")
+    parser.add_argument("--provider", choices=["openai", "azure"], default="openai")
+    parser.add_argument("--requests", type=int, default=16, help="Requests per mode")
+    parser.add_argument("--concurrency", type=int, default=8, help="In-flight limit for batch/concurrent modes")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock server latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Mock server latency jitter in seconds")
+    parser.add_argument("--width", type=int, default=1024, help="Width of returned images")
+    parser.add_argument("--height", type=int, default=1024, help="Height of returned images")
+    parser.add_argument("--edit-images", type=int, default=4, help="Input frames for edit/codec modes")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="Fraction of 429 responses")
+    parser.add_argument("--error-ratio", type=float, default=0.0, help="Fraction of 500 responses")
+    parser.add_argument("--output", help="Also write JSON results to this file")
+    args = parser.parse_args(argv)
+    args.modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = [m for m in args.modes if m not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown modes: {', '.join(unknown)}")
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    results = run(args)
+    print(format_table(results))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
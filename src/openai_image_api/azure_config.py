@@ -6,31 +6,41 @@ Azure OpenAI 配置管理模块
 - 配置验证
 - 安全的凭证处理
 - 错误处理和日志记录
+- 带版本号的配置解析缓存：监视环境变量、.env 文件与端点池文件，变化时热重载
 
 遵循 Azure 最佳实践：
 - 使用环境变量存储敏感信息
 - 实施适当的错误处理
 - 提供详细的日志记录
 - 支持配置验证
+
+环境变量：
+- OPENAI_IMAGE_API_CONFIG_REFRESH: 检查配置来源是否变化的最小间隔（秒），0 表示每次调用都检查
 """
 
 import os
+import json
 import logging
-from typing import Optional, Dict, Any
-from dataclasses import dataclass
+import threading
+import time
+from typing import Optional, Dict, Any, List, Tuple
+from dataclasses import dataclass, replace
+
+from .client_pool import ClientPool
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
-@dataclass
+@dataclass(frozen=True)
 class AzureOpenAIConfig:
-    """Azure OpenAI 配置数据类"""
+    """Azure OpenAI 配置数据类（不可变，可在线程之间安全共享）"""
     endpoint: str
     api_key: str
     api_version: str
     deployment: str
     timeout: int = 60
     max_retries: int = 3
+    weight: float = 1.0
 
 class AzureConfigManager:
     """Azure OpenAI 配置管理器"""
@@ -62,6 +72,9 @@ class AzureConfigManager:
         "deployment": [
             "AZURE_OPENAI_DEPLOYMENT",
             "AZURE_DEPLOYMENT"
+        ],
+        "pool": [
+            "AZURE_OPENAI_POOL"
         ]
     }
     
@@ -150,6 +163,81 @@ class AzureConfigManager:
         logger.info(f"Created Azure OpenAI config - Endpoint: {config.endpoint}, API Version: {config.api_version}, Deployment: {config.deployment}")
         return config
     
+    @classmethod
+    def create_pool_configs(cls, pool: Optional[str] = None) -> List[AzureOpenAIConfig]:
+        """
+        创建多端点（多区域）Azure OpenAI 配置列表
+
+        池配置为 JSON 数组（或指向 JSON / YAML 文件的路径），每个元素包含
+        endpoint、api_key（或 api_key_env）、deployment，以及可选的 api_version、
+        timeout、max_retries、weight。缺省字段使用单端点配置的环境变量与默认值。
+
+        Args:
+            pool: 池配置，未提供时读取 AZURE_OPENAI_POOL 环境变量
+
+        Returns:
+            配置列表，未配置池时返回空列表
+
+        Raises:
+            ValueError: 当池配置无法解析或条目无效时
+        """
+        raw = pool or cls.get_env_value("pool")
+        if not raw:
+            return []
+
+        try:
+            if os.path.isfile(raw):
+                with open(raw, "r", encoding="utf-8") as f:
+                    if raw.lower().endswith((".yaml", ".yml")):
+                        entries = cls._load_yaml(f)
+                    else:
+                        entries = json.load(f)
+            else:
+                entries = json.loads(raw)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"Invalid Azure OpenAI pool configuration: {e}")
+
+        if not isinstance(entries, list) or not entries:
+            raise ValueError("Azure OpenAI pool configuration must be a non-empty JSON array")
+
+        configs = []
+        for i, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                raise ValueError(f"Azure OpenAI pool entry {i} must be a JSON object")
+            if not entry.get("endpoint"):
+                raise ValueError(f"Azure OpenAI pool entry {i}: endpoint is required")
+            api_key = entry.get("api_key") or (os.getenv(entry["api_key_env"]) if entry.get("api_key_env") else None)
+            try:
+                config = cls.create_config(
+                    endpoint=entry.get("endpoint"),
+                    api_key=api_key,
+                    api_version=entry.get("api_version"),
+                    deployment=entry.get("deployment"),
+                    timeout=entry.get("timeout"),
+                    max_retries=entry.get("max_retries")
+                )
+            except ValueError as e:
+                raise ValueError(f"Azure OpenAI pool entry {i}: {e}")
+            config = replace(config, weight=float(entry.get("weight", 1.0)))
+            if config.weight <= 0:
+                raise ValueError(f"Azure OpenAI pool entry {i}: weight must be greater than 0")
+            configs.append(config)
+
+        logger.info(f"Created Azure OpenAI pool with {len(configs)} endpoints")
+        return configs
+
+    @staticmethod
+    def _load_yaml(stream: Any) -> Any:
+        """解析 YAML 池文件（PyYAML 为可选依赖）"""
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("PyYAML is required for YAML pool files; install it or use a JSON file")
+        try:
+            return yaml.safe_load(stream)
+        except yaml.YAMLError as e:
+            raise ValueError(str(e))
+
     @classmethod
     def validate_config(cls, config: AzureOpenAIConfig) -> None:
         """
@@ -198,5 +286,204 @@ class AzureConfigManager:
             "api_version": config.api_version,
             "deployment": config.deployment,
             "timeout": config.timeout,
-            "max_retries": config.max_retries
+            "max_retries": config.max_retries,
+            "weight": config.weight
         }
+
+
+class AzureConfigResolver:
+    """
+    带版本号的 Azure OpenAI 配置解析缓存
+
+    配置来源（ENV_MAPPINGS 中的环境变量、.env 文件、AZURE_OPENAI_POOL 指向的池文件）
+    未变化时直接返回已验证的不可变配置；检测到变化时重新加载 .env、递增版本号、
+    清空缓存并淘汰连接池中的 Azure 客户端，使新的端点与密钥无需重启即可生效。
+    """
+
+    # 默认配置
+    DEFAULT_CONFIG = {
+        "refresh_interval": 2.0,
+    }
+
+    _instance: Optional["AzureConfigResolver"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, refresh_interval: Optional[float] = None, dotenv_path: Optional[str] = None):
+        """
+        Args:
+            refresh_interval: 检查配置来源的最小间隔（秒）
+            dotenv_path: .env 文件路径，未提供时按 python-dotenv 的规则向上查找
+        """
+        if refresh_interval is None:
+            refresh_interval = float(os.getenv("OPENAI_IMAGE_API_CONFIG_REFRESH") or self.DEFAULT_CONFIG["refresh_interval"])
+        self.refresh_interval = refresh_interval
+        self.dotenv_path = dotenv_path
+        self.version = 0
+        self._lock = threading.RLock()
+        self._fingerprint: Optional[tuple] = None
+        self._checked_at: Optional[float] = None
+        # 上次从 .env 写入环境的值，用于区分 .env 与进程本身设置的变量
+        self._dotenv_values: Dict[str, str] = {}
+        self._configs: Dict[Tuple[Optional[str], ...], AzureOpenAIConfig] = {}
+        self._pool: Optional[Tuple[int, List[AzureOpenAIConfig]]] = None
+
+    @classmethod
+    def get(cls) -> "AzureConfigResolver":
+        """获取进程共享的解析器实例"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def refresh(self, force: bool = False) -> int:
+        """
+        检查配置来源是否变化，变化时重新加载
+
+        Args:
+            force: 忽略检查间隔立即检查
+
+        Returns:
+            当前配置版本号
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._checked_at is not None and now - self._checked_at < self.refresh_interval:
+                return self.version
+            self._checked_at = now
+
+            dotenv_path = self._find_dotenv()
+            dotenv_stamp = self._stamp(dotenv_path)
+            if self._fingerprint is None or dotenv_stamp != self._fingerprint[0]:
+                self._apply_dotenv(dotenv_path)
+
+            pool = self._raw_env("pool")
+            fingerprint = (
+                dotenv_stamp,
+                tuple(self._raw_env(key) for key in AzureConfigManager.ENV_MAPPINGS),
+                self._stamp(pool) if pool and os.path.isfile(pool) else None,
+            )
+            if fingerprint == self._fingerprint:
+                return self.version
+
+            first = self._fingerprint is None
+            self._fingerprint = fingerprint
+            self.version += 1
+            self._configs = {}
+            if not first:
+                retired = ClientPool.invalidate(provider="azure")
+                logger.info(f"Azure OpenAI configuration changed (version {self.version}), "
+                            f"retired {retired} pooled client(s)")
+            return self.version
+
+    def resolve(self,
+                endpoint: Optional[str] = None,
+                api_key: Optional[str] = None,
+                api_version: Optional[str] = None,
+                deployment: Optional[str] = None) -> AzureOpenAIConfig:
+        """
+        解析并验证单端点配置，配置来源未变化时返回缓存的同一对象
+
+        Args:
+            endpoint: Azure OpenAI 端点（覆盖环境变量）
+            api_key: API 密钥（覆盖环境变量）
+            api_version: API 版本（覆盖环境变量）
+            deployment: 部署名称（覆盖环境变量）
+
+        Returns:
+            已验证的不可变配置
+
+        Raises:
+            ValueError: 当必需的配置缺失或无效时
+        """
+        args = tuple(value.strip() if value and value.strip() else None
+                     for value in (endpoint, api_key, api_version, deployment))
+        with self._lock:
+            self.refresh()
+            config = self._configs.get(args)
+            if config is not None:
+                logger.debug(f"Using cached Azure OpenAI config (version {self.version}): {config.endpoint}")
+                return config
+
+            config = AzureConfigManager.create_config(*args)
+            AzureConfigManager.validate_config(config)
+            self._configs[args] = config
+            logger.info(f"Using Azure OpenAI config (version {self.version}): "
+                        f"{AzureConfigManager.get_config_summary(config)}")
+            return config
+
+    def pool_configs(self) -> List[AzureOpenAIConfig]:
+        """
+        解析端点池配置
+
+        配置来源未变化（或变化后池内容相同）时返回同一个列表对象，
+        调用方可以据此判断是否需要重建负载均衡器。
+
+        Returns:
+            配置列表，未配置池时返回空列表
+
+        Raises:
+            ValueError: 当池配置无法解析或条目无效时
+        """
+        with self._lock:
+            version = self.refresh()
+            if self._pool is not None and self._pool[0] == version:
+                return self._pool[1]
+            configs = AzureConfigManager.create_pool_configs()
+            if self._pool is not None and self._pool[1] == configs:
+                configs = self._pool[1]
+            self._pool = (version, configs)
+            return configs
+
+    @staticmethod
+    def _raw_env(key: str) -> Optional[str]:
+        """与 AzureConfigManager.get_env_value 相同的查找规则（不输出调试日志）"""
+        for env_key in AzureConfigManager.ENV_MAPPINGS[key]:
+            value = os.getenv(env_key)
+            if value and value.strip():
+                return value.strip()
+        return None
+
+    @staticmethod
+    def _stamp(path: Optional[str]) -> Optional[tuple]:
+        """文件的修改时间与大小，文件不存在时返回 None"""
+        if not path:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (path, stat.st_mtime_ns, stat.st_size)
+
+    def _find_dotenv(self) -> Optional[str]:
+        """定位 .env 文件（python-dotenv 为可选依赖）"""
+        if self.dotenv_path is not None:
+            return self.dotenv_path
+        try:
+            from dotenv import find_dotenv
+        except ImportError:
+            return None
+        return find_dotenv() or None
+
+    def _apply_dotenv(self, path: Optional[str]) -> None:
+        """
+        将 .env 中的值写入环境（调用方需持有锁）
+
+        进程本身设置的变量优先；之前由 .env 写入的变量随文件更新或删除。
+        """
+        try:
+            from dotenv import dotenv_values
+        except ImportError:
+            return
+        values = {}
+        if path and os.path.isfile(path):
+            values = {name: value for name, value in dotenv_values(path).items() if value is not None}
+        for name, value in values.items():
+            current = os.environ.get(name)
+            if current is None or current == self._dotenv_values.get(name):
+                os.environ[name] = value
+        for name, previous in self._dotenv_values.items():
+            if name not in values and os.environ.get(name) == previous:
+                del os.environ[name]
+        if values or self._dotenv_values:
+            logger.debug(f"Loaded {len(values)} variable(s) from {path}")
+        self._dotenv_values = values
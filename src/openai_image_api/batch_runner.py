@@ -0,0 +1,368 @@
+"""
+离线批量任务运行器
+
+该模块提供了不经过 ComfyUI 队列的命令行批量生成/编辑，包括：
+- 读取 JSONL 或 CSV 提示文件（可选输入图像路径）
+- 有界工作线程池并发执行，复用节点的配置、连接池、重试与响应缓存
+- 每完成一个任务就追加写入 manifest.jsonl 并 fsync，崩溃后重新运行会跳过已完成的任务
+- 输入图像与节点使用相同的上传编码（缩小到输出分辨率、选择紧凑格式）
+- n 张图像在一次请求中生成
+- 图像原子写入输出目录
+
+输入格式（每条记录）：
+- JSONL: {"id": "sku-1", "prompt": "...", "images": ["a.png"], "size": "1024x1024", "quality": "high", "n": 2}
+- CSV: 表头包含 prompt，可选 id、images（多个路径用 ; 分隔）、size、quality、n
+
+用法：
+    python -m src.openai_image_api.batch_runner prompts.jsonl -o output/ --provider azure --workers 8
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from .image_request import ImageRequest
+from .nodes import OpenAIImageAPI
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchJob:
+    """一条批量任务"""
+    id: str
+    prompt: str
+    images: List[str] = field(default_factory=list)
+    size: Optional[str] = None
+    quality: Optional[str] = None
+    n: int = 1
+
+
+class BatchRunner:
+    """离线批量任务运行器"""
+
+    # 默认配置
+    DEFAULT_CONFIG = {
+        "workers": 4,
+        "manifest_name": "manifest.jsonl",
+        "image_separator": ";",
+    }
+
+    def __init__(self, output_dir: str, provider: str = "openai", model: str = "gpt-image-1",
+                 size: str = "1024x1024", quality: str = "high", workers: Optional[int] = None,
+                 api_key: Optional[str] = None, azure_endpoint: Optional[str] = None,
+                 azure_api_version: Optional[str] = None, azure_deployment: Optional[str] = None,
+                 use_cache: bool = True, budget_user: str = "", node: Optional[OpenAIImageAPI] = None):
+        """
+        Args:
+            output_dir: 图像与 manifest 的输出目录
+            provider: 服务提供商 (openai 或 azure)
+            model: 使用的模型
+            size: 默认图像尺寸（记录中可覆盖）
+            quality: 默认图像质量（记录中可覆盖）
+            workers: 最大并发任务数
+            api_key: API 密钥
+            azure_endpoint: Azure 端点
+            azure_api_version: Azure API 版本
+            azure_deployment: Azure 部署名称
+            use_cache: 是否读写响应缓存
+            budget_user: 用量核算与预算控制使用的用户或工作流标签
+            node: 用于执行请求的节点实例
+        """
+        self.output_dir = Path(output_dir)
+        self.provider = provider
+        self.model = model
+        self.size = size
+        self.quality = quality
+        self.workers = workers or self.DEFAULT_CONFIG["workers"]
+        self.client_args = (api_key, azure_endpoint, azure_api_version, azure_deployment)
+        self.use_cache = use_cache
+        self.budget_user = budget_user
+        self.node = node or OpenAIImageAPI()
+        self.manifest_path = self.output_dir / self.DEFAULT_CONFIG["manifest_name"]
+        self._manifest_lock = threading.Lock()
+
+    @classmethod
+    def read_jobs(cls, path: str) -> Iterator[BatchJob]:
+        """
+        读取 JSONL 或 CSV 任务文件
+
+        Args:
+            path: 任务文件路径（.csv 按 CSV 解析，其余按 JSONL 解析）
+
+        Returns:
+            任务迭代器
+
+        Raises:
+            ValueError: 记录缺少提示或格式错误
+        """
+        base_dir = Path(path).resolve().parent
+        with open(path, newline="", encoding="utf-8") as f:
+            if path.lower().endswith(".csv"):
+                rows = ((i, row) for i, row in enumerate(csv.DictReader(f), start=1))
+            else:
+                rows = ((i, cls._parse_json_line(line, i)) for i, line in enumerate(f, start=1) if line.strip())
+            for line_number, row in rows:
+                yield cls._make_job(row, line_number, base_dir)
+
+    def completed_jobs(self) -> Set[str]:
+        """读取 manifest 中已成功完成的任务 ID"""
+        done: Set[str] = set()
+        if not self.manifest_path.exists():
+            return done
+        with open(self.manifest_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 崩溃时可能留下半行，忽略即可（该任务会重新执行）
+                    continue
+                if entry.get("status") == "ok":
+                    done.add(entry["id"])
+        return done
+
+    def run(self, jobs: Iterator[BatchJob]) -> Dict[str, int]:
+        """
+        执行全部未完成的任务
+
+        Args:
+            jobs: 任务迭代器
+
+        Returns:
+            统计信息：ok、failed、skipped
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        done = self.completed_jobs()
+        client, model_name = self.node._resolve_client(self.provider, self.model, *self.client_args)
+        stats = {"ok": 0, "failed": 0, "skipped": 0}
+        pending: Set[Future] = set()
+        seen: Set[str] = set()
+
+        def collect(futures: Set[Future]) -> None:
+            for future in futures:
+                stats["ok" if future.result() else "failed"] += 1
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="openai-image-runner") as executor:
+            try:
+                for job in jobs:
+                    if job.id in seen:
+                        raise ValueError(f"Duplicate job id: {job.id}")
+                    seen.add(job.id)
+                    if job.id in done:
+                        stats["skipped"] += 1
+                        continue
+                    # 只保持有限数量的待执行任务，避免一次性读入整个任务文件
+                    if len(pending) >= self.workers * 2:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(finished)
+                    pending.add(executor.submit(self._run_job, client, model_name, job))
+                finished, pending = wait(pending)
+                collect(finished)
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+
+        logger.info(f"Batch run finished: {stats['ok']} ok, {stats['failed']} failed, {stats['skipped']} skipped")
+        return stats
+
+    def _run_job(self, client, model_name: str, job: BatchJob) -> bool:
+        """执行单个任务并写入 manifest，成功返回 True"""
+        started = time.monotonic()
+        entry = {"id": job.id, "prompt": job.prompt}
+        try:
+            size = job.size or self.size
+            request = ImageRequest(
+                provider=self.provider,
+                model=model_name,
+                prompt=job.prompt,
+                size=size,
+                quality=job.quality or self.quality,
+                images=self._encode_inputs(job.images, size),
+                n=job.n,
+                user=self.budget_user
+            )
+            png_images = self.node._fetch_images(client, request, use_cache=self.use_cache)
+            if len(png_images) < job.n:
+                raise RuntimeError(f"API returned {len(png_images)} of {job.n} requested images")
+            files = []
+            for i, data in enumerate(png_images[:job.n]):
+                name = f"{job.id}.png" if job.n == 1 else f"{job.id}_{i}.png"
+                self._write_file(self.output_dir / name, data)
+                files.append(name)
+            entry.update(status="ok", files=files)
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}")
+            entry.update(status="failed", error=str(e))
+        entry["seconds"] = round(time.monotonic() - started, 3)
+        self._append_manifest(entry)
+        return entry["status"] == "ok"
+
+    def _encode_inputs(self, paths: List[str], size: str) -> Optional[Tuple[Tuple[str, bytes], ...]]:
+        """
+        按节点的上传规则编码输入图像
+
+        每个文件单独解码（尺寸可以各不相同），再经过节点的 _prepare_upload：
+        缩小到刚好覆盖输出分辨率并选择紧凑格式，无需缩小的文件直接上传原始数据。
+
+        Args:
+            paths: 输入图像路径
+            size: 请求的输出尺寸
+
+        Returns:
+            图像名称和字节数据，无输入图像时返回 None
+        """
+        if not paths:
+            return None
+        from .image_utils import ImageProcessor
+
+        images = []
+        for i, path in enumerate(paths):
+            frame = ImageProcessor.decode_images([Path(path).read_bytes()])
+            ((name, data),) = self.node._prepare_upload(frame, size)[0]
+            images.append((f"image_{i}{Path(name).suffix}", data))
+        return tuple(images)
+
+    def _append_manifest(self, entry: dict) -> None:
+        """追加一条 manifest 记录并落盘"""
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._manifest_lock:
+            with open(self.manifest_path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    @staticmethod
+    def _write_file(path: Path, data: bytes) -> None:
+        """原子写入文件"""
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @staticmethod
+    def _parse_json_line(line: str, line_number: int) -> dict:
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON on line {line_number}: {e}")
+        if not isinstance(row, dict):
+            raise ValueError(f"Line {line_number} must be a JSON object")
+        return row
+
+    @classmethod
+    def _make_job(cls, row: dict, line_number: int, base_dir: Path) -> BatchJob:
+        """将一条记录转换为任务，相对图像路径以任务文件所在目录为基准"""
+        prompt = (row.get("prompt") or "").strip()
+        if not prompt:
+            raise ValueError(f"Record {line_number} has no prompt")
+
+        images = row.get("images") or row.get("image") or []
+        if isinstance(images, str):
+            images = [p.strip() for p in images.split(cls.DEFAULT_CONFIG["image_separator"]) if p.strip()]
+        paths = [str(p) if Path(p).is_absolute() else str(base_dir / p) for p in images]
+        for p in paths:
+            if not Path(p).is_file():
+                raise ValueError(f"Record {line_number}: input image not found: {p}")
+
+        raw_n = row.get("n") or 1
+        try:
+            n = int(raw_n)
+        except (TypeError, ValueError):
+            raise ValueError(f"Record {line_number}: n must be an integer, got {raw_n!r}") from None
+        max_n = OpenAIImageAPI.INPUT_TYPES()["optional"]["n"][1]["max"]
+        if not 1 <= n <= max_n:
+            raise ValueError(f"Record {line_number}: n must be between 1 and {max_n}")
+
+        size = row.get("size") or None
+        if size is not None and size not in OpenAIImageAPI.CONFIG["supported_sizes"]:
+            raise ValueError(f"Record {line_number}: unsupported size {size!r}, "
+                             f"expected one of {OpenAIImageAPI.CONFIG['supported_sizes']}")
+        quality = row.get("quality") or None
+        if quality is not None and quality not in OpenAIImageAPI.CONFIG["supported_qualities"]:
+            raise ValueError(f"Record {line_number}: unsupported quality {quality!r}, "
+                             f"expected one of {OpenAIImageAPI.CONFIG['supported_qualities']}")
+
+        return BatchJob(
+            id=str(row.get("id") or f"{line_number:06d}"),
+            prompt=prompt,
+            images=paths,
+            size=size,
+            quality=quality,
+            n=n
+        )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> Tuple[argparse.Namespace, argparse.ArgumentParser]:
+    parser = argparse.ArgumentParser(description="Generate or edit images in bulk from a JSONL/CSV prompt file")
+    parser.add_argument("input", help="JSONL or CSV file with one job per record")
+    parser.add_argument("-o", "--output-dir", required=True, help="Directory for images and manifest.jsonl")
+    parser.add_argument("--provider", choices=OpenAIImageAPI.CONFIG["supported_providers"], default="openai")
+    parser.add_argument("--model", default=OpenAIImageAPI.CONFIG["default_model"])
+    parser.add_argument("--size", choices=OpenAIImageAPI.CONFIG["supported_sizes"], default="1024x1024")
+    parser.add_argument("--quality", choices=OpenAIImageAPI.CONFIG["supported_qualities"], default="high")
+    parser.add_argument("--workers", type=int, default=BatchRunner.DEFAULT_CONFIG["workers"],
+                        help="Maximum number of jobs in flight")
+    parser.add_argument("--api-key", help="API key (default: from environment)")
+    parser.add_argument("--azure-endpoint", help="Azure OpenAI endpoint (default: from environment or pool)")
+    parser.add_argument("--azure-api-version", help="Azure OpenAI API version")
+    parser.add_argument("--azure-deployment", help="Azure OpenAI deployment name")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the response cache")
+    parser.add_argument("--budget-user", default="", help="User or workflow tag for usage accounting and budgets")
+    return parser.parse_args(argv), parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args, parser = parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    # 命令行入口自行配置日志，作为库导入时不修改宿主程序的日志设置
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    runner = BatchRunner(
+        output_dir=args.output_dir,
+        provider=args.provider,
+        model=args.model,
+        size=args.size,
+        quality=args.quality,
+        workers=args.workers,
+        api_key=args.api_key,
+        azure_endpoint=args.azure_endpoint,
+        azure_api_version=args.azure_api_version,
+        azure_deployment=args.azure_deployment,
+        use_cache=not args.no_cache,
+        budget_user=args.budget_user
+    )
+    try:
+        stats = runner.run(BatchRunner.read_jobs(args.input))
+    except KeyboardInterrupt:
+        logger.warning("Interrupted; completed jobs are recorded in the manifest and will be skipped on resume")
+        return 130
+    except (OSError, ValueError, RuntimeError) as e:
+        logger.error(f"Batch run failed: {e}")
+        return 1
+    print(json.dumps(stats))
+    return 0 if stats["failed"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,340 @@
+"""
+预算与配额控制模块
+
+该模块提供了图像 API 调用的成本核算与配额控制，包括：
+- 按尺寸与质量估算每次调用的 token 数与费用，响应返回 usage 时以实际用量修正
+- 在本地 SQLite 中按部署与用户（或工作流标签）记录用量，支持多进程共享
+- 发送前检查滚动窗口内的预算与 IPM/TPM 配额，超出时拒绝或等待
+
+环境变量：
+- OPENAI_IMAGE_API_BUDGET: 设为 0 时禁用用量记录与预算/配额检查
+- OPENAI_IMAGE_API_BUDGET_DB: SQLite 文件路径
+- OPENAI_IMAGE_API_BUDGET_USD_DAILY: 最近 24 小时的总费用上限（美元）
+- OPENAI_IMAGE_API_BUDGET_USER_USD_DAILY: 每个用户最近 24 小时的费用上限（美元）
+- OPENAI_IMAGE_API_IPM: 每个部署每分钟的图像数上限
+- OPENAI_IMAGE_API_TPM: 每个部署每分钟的 token 数上限
+- OPENAI_IMAGE_API_BUDGET_ACTION: 超出 IPM/TPM 时的处理方式，reject（默认）或 wait
+
+用法（查看用量汇总）：
+    python -m src.openai_image_api.budget --hours 24
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class BudgetExceededError(RuntimeError):
+    """请求超出预算或 IPM/TPM 配额而被拒绝"""
+
+
+@dataclass
+class Reservation:
+    """一次调用预占的用量记录"""
+    row_id: int
+    user: str
+    deployment: str
+    images: int
+    tokens: int
+    cost: float
+
+
+class BudgetGovernor:
+    """基于 SQLite 的预算与配额控制器"""
+
+    # 默认配置
+    DEFAULT_CONFIG = {
+        "db_path": os.path.join(os.path.expanduser("~"), ".cache", "comfy_openai_image_api", "budget.sqlite"),
+        "action": "reject",
+        "max_wait": 60.0,
+        "budget_window": 24 * 3600,
+        "quota_window": 60,
+        "retention_days": 90,
+        # 每百万 token 的价格（美元）
+        "text_input_price": 5.0,
+        "image_input_price": 10.0,
+        "image_output_price": 40.0,
+        # 输入图像的估算 token 数（实际值以响应 usage 为准）
+        "input_image_tokens": 765,
+    }
+
+    # gpt-image-1 每张输出图像的 token 数
+    OUTPUT_TOKENS = {
+        "low": {"1024x1024": 272, "1024x1536": 408, "1536x1024": 400},
+        "medium": {"1024x1024": 1056, "1024x1536": 1584, "1536x1024": 1568},
+        "high": {"1024x1024": 4160, "1024x1536": 6240, "1536x1024": 6208},
+    }
+
+    SUPPORTED_ACTIONS = ["reject", "wait"]
+
+    _instance: Optional["BudgetGovernor"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, db_path: Optional[str] = None, daily_budget: Optional[float] = None,
+                 user_daily_budget: Optional[float] = None, ipm: Optional[float] = None,
+                 tpm: Optional[float] = None, action: Optional[str] = None):
+        """
+        Args:
+            db_path: SQLite 文件路径
+            daily_budget: 最近 24 小时的总费用上限（美元）
+            user_daily_budget: 每个用户最近 24 小时的费用上限（美元）
+            ipm: 每个部署每分钟的图像数上限
+            tpm: 每个部署每分钟的 token 数上限
+            action: 超出 IPM/TPM 时 reject 或 wait
+        """
+        self.db_path = db_path or os.getenv("OPENAI_IMAGE_API_BUDGET_DB") or self.DEFAULT_CONFIG["db_path"]
+        self.daily_budget = daily_budget if daily_budget is not None else self._env_float("OPENAI_IMAGE_API_BUDGET_USD_DAILY")
+        self.user_daily_budget = (user_daily_budget if user_daily_budget is not None
+                                  else self._env_float("OPENAI_IMAGE_API_BUDGET_USER_USD_DAILY"))
+        self.ipm = ipm if ipm is not None else self._env_float("OPENAI_IMAGE_API_IPM")
+        self.tpm = tpm if tpm is not None else self._env_float("OPENAI_IMAGE_API_TPM")
+        self.action = action or os.getenv("OPENAI_IMAGE_API_BUDGET_ACTION") or self.DEFAULT_CONFIG["action"]
+        if self.action not in self.SUPPORTED_ACTIONS:
+            raise ValueError(f"Unsupported budget action: {self.action}. Supported: {', '.join(self.SUPPORTED_ACTIONS)}")
+        self._lock = threading.Lock()
+        self._initialize()
+
+    @classmethod
+    def get(cls) -> Optional["BudgetGovernor"]:
+        """获取进程共享的控制器实例，禁用时返回 None"""
+        if os.getenv("OPENAI_IMAGE_API_BUDGET", "1").strip().lower() in ("0", "false", "no", "off"):
+            return None
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @classmethod
+    def estimate(cls, size: str, quality: str, images: int = 1, prompt: str = "",
+                 input_images: int = 0) -> Tuple[int, float]:
+        """
+        估算一次调用的 token 数与费用
+
+        Args:
+            size: 图像尺寸
+            quality: 图像质量
+            images: 输出图像数量
+            prompt: 提示文本
+            input_images: 输入图像数量（编辑）
+
+        Returns:
+            (token 数, 费用美元)
+        """
+        by_size = cls.OUTPUT_TOKENS.get(quality, cls.OUTPUT_TOKENS["high"])
+        output_tokens = by_size.get(size, max(by_size.values())) * images
+        # 英文提示约 4 个字符一个 token
+        text_tokens = max(1, len(prompt) // 4)
+        image_tokens = input_images * cls.DEFAULT_CONFIG["input_image_tokens"]
+        return text_tokens + image_tokens + output_tokens, cls._price(text_tokens, image_tokens, output_tokens)
+
+    @classmethod
+    def usage_cost(cls, usage: Any) -> Optional[Tuple[int, float]]:
+        """
+        根据响应中的 usage 计算实际 token 数与费用
+
+        Args:
+            usage: 响应的 usage 对象或字典
+
+        Returns:
+            (token 数, 费用美元)，usage 不可用时返回 None
+        """
+        def field(obj: Any, name: str) -> Any:
+            return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+        if usage is None:
+            return None
+        output_tokens = field(usage, "output_tokens")
+        input_tokens = field(usage, "input_tokens")
+        if output_tokens is None or input_tokens is None:
+            return None
+        details = field(usage, "input_tokens_details")
+        image_tokens = (field(details, "image_tokens") or 0) if details is not None else 0
+        text_tokens = input_tokens - image_tokens
+        return input_tokens + output_tokens, cls._price(text_tokens, image_tokens, output_tokens)
+
+    def reserve(self, user: str, deployment: str, size: str, quality: str, images: int = 1,
+                prompt: str = "", input_images: int = 0) -> Reservation:
+        """
+        检查预算与配额并预占本次调用的估算用量
+
+        调用成功后用 commit 以实际用量替换估算值，失败时用 release 撤销。
+
+        Args:
+            user: 用户或工作流标签
+            deployment: 部署（或模型）名称
+            size: 图像尺寸
+            quality: 图像质量
+            images: 输出图像数量
+            prompt: 提示文本
+            input_images: 输入图像数量
+
+        Returns:
+            预占记录
+
+        Raises:
+            BudgetExceededError: 超出预算，或超出 IPM/TPM 且无法在等待上限内恢复
+            sqlite3.Error: 用量数据库不可用（例如多进程锁等待超时或磁盘已满）
+        """
+        tokens, cost = self.estimate(size, quality, images, prompt, input_images)
+        deadline = time.monotonic() + self.DEFAULT_CONFIG["max_wait"]
+        while True:
+            with self._lock, closing(self._connect()) as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                violation, retry_in = self._check(conn, user, deployment, images, tokens, cost)
+                if violation is None:
+                    cursor = conn.execute(
+                        "INSERT INTO usage (ts, user, deployment, images, tokens, cost, estimated) VALUES (?, ?, ?, ?, ?, ?, 1)",
+                        (time.time(), user, deployment, images, tokens, cost)
+                    )
+                    conn.execute("COMMIT")
+                    return Reservation(cursor.lastrowid, user, deployment, images, tokens, cost)
+                conn.execute("ROLLBACK")
+
+            can_wait = retry_in is not None and self.action == "wait" and time.monotonic() + retry_in <= deadline
+            if not can_wait:
+                logger.warning(f"Rejected image request for user '{user}' on {deployment}: {violation}")
+                raise BudgetExceededError(f"Image request rejected by budget governor: {violation}")
+            logger.info(f"Throttling image request on {deployment} for {retry_in:.1f}s: {violation}")
+            time.sleep(retry_in)
+
+    def commit(self, reservation: Reservation, usage: Any = None) -> float:
+        """
+        确认调用完成，有 usage 时以实际用量替换估算值
+
+        Args:
+            reservation: reserve 返回的预占记录
+            usage: 响应的 usage
+
+        Returns:
+            记录的费用（美元）
+        """
+        actual = self.usage_cost(usage)
+        tokens, cost = actual if actual is not None else (reservation.tokens, reservation.cost)
+        with self._lock, closing(self._connect()) as conn:
+            conn.execute("UPDATE usage SET tokens = ?, cost = ?, estimated = ? WHERE id = ?",
+                         (tokens, cost, 0 if actual is not None else 1, reservation.row_id))
+        return cost
+
+    def release(self, reservation: Reservation) -> None:
+        """撤销失败调用的预占记录"""
+        with self._lock, closing(self._connect()) as conn:
+            conn.execute("DELETE FROM usage WHERE id = ?", (reservation.row_id,))
+
+    def summary(self, hours: float = 24) -> List[Dict[str, Any]]:
+        """
+        按用户与部署汇总最近的用量
+
+        Args:
+            hours: 统计窗口（小时）
+
+        Returns:
+            汇总行列表（费用从高到低）
+        """
+        with self._lock, closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT user, deployment, COUNT(*), SUM(images), SUM(tokens), SUM(cost) FROM usage "
+                "WHERE ts > ? GROUP BY user, deployment ORDER BY SUM(cost) DESC",
+                (time.time() - hours * 3600,)
+            ).fetchall()
+        return [
+            {"user": user, "deployment": deployment, "calls": calls, "images": images,
+             "tokens": tokens, "cost_usd": round(cost, 4)}
+            for user, deployment, calls, images, tokens, cost in rows
+        ]
+
+    def _check(self, conn: sqlite3.Connection, user: str, deployment: str, images: int, tokens: int,
+               cost: float) -> Tuple[Optional[str], Optional[float]]:
+        """
+        检查各项限制（调用方需持有写事务）
+
+        Returns:
+            (违反的限制描述或 None, 配额恢复前需等待的秒数；预算类限制为 None)
+        """
+        now = time.time()
+        budget_since = now - self.DEFAULT_CONFIG["budget_window"]
+        if self.daily_budget is not None:
+            (spent,) = conn.execute("SELECT COALESCE(SUM(cost), 0) FROM usage WHERE ts > ?", (budget_since,)).fetchone()
+            if spent + cost > self.daily_budget:
+                return f"daily budget ${self.daily_budget:.2f} would be exceeded (spent ${spent:.2f})", None
+        if self.user_daily_budget is not None:
+            (spent,) = conn.execute("SELECT COALESCE(SUM(cost), 0) FROM usage WHERE ts > ? AND user = ?",
+                                    (budget_since, user)).fetchone()
+            if spent + cost > self.user_daily_budget:
+                return (f"daily budget ${self.user_daily_budget:.2f} for user '{user}' would be exceeded "
+                        f"(spent ${spent:.2f})"), None
+
+        window = self.DEFAULT_CONFIG["quota_window"]
+        for limit, column, amount, unit in ((self.ipm, "images", images, "IPM"), (self.tpm, "tokens", tokens, "TPM")):
+            if limit is None:
+                continue
+            used, oldest = conn.execute(
+                f"SELECT COALESCE(SUM({column}), 0), MIN(ts) FROM usage WHERE ts > ? AND deployment = ?",
+                (now - window, deployment)
+            ).fetchone()
+            if used + amount > limit:
+                if amount > limit:
+                    return f"{unit} limit {limit:g} is smaller than a single request ({amount})", None
+                return f"{unit} limit {limit:g} reached on {deployment}", max(0.05, oldest + window - now)
+        return None, None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _initialize(self) -> None:
+        """创建表结构并清理过期记录"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        with self._lock, closing(self._connect()) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY, ts REAL NOT NULL, user TEXT NOT NULL, "
+                "deployment TEXT NOT NULL, images INTEGER NOT NULL, tokens INTEGER NOT NULL, cost REAL NOT NULL, "
+                "estimated INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS usage_ts ON usage (ts)")
+            conn.execute("DELETE FROM usage WHERE ts < ?", (time.time() - self.DEFAULT_CONFIG["retention_days"] * 86400,))
+
+    @classmethod
+    def _price(cls, text_tokens: int, image_tokens: int, output_tokens: int) -> float:
+        config = cls.DEFAULT_CONFIG
+        return (text_tokens * config["text_input_price"] + image_tokens * config["image_input_price"]
+                + output_tokens * config["image_output_price"]) / 1_000_000
+
+    @staticmethod
+    def _env_float(name: str) -> Optional[float]:
+        value = os.getenv(name)
+        if not value or not value.strip():
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError(f"{name} must be a number, got: {value}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Show image API usage by user and deployment")
+    parser.add_argument("--hours", type=float, default=24, help="Window to summarize (default: 24)")
+    parser.add_argument("--db", help="SQLite file (default: OPENAI_IMAGE_API_BUDGET_DB or the cache directory)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    for row in BudgetGovernor(db_path=args.db).summary(args.hours):
+        print(json.dumps(row))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
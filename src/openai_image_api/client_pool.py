@@ -0,0 +1,209 @@
+"""
+客户端连接池模块
+
+该模块提供了进程级的 OpenAI / Azure OpenAI 客户端注册表，包括：
+- 按 (provider, endpoint, api_version, 密钥指纹, timeout) 复用客户端
+- 保持 HTTP keep-alive 连接池常驻，避免每次调用重新握手
+- 空闲客户端自动回收
+- 配置变更时安全地淘汰旧客户端
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class ClientKey(NamedTuple):
+    """客户端注册表键"""
+    provider: str
+    endpoint: str
+    api_version: str
+    key_fingerprint: str
+    timeout: float
+
+    @property
+    def slot(self) -> tuple:
+        """同一 provider/endpoint/密钥只保留一个当前客户端"""
+        return (self.provider, self.endpoint, self.key_fingerprint)
+
+
+@dataclass
+class _PooledClient:
+    """注册表中的客户端条目"""
+    client: Any
+    closer: Optional[Callable[[Any], None]] = None
+    created_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class ClientPool:
+    """进程级客户端注册表"""
+
+    # 默认配置
+    DEFAULT_CONFIG = {
+        "idle_timeout": 600,
+        "retire_grace": 120,
+    }
+
+    _clients: Dict[ClientKey, _PooledClient] = {}
+    _retired: List[_PooledClient] = []
+    _lock = threading.RLock()
+
+    @staticmethod
+    def fingerprint(api_key: str) -> str:
+        """
+        计算 API 密钥指纹，注册表中不保存明文密钥
+
+        Args:
+            api_key: API 密钥
+
+        Returns:
+            密钥的 SHA-256 摘要前 16 位
+        """
+        return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def make_key(cls,
+                 provider: str,
+                 api_key: str,
+                 endpoint: Optional[str] = None,
+                 api_version: Optional[str] = None,
+                 timeout: Optional[float] = None) -> ClientKey:
+        """
+        构造注册表键
+
+        Args:
+            provider: 服务提供商 (openai 或 azure)
+            api_key: API 密钥
+            endpoint: 服务端点
+            api_version: API 版本
+            timeout: 请求超时时间
+
+        Returns:
+            ClientKey 对象
+        """
+        return ClientKey(
+            provider=provider,
+            endpoint=(endpoint or "").rstrip("/"),
+            api_version=api_version or "",
+            key_fingerprint=cls.fingerprint(api_key),
+            timeout=float(timeout or 0),
+        )
+
+    @classmethod
+    def get_client(cls, key: ClientKey, factory: Callable[[], Any],
+                   closer: Optional[Callable[[Any], None]] = None) -> Any:
+        """
+        获取（或创建）与键对应的客户端
+
+        当同一 provider/endpoint/密钥出现新的键（例如 API 版本或超时变更）时，
+        旧客户端会被移入淘汰列表，在宽限期后关闭，正在进行的请求不受影响。
+
+        Args:
+            key: 注册表键
+            factory: 缓存未命中时用于创建客户端的工厂函数
+            closer: 可选的关闭函数（例如异步客户端需要在其事件循环中关闭）
+
+        Returns:
+            可复用的客户端
+        """
+        with cls._lock:
+            cls._sweep()
+
+            entry = cls._clients.get(key)
+            if entry is not None:
+                entry.last_used = time.monotonic()
+                logger.debug(f"Reusing pooled client for {key.provider} endpoint: {key.endpoint or 'default'}")
+                return entry.client
+
+            for stale_key in [k for k in cls._clients if k.slot == key.slot]:
+                logger.info(f"Configuration changed for {stale_key.provider} endpoint: "
+                            f"{stale_key.endpoint or 'default'}, retiring pooled client")
+                cls._retire(stale_key)
+
+            client = factory()
+            cls._clients[key] = _PooledClient(client=client, closer=closer)
+            logger.info(f"Pooled new {key.provider} client ({len(cls._clients)} active)")
+            return client
+
+    @classmethod
+    def invalidate(cls, provider: Optional[str] = None, endpoint: Optional[str] = None) -> int:
+        """
+        使匹配的客户端失效
+
+        Args:
+            provider: 仅匹配该 provider，None 表示全部
+            endpoint: 仅匹配该端点，None 表示全部
+
+        Returns:
+            被淘汰的客户端数量
+        """
+        normalized = endpoint.rstrip("/") if endpoint is not None else None
+        with cls._lock:
+            matched = [
+                k for k in cls._clients
+                if (provider is None or k.provider == provider)
+                and (normalized is None or k.endpoint == normalized)
+            ]
+            for key in matched:
+                cls._retire(key)
+            return len(matched)
+
+    @classmethod
+    def clear(cls) -> None:
+        """立即关闭所有客户端"""
+        with cls._lock:
+            entries = list(cls._clients.values()) + cls._retired
+            cls._clients = {}
+            cls._retired = []
+        for entry in entries:
+            cls._close(entry)
+
+    @classmethod
+    def size(cls) -> int:
+        """当前活跃客户端数量"""
+        with cls._lock:
+            return len(cls._clients)
+
+    @classmethod
+    def _retire(cls, key: ClientKey) -> None:
+        """将客户端移入淘汰列表（调用方需持有锁）"""
+        entry = cls._clients.pop(key)
+        entry.last_used = time.monotonic()
+        cls._retired.append(entry)
+
+    @classmethod
+    def _sweep(cls) -> None:
+        """回收空闲客户端并关闭宽限期已过的淘汰客户端（调用方需持有锁）"""
+        now = time.monotonic()
+        idle_timeout = cls.DEFAULT_CONFIG["idle_timeout"]
+        for key in [k for k, e in cls._clients.items() if now - e.last_used > idle_timeout]:
+            logger.debug(f"Evicting idle {key.provider} client for endpoint: {key.endpoint or 'default'}")
+            cls._retire(key)
+
+        grace = cls.DEFAULT_CONFIG["retire_grace"]
+        expired = [e for e in cls._retired if now - e.last_used > grace]
+        if expired:
+            cls._retired = [e for e in cls._retired if now - e.last_used <= grace]
+            for entry in expired:
+                cls._close(entry)
+
+    @staticmethod
+    def _close(entry: _PooledClient) -> None:
+        """关闭客户端底层连接池"""
+        close = getattr(entry.client, "close", None)
+        if entry.closer is None and close is None:
+            return
+        try:
+            if entry.closer is not None:
+                entry.closer(entry.client)
+            else:
+                close()
+        except Exception as e:
+            logger.warning(f"Failed to close pooled client: {e}")
@@ -0,0 +1,156 @@
+"""
+自适应并发模块
+
+该模块提供了按端点/部署调整并发上限的 AIMD 控制器，包括：
+- 通道饱和且延迟正常时加性增加（每轮约 +1）
+- 限流、服务端错误或超时时乘性减少，延迟明显高于同类请求的平均水平时小幅减少
+  （按请求成本类别分别统计延迟，质量、尺寸、图像数量或流式的差异不会被误判为过载）
+- 同一轮内多个失败只减少一次（只响应上次调整之后发出的请求）
+- 上限变化写入日志、历史记录与指标（concurrency_limit、concurrency_adjustments_total）
+
+环境变量：
+- OPENAI_IMAGE_API_CONCURRENCY_INITIAL: 初始并发上限
+- OPENAI_IMAGE_API_CONCURRENCY_MIN: 最小并发上限
+- OPENAI_IMAGE_API_CONCURRENCY_MAX: 最大并发上限
+- OPENAI_IMAGE_API_ADAPTIVE_CONCURRENCY: 设为 0 时固定使用最大并发上限
+"""
+
+import logging
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Hashable, List, Optional, Tuple
+
+from .metrics import Metrics
+from .retry import ErrorKind
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveLimit:
+    """单个端点/部署的 AIMD 并发上限（只在引擎事件循环线程中使用）"""
+
+    # 默认配置
+    DEFAULT_CONFIG = {
+        "initial": 4,
+        "min": 1,
+        "max": 16,
+        # 错误时的乘性减少系数
+        "backoff": 0.5,
+        # 延迟膨胀时的乘性减少系数
+        "latency_backoff": 0.9,
+        # 延迟超过平均值的倍数视为膨胀
+        "latency_tolerance": 2.0,
+        "latency_alpha": 0.2,
+        "latency_warmup": 5,
+        "history": 100,
+    }
+
+    OVERLOAD = frozenset({ErrorKind.RATE_LIMIT, ErrorKind.SERVER, ErrorKind.TIMEOUT})
+
+    def __init__(self, name: str, initial: Optional[int] = None, minimum: Optional[int] = None,
+                 maximum: Optional[int] = None, adaptive: Optional[bool] = None):
+        """
+        Args:
+            name: 通道名称（端点/部署），用于日志与指标标签
+            initial: 初始并发上限
+            minimum: 最小并发上限
+            maximum: 最大并发上限
+            adaptive: 是否根据结果调整，关闭时固定为最大上限
+        """
+        config = self.DEFAULT_CONFIG
+        self.name = name
+        self.minimum = max(1, minimum or int(os.getenv("OPENAI_IMAGE_API_CONCURRENCY_MIN") or config["min"]))
+        self.maximum = max(self.minimum, maximum or int(os.getenv("OPENAI_IMAGE_API_CONCURRENCY_MAX") or config["max"]))
+        if adaptive is None:
+            setting = os.getenv("OPENAI_IMAGE_API_ADAPTIVE_CONCURRENCY", "1").strip().lower()
+            adaptive = setting not in ("0", "false", "no", "off")
+        self.adaptive = adaptive
+        if not adaptive:
+            initial = self.maximum
+        initial = initial or int(os.getenv("OPENAI_IMAGE_API_CONCURRENCY_INITIAL") or config["initial"])
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.in_flight = 0
+        self.history: Deque[Tuple[float, int, str]] = deque(maxlen=config["history"])
+        # 每个请求成本类别的延迟 EWMA 与样本数
+        self._latency: Dict[Hashable, float] = {}
+        self._samples: Dict[Hashable, int] = {}
+        self._last_decrease = 0.0
+        self._record("initial")
+
+    @property
+    def current(self) -> int:
+        """当前允许的并发请求数"""
+        return int(self.limit)
+
+    def acquire(self) -> None:
+        """占用一个并发名额"""
+        self.in_flight += 1
+
+    def release(self) -> None:
+        """释放一个并发名额"""
+        self.in_flight -= 1
+
+    def on_success(self, latency: float, started: float, cost_class: Hashable = None) -> None:
+        """
+        记录一次成功的尝试
+
+        Args:
+            latency: 本次尝试耗时（秒）
+            started: 本次尝试开始时间（time.monotonic）
+            cost_class: 请求成本类别（例如质量、尺寸、图像数量、是否流式），
+                只与同类请求的平均延迟比较
+        """
+        if not self.adaptive:
+            return
+        config = self.DEFAULT_CONFIG
+        average = self._latency.get(cost_class)
+        samples = self._samples.get(cost_class, 0)
+        inflated = samples >= config["latency_warmup"] and latency > average * config["latency_tolerance"]
+        self._latency[cost_class] = latency if average is None else \
+            average + config["latency_alpha"] * (latency - average)
+        self._samples[cost_class] = samples + 1
+
+        if inflated:
+            self._decrease(config["latency_backoff"], started, "latency")
+        elif self.in_flight >= self.current and self.limit < self.maximum:
+            # 只有名额被用满时才说明更高的并发有意义
+            self._update(min(self.maximum, self.limit + 1 / self.limit), "increase")
+
+    def on_failure(self, kind: str, started: float) -> None:
+        """
+        记录一次失败的尝试
+
+        Args:
+            kind: 错误类别（ErrorKind）
+            started: 本次尝试开始时间（time.monotonic）
+        """
+        if self.adaptive and kind in self.OVERLOAD:
+            self._decrease(self.DEFAULT_CONFIG["backoff"], started, kind)
+
+    def recent(self) -> List[Tuple[float, int, str]]:
+        """最近的上限变化 (时间戳, 上限, 原因)"""
+        return list(self.history)
+
+    def _decrease(self, factor: float, started: float, reason: str) -> None:
+        """乘性减少；上次减少之前发出的请求已按旧上限发送，不再重复减少"""
+        if started < self._last_decrease:
+            return
+        self._last_decrease = time.monotonic()
+        self._update(max(self.minimum, self.limit * factor), reason)
+
+    def _update(self, limit: float, reason: str) -> None:
+        previous = self.current
+        self.limit = limit
+        if self.current != previous:
+            logger.info(f"Concurrency limit for {self.name}: {previous} -> {self.current} ({reason}, "
+                        f"{self.in_flight} in flight)")
+            self._record(reason)
+
+    def _record(self, reason: str) -> None:
+        self.history.append((time.time(), self.current, reason))
+        metrics = Metrics.get()
+        metrics.set("concurrency_limit", self.current, lane=self.name)
+        if reason != "initial":
+            metrics.inc("concurrency_adjustments_total", lane=self.name, reason=reason)
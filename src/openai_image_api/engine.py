@@ -0,0 +1,195 @@
+"""
+异步请求引擎模块
+
+该模块提供了基于 asyncio 的图像 API 请求调度，包括：
+- 进程共享的后台事件循环
+- 每个端点/部署独立的自适应并发上限（AIMD，见 concurrency 模块）
+- 基于优先级队列的请求调度
+- 面向 ComfyUI 同步节点的阻塞式外观接口
+
+多个节点（以及多个工作流）的请求在同一个事件循环中复用连接并发执行，
+ComfyUI 工作线程只在等待自身结果时阻塞。
+"""
+
+import asyncio
+import itertools
+import logging
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .concurrency import AdaptiveLimit
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+@dataclass(order=True)
+class _Job:
+    """排队中的请求"""
+    sort_key: tuple
+    call: Callable[[], Awaitable[Any]] = field(compare=False)
+    future: "asyncio.Future[Any]" = field(compare=False)
+
+
+@dataclass
+class _Lane:
+    """单个端点的调度通道"""
+    queue: "asyncio.PriorityQueue[_Job]"
+    limit: AdaptiveLimit
+    # 名额释放或上限提高时唤醒调度协程
+    wakeup: asyncio.Event = field(default_factory=asyncio.Event)
+    dispatcher: Optional["asyncio.Task[None]"] = None
+
+
+class ImageRequestEngine:
+    """基于 asyncio 的图像请求引擎"""
+
+    # 默认配置（每个通道的并发上限在 AdaptiveLimit 的最小值与最大值之间自动调整）
+    DEFAULT_CONFIG = {
+        "max_concurrency_per_endpoint": None,
+    }
+
+    _instance: Optional["ImageRequestEngine"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_concurrency_per_endpoint: Optional[int] = None):
+        self.max_concurrency = max_concurrency_per_endpoint or self.DEFAULT_CONFIG["max_concurrency_per_endpoint"]
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lanes: Dict[str, _Lane] = {}
+        self._sequence = itertools.count()
+        self._start_lock = threading.Lock()
+
+    @classmethod
+    def get(cls) -> "ImageRequestEngine":
+        """获取进程共享的引擎实例"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """后台事件循环（首次访问时启动）"""
+        with self._start_lock:
+            if self._loop is None or self._loop.is_closed():
+                ready = threading.Event()
+                self._loop = asyncio.new_event_loop()
+
+                def run() -> None:
+                    asyncio.set_event_loop(self._loop)
+                    self._loop.call_soon(ready.set)
+                    self._loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name="openai-image-engine", daemon=True)
+                self._thread.start()
+                ready.wait()
+                logger.info("Started image request engine event loop")
+            return self._loop
+
+    def submit(self, lane: str, call: Callable[[], Awaitable[Any]], priority: int = 0) -> "Future[Any]":
+        """
+        提交请求，立即返回可在任意线程等待的 Future
+
+        Args:
+            lane: 调度通道（通常为端点/部署），每个通道有独立的自适应并发上限
+            call: 返回协程的可调用对象，在事件循环中执行
+            priority: 优先级，数值越大越先执行
+
+        Returns:
+            concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(self._enqueue(lane, call, priority), self.loop)
+
+    def run(self, lane: str, call: Callable[[], Awaitable[Any]], priority: int = 0) -> Any:
+        """
+        同步外观接口：提交请求并阻塞等待结果
+
+        Args:
+            lane: 调度通道
+            call: 返回协程的可调用对象
+            priority: 优先级，数值越大越先执行
+
+        Returns:
+            协程的返回值
+        """
+        return self.submit(lane, call, priority).result()
+
+    def run_in_loop(self, coro: Awaitable[Any]) -> "Future[Any]":
+        """在引擎事件循环中执行任意协程（不经过调度）"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """各通道的排队与执行中请求数及当前并发上限"""
+        return {
+            name: {"queued": lane.queue.qsize(), "in_flight": lane.limit.in_flight, "limit": lane.limit.current}
+            for name, lane in list(self._lanes.items())
+        }
+
+    def limit(self, lane: str) -> AdaptiveLimit:
+        """
+        通道的并发控制器（仅在事件循环线程中调用，例如请求协程内部）
+
+        请求在每次尝试后通过它报告延迟、限流与服务端错误。
+
+        Args:
+            lane: 调度通道
+
+        Returns:
+            通道的 AdaptiveLimit
+        """
+        return self._get_lane(lane).limit
+
+    def _get_lane(self, name: str) -> _Lane:
+        """获取或创建调度通道（仅在事件循环线程中调用）"""
+        lane = self._lanes.get(name)
+        if lane is None:
+            lane = _Lane(queue=asyncio.PriorityQueue(), limit=AdaptiveLimit(name, maximum=self.max_concurrency))
+            lane.dispatcher = asyncio.ensure_future(self._dispatch(lane))
+            self._lanes[name] = lane
+            logger.debug(f"Created engine lane for {name} ({lane.limit.current} in flight, "
+                         f"adaptive between {lane.limit.minimum} and {lane.limit.maximum})")
+        return lane
+
+    async def _enqueue(self, lane_name: str, call: Callable[[], Awaitable[Any]], priority: int) -> Any:
+        """将请求放入通道队列并等待其完成"""
+        lane = self._get_lane(lane_name)
+        future = asyncio.get_running_loop().create_future()
+        await lane.queue.put(_Job(sort_key=(-priority, next(self._sequence)), call=call, future=future))
+        return await future
+
+    async def _dispatch(self, lane: _Lane) -> None:
+        """在并发上限允许时按优先级取出请求并启动执行"""
+        while True:
+            # 先等到有空闲名额再出队，确保等待期间到达的高优先级请求可以插队
+            while lane.limit.in_flight >= lane.limit.current:
+                lane.wakeup.clear()
+                await lane.wakeup.wait()
+            job = await lane.queue.get()
+            if job.future.done():
+                continue
+            lane.limit.acquire()
+            task = asyncio.ensure_future(self._execute(job))
+
+            def release(_: "asyncio.Task[None]", lane: _Lane = lane) -> None:
+                lane.limit.release()
+                lane.wakeup.set()
+
+            task.add_done_callback(release)
+
+    @staticmethod
+    async def _execute(job: _Job) -> None:
+        """执行请求并回填结果"""
+        try:
+            result = await job.call()
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
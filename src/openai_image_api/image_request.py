@@ -0,0 +1,59 @@
+"""
+图像请求描述模块
+
+该模块定义了一次图像生成/编辑调用的规范化描述，包括：
+- 调用参数（provider、模型/部署、提示、尺寸、质量、每次调用返回的图像数量）
+- 已编码的输入图像与可选的重绘蒙版
+- 基于内容的请求哈希，用于缓存等按请求去重的场景
+"""
+
+import hashlib
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+
+@dataclass(frozen=True)
+class ImageRequest:
+    """一次图像 API 调用的规范化描述"""
+    provider: str
+    model: str
+    prompt: str
+    size: str
+    quality: str
+    images: Optional[Tuple[Tuple[str, bytes], ...]] = None
+    variant: int = 0
+    mask: Optional[Tuple[str, bytes]] = None
+    # 一次调用返回的图像数量
+    n: int = 1
+    # 用量核算的用户或工作流标签，不影响请求内容，不参与请求哈希
+    user: str = ""
+
+    @property
+    def operation(self) -> str:
+        """操作类型：generation 或 editing"""
+        return "editing" if self.images else "generation"
+
+    @property
+    def cache_key(self) -> str:
+        """
+        请求内容哈希
+
+        相同的 provider、模型、提示、尺寸、质量、输入图像与蒙版字节、图像数量、变体序号得到相同的键；
+        variant 用于区分同一批次中有意重复的请求。
+        """
+        digest = hashlib.sha256()
+        for part in (self.provider, self.model, self.prompt, self.size, self.quality, str(self.variant)):
+            encoded = part.encode("utf-8")
+            digest.update(len(encoded).to_bytes(8, "big"))
+            digest.update(encoded)
+        for name, data in self.images or ():
+            digest.update(len(data).to_bytes(8, "big"))
+            digest.update(hashlib.sha256(data).digest())
+        if self.mask is not None:
+            digest.update(b"mask")
+            digest.update(hashlib.sha256(self.mask[1]).digest())
+        if self.n != 1:
+            # 只在多图请求时参与哈希，已有的单图缓存条目保持有效
+            digest.update(b"n")
+            digest.update(self.n.to_bytes(8, "big"))
+        return digest.hexdigest()
@@ -5,6 +5,7 @@
 - 图像格式转换
 - 张量和 PIL 图像之间的转换
 - 图像数据验证
+- 解码结果附带原始编码数据，未修改的结果再次上传时直接复用
 - 错误处理和日志记录
 
 遵循 Azure 最佳实践：
@@ -15,9 +16,14 @@
 """
 
 import io
+import os
 import base64
 import logging
-from typing import List, Tuple, Optional, Union
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Optional, Union
 import numpy as np
 import torch
 from PIL import Image
@@ -25,6 +31,17 @@ from PIL import Image
 # 配置日志
 logger = logging.getLogger(__name__)
 
+
+@dataclass(frozen=True)
+class EncodedFrames:
+    """解码张量对应的原始编码数据"""
+    frames: Tuple[bytes, ...]
+    # 帧尺寸 (width, height)
+    size: Tuple[int, int]
+    # 附加时张量的 _version，原地修改后版本号变化，编码数据随之失效
+    version: int
+
+
 class ImageProcessor:
     """图像处理工具类"""
     
@@ -36,8 +53,20 @@ class ImageProcessor:
         "image_format": "PNG",
         "image_quality": 95,
         "max_image_size": (2048, 2048),
-        "min_image_size": (64, 64)
+        "min_image_size": (64, 64),
+        "png_compress_level": 6,
+        "max_encode_workers": 8,
+        "max_upload_bytes": 50 * 1024 * 1024,
+        "min_upload_quality": 65
     }
+
+    # 上传格式对应的文件扩展名（SDK 根据文件名推断 Content-Type）
+    UPLOAD_EXTENSIONS = {"PNG": "png", "JPEG": "jpg", "WEBP": "webp"}
+
+    # 张量 id -> (弱引用, 原始编码数据)；ComfyUI 的 IMAGE 只能传递 float32 张量，
+    # 因此编码数据挂在张量之外，张量被回收时自动移除
+    _encoded: Dict[int, Tuple["weakref.ref[torch.Tensor]", EncodedFrames]] = {}
+    _encoded_lock = threading.Lock()
     
     @classmethod
     def tensor_to_pil(cls, tensor: torch.Tensor) -> Image.Image:
@@ -119,14 +148,9 @@ class ImageProcessor:
             if pil_image.mode != 'RGB':
                 pil_image = pil_image.convert('RGB')
             
-            # 转换为 numpy 数组
-            img_np = np.array(pil_image).astype(np.float32) / 255.0
-            
-            # 添加批次维度
-            img_np = np.expand_dims(img_np, axis=0)
-            
-            # 转换为 torch 张量
-            tensor = torch.from_numpy(img_np)
+            # 直接写入预分配的 float32 张量（带批次维度），一次完成 uint8 -> float 转换
+            tensor = torch.empty((1, pil_image.height, pil_image.width, 3), dtype=torch.float32)
+            cls._write_normalized(pil_image, tensor[0])
             
             logger.debug(f"Converted PIL image to tensor: {tensor.shape}")
             return tensor
@@ -135,6 +159,18 @@ class ImageProcessor:
             logger.error(f"Error converting PIL image to tensor: {e}")
             raise ValueError(f"Error converting PIL image to tensor: {e}")
     
+    @staticmethod
+    def _write_normalized(pil_image: Image.Image, out: torch.Tensor) -> None:
+        """
+        将 RGB PIL 图像的像素归一化后写入目标张量
+
+        Args:
+            pil_image: RGB 模式的 PIL 图像
+            out: 目标 float32 张量 (H, W, 3)
+        """
+        # out.numpy() 与张量共享内存，归一化结果直接写入目标切片
+        np.divide(np.asarray(pil_image), np.float32(255.0), out=out.numpy())
+
     @classmethod
     def tensor_to_bytes(cls, tensor: torch.Tensor, format: str = "PNG") -> bytes:
         """
@@ -206,43 +242,377 @@ class ImageProcessor:
             raise ValueError(f"Error converting base64 to tensor: {e}")
     
     @classmethod
-    def prepare_images_for_api(cls, image: torch.Tensor) -> List[Tuple[str, bytes]]:
+    def decode_images(cls, images: List[Union[bytes, str]]) -> torch.Tensor:
+        """
+        将多张编码图像解码为一个批量张量
+
+        先读取图像头部获得尺寸并预分配 (B, H, W, 3) float32 张量，
+        再在线程池中并行解码（PIL 解码期间释放 GIL），每帧直接写入对应切片，
+        不产生额外的整幅 float 中间缓冲。尺寸与第一张不同的图像保持宽高比缩放，
+        并居中填充黑边到第一张的尺寸。
+
+        Args:
+            images: PNG/JPEG/WEBP 字节数据或其 base64 字符串列表
+
+        Returns:
+            PyTorch 张量 (B, H, W, 3)
+
+        Raises:
+            ValueError: 当图像无法解码时
+        """
+        try:
+            raw = [base64.b64decode(data) if isinstance(data, str) else data for data in images]
+            if not raw:
+                raise ValueError("No images to decode")
+
+            opened = [Image.open(io.BytesIO(data)) for data in raw]
+            width, height = opened[0].size
+            sizes = {img.size for img in opened}
+            if len(sizes) != 1:
+                logger.info(f"Images have different sizes {sorted(sizes)}, fitting them to {width}x{height}")
+
+            out = torch.empty((len(opened), height, width, 3), dtype=torch.float32)
+
+            def decode(index: int) -> None:
+                img = opened[index]
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
+                if img.size != (width, height):
+                    img = cls.letterbox(img, (width, height))
+                cls._write_normalized(img, out[index])
+
+            workers = min(len(opened), cls.DEFAULT_CONFIG["max_encode_workers"], os.cpu_count() or 1)
+            if workers > 1:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="openai-image-decode") as executor:
+                    list(executor.map(decode, range(len(opened))))
+            else:
+                for i in range(len(opened)):
+                    decode(i)
+
+            if len(sizes) == 1:
+                cls.attach_encoded(out, raw)
+            logger.debug(f"Decoded {len(opened)} images to tensor: {tuple(out.shape)}")
+            return out
+
+        except Exception as e:
+            logger.error(f"Error decoding images: {e}")
+            raise ValueError(f"Error decoding images: {e}")
+
+    @classmethod
+    def batch_to_uint8(cls, image: torch.Tensor) -> np.ndarray:
+        """
+        将图像张量一次性转换为 uint8 数组（向量化的截断-缩放-取整）
+
+        Args:
+            image: 输入张量 (B, H, W, C)、(H, W, C) 或 (C, H, W)
+
+        Returns:
+            uint8 数组 (B, H, W, C)
+
+        Raises:
+            ValueError: 当张量格式不支持时
+        """
+        tensor = image.detach()
+        if tensor.dim() == 3:
+            # 检查是否为 (C, H, W) 格式
+            if tensor.shape[0] <= 4 and tensor.shape[-1] > 4:
+                tensor = tensor.permute(1, 2, 0)
+            tensor = tensor.unsqueeze(0)
+        elif tensor.dim() != 4:
+            raise ValueError(f"Unsupported image tensor shape: {tuple(image.shape)}")
+
+        if tensor.shape[-1] not in (1, 3, 4):
+            raise ValueError(f"Unsupported number of channels: {tensor.shape[-1]}")
+
+        # 与 tensor_to_pil 一致：最大值不超过 1 时视为 [0, 1] 浮点图像，否则视为 [0, 255]
+        if tensor.dtype == torch.uint8:
+            pixels = tensor
+        elif tensor.max() <= 1.0:
+            pixels = tensor.float().clamp(0.0, 1.0).mul(255.0).round_().to(torch.uint8)
+        else:
+            pixels = tensor.float().clamp(0.0, 255.0).round_().to(torch.uint8)
+        return pixels.cpu().contiguous().numpy()
+
+    @classmethod
+    def encode_png(cls, pixels: np.ndarray, compress_level: Optional[int] = None) -> bytes:
+        """
+        将单帧 uint8 数组编码为 PNG
+
+        Args:
+            pixels: uint8 数组 (H, W, C)
+            compress_level: PNG 压缩级别 0-9
+
+        Returns:
+            PNG 字节数据
+        """
+        if pixels.shape[-1] == 1:
+            pixels = pixels[..., 0]
+        level = cls.DEFAULT_CONFIG["png_compress_level"] if compress_level is None else compress_level
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format="PNG", compress_level=level)
+        return buffer.getvalue()
+
+    @classmethod
+    def select_upload_format(cls, pixels: np.ndarray, image_format: str = "auto") -> str:
+        """
+        选择上传编码格式
+
+        auto 模式下，带有非不透明像素的 RGBA 图像使用 PNG 保留透明度，
+        其余图像使用 JPEG（编码快且体积通常只有 PNG 的几分之一）。
+
+        Args:
+            pixels: uint8 数组 (H, W, C)
+            image_format: auto、PNG、JPEG 或 WEBP
+
+        Returns:
+            PIL 格式名称
+
+        Raises:
+            ValueError: 当格式不支持时
+        """
+        image_format = image_format.upper()
+        if image_format == "JPG":
+            image_format = "JPEG"
+        if image_format == "AUTO":
+            needs_alpha = pixels.shape[-1] == 4 and bool((pixels[..., 3] < 255).any())
+            return "PNG" if needs_alpha else "JPEG"
+        if image_format not in cls.UPLOAD_EXTENSIONS:
+            raise ValueError(f"Unsupported upload format: {image_format}. "
+                             f"Supported: auto, {', '.join(cls.UPLOAD_EXTENSIONS)}")
+        return image_format
+
+    @classmethod
+    def attach_encoded(cls, tensor: torch.Tensor, frames: List[bytes]) -> None:
+        """
+        记录张量各帧的原始编码数据（PNG/JPEG/WEBP）
+
+        Args:
+            tensor: 由这些数据解码得到的张量 (B, H, W, C)
+            frames: 每帧的编码数据
+        """
+        key = id(tensor)
+
+        def forget(_: "weakref.ref[torch.Tensor]") -> None:
+            with cls._encoded_lock:
+                cls._encoded.pop(key, None)
+
+        entry = EncodedFrames(tuple(frames), (tensor.shape[-2], tensor.shape[-3]), tensor._version)
+        with cls._encoded_lock:
+            cls._encoded[key] = (weakref.ref(tensor, forget), entry)
+
+    @classmethod
+    def encoded_frames(cls, tensor: torch.Tensor) -> Optional[EncodedFrames]:
+        """
+        获取张量仍然有效的原始编码数据
+
+        Args:
+            tensor: 图像张量
+
+        Returns:
+            原始编码数据；张量不是解码结果或已被原地修改时返回 None
+        """
+        with cls._encoded_lock:
+            ref, entry = cls._encoded.get(id(tensor), (None, None))
+        if ref is None or ref() is not tensor or tensor._version != entry.version:
+            return None
+        return entry
+
+    @classmethod
+    def _reuse_encoded(cls, image: torch.Tensor, target_size: Optional[Tuple[int, int]],
+                       image_format: Optional[str], max_bytes: Optional[int]) -> Optional[List[Tuple[str, bytes]]]:
+        """
+        未修改的 API 结果直接上传原始编码数据，跳过 uint8 转换与重新编码
+
+        只在无需缩小、格式允许（auto 或与原始格式相同）且不超过大小上限时复用；
+        连续编辑时也避免 JPEG 重新编码带来的逐次画质损失。
+        """
+        entry = cls.encoded_frames(image)
+        if entry is None:
+            return None
+        image_format = (image_format or cls.DEFAULT_CONFIG["image_format"]).upper()
+        limit = max_bytes or cls.DEFAULT_CONFIG["max_upload_bytes"]
+        if target_size is not None and cls.fit_upload_size(entry.size, target_size) != entry.size:
+            return None
+
+        images = []
+        for i, data in enumerate(entry.frames):
+            with Image.open(io.BytesIO(data)) as img:
+                fmt = img.format
+            if fmt not in cls.UPLOAD_EXTENSIONS or image_format not in ("AUTO", fmt) or len(data) > limit:
+                return None
+            images.append((f"image_{i}.{cls.UPLOAD_EXTENSIONS[fmt]}", data))
+        logger.info(f"Reusing original encoding of {len(images)} unmodified image(s) for upload "
+                    f"({sum(len(data) for _, data in images)} bytes)")
+        return images
+
+    @classmethod
+    def fit_upload_size(cls, size: Tuple[int, int], target_size: Tuple[int, int]) -> Tuple[int, int]:
+        """
+        计算上传尺寸：等比缩小到刚好覆盖目标输出分辨率，且不超过 max_image_size，从不放大
+
+        Args:
+            size: 原始尺寸 (width, height)
+            target_size: 目标输出尺寸 (width, height)
+
+        Returns:
+            上传尺寸 (width, height)
+        """
+        width, height = size
+        max_width, max_height = cls.DEFAULT_CONFIG["max_image_size"]
+        scale = min(max(target_size[0] / width, target_size[1] / height), max_width / width, max_height / height)
+        if scale >= 1.0:
+            return size
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    @classmethod
+    def encode_for_upload(cls, pixels: np.ndarray, image_format: str = "auto", compress_level: Optional[int] = None,
+                          target_size: Optional[Tuple[int, int]] = None,
+                          max_bytes: Optional[int] = None) -> Tuple[str, bytes]:
+        """
+        将单帧 uint8 数组缩放并编码为上传数据，保证不超过上传大小上限
+
+        超过上限时先逐步降低有损编码质量，再逐步缩小尺寸。
+
+        Args:
+            pixels: uint8 数组 (H, W, C)
+            image_format: auto、PNG、JPEG 或 WEBP
+            compress_level: PNG 压缩级别 0-9
+            target_size: 目标输出尺寸 (width, height)，提供时缩小到刚好覆盖该分辨率
+            max_bytes: 单张图像上传大小上限，默认使用 DEFAULT_CONFIG["max_upload_bytes"]
+
+        Returns:
+            (PIL 格式名称, 编码后的字节数据)
+
+        Raises:
+            ValueError: 当图像无法压缩到上限以内时
+        """
+        image_format = cls.select_upload_format(pixels, image_format)
+        max_bytes = max_bytes or cls.DEFAULT_CONFIG["max_upload_bytes"]
+        pil_image = Image.fromarray(pixels[..., 0] if pixels.shape[-1] == 1 else pixels)
+        if target_size is not None:
+            pil_image = cls.resize_image_if_needed(pil_image, cls.fit_upload_size(pil_image.size, target_size))
+        if image_format == "JPEG" and pil_image.mode == "RGBA":
+            pil_image = pil_image.convert("RGB")
+
+        level = cls.DEFAULT_CONFIG["png_compress_level"] if compress_level is None else compress_level
+        quality = cls.DEFAULT_CONFIG["image_quality"]
+        min_width, min_height = cls.DEFAULT_CONFIG["min_image_size"]
+        while True:
+            buffer = io.BytesIO()
+            if image_format == "PNG":
+                pil_image.save(buffer, format="PNG", compress_level=level)
+            else:
+                pil_image.save(buffer, format=image_format, quality=quality)
+            data = buffer.getvalue()
+            if len(data) <= max_bytes:
+                return image_format, data
+
+            if image_format != "PNG" and quality > cls.DEFAULT_CONFIG["min_upload_quality"]:
+                quality = max(cls.DEFAULT_CONFIG["min_upload_quality"], quality - 10)
+                continue
+            width, height = pil_image.size
+            if width * 3 // 4 < min_width or height * 3 // 4 < min_height:
+                raise ValueError(f"Image cannot be encoded within the {max_bytes} byte upload limit "
+                                 f"({len(data)} bytes at {width}x{height})")
+            logger.info(f"Upload of {len(data)} bytes exceeds limit, downscaling from {width}x{height}")
+            pil_image = pil_image.resize((width * 3 // 4, height * 3 // 4), Image.Resampling.LANCZOS)
+
+    @classmethod
+    def prepare_images_for_api(cls, image: torch.Tensor, compress_level: Optional[int] = None,
+                               target_size: Optional[Tuple[int, int]] = None, image_format: Optional[str] = None,
+                               max_bytes: Optional[int] = None) -> List[Tuple[str, bytes]]:
         """
         为 API 调用准备图像数据
-        
+
+        整个批次先一次性转换为 uint8，再在线程池中并行进行缩放与编码
+        （PIL 缩放与压缩期间释放 GIL）。
+
         Args:
             image: 输入图像张量
-            
+            compress_level: PNG 压缩级别 0-9，默认使用 DEFAULT_CONFIG["png_compress_level"]
+            target_size: 目标输出尺寸 (width, height)，提供时将更大的输入等比缩小
+            image_format: auto、PNG、JPEG 或 WEBP，默认使用 DEFAULT_CONFIG["image_format"]
+            max_bytes: 单张图像上传大小上限
+
         Returns:
-            图像名称和字节数据的列表
+            图像名称和字节数据的列表（扩展名与编码格式一致）
         """
         try:
-            images = []
-            
-            if len(image.shape) == 4:  # 批量图像
-                batch_size = image.shape[0]
-                logger.info(f"Processing batch of {batch_size} images")
-                
-                for i in range(batch_size):
-                    img_tensor = image[i]
-                    img_bytes = cls.tensor_to_bytes(img_tensor)
-                    images.append((f"image_{i}.png", img_bytes))
-                    
-            elif len(image.shape) == 3:  # 单张图像
-                logger.info("Processing single image")
-                img_bytes = cls.tensor_to_bytes(image)
-                images.append(("image_0.png", img_bytes))
-                
+            reused = cls._reuse_encoded(image, target_size, image_format, max_bytes)
+            if reused is not None:
+                return reused
+
+            pixels = cls.batch_to_uint8(image)
+            batch_size = pixels.shape[0]
+            logger.info(f"Processing batch of {batch_size} images" if batch_size > 1 else "Processing single image")
+            image_format = image_format or cls.DEFAULT_CONFIG["image_format"]
+
+            def encode(frame: np.ndarray) -> Tuple[str, bytes]:
+                return cls.encode_for_upload(frame, image_format, compress_level, target_size, max_bytes)
+
+            workers = min(batch_size, cls.DEFAULT_CONFIG["max_encode_workers"], os.cpu_count() or 1)
+            if workers > 1:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="openai-image-encode") as executor:
+                    encoded = list(executor.map(encode, pixels))
             else:
-                raise ValueError(f"Unsupported image tensor shape: {image.shape}")
-            
-            logger.info(f"Successfully prepared {len(images)} images for API")
+                encoded = [encode(frame) for frame in pixels]
+
+            images = [(f"image_{i}.{cls.UPLOAD_EXTENSIONS[fmt]}", data) for i, (fmt, data) in enumerate(encoded)]
+            logger.info(f"Successfully prepared {len(images)} images for API "
+                        f"({sum(len(data) for _, data in images)} bytes)")
             return images
             
         except Exception as e:
             logger.error(f"Error preparing images for API: {e}")
             raise ValueError(f"Error preparing images for API: {e}")
     
+    @classmethod
+    def prepare_mask_for_api(cls, mask: torch.Tensor, image_size: Tuple[int, int],
+                             target_size: Optional[Tuple[int, int]] = None,
+                             compress_level: Optional[int] = None) -> Tuple[str, bytes]:
+        """
+        将 ComfyUI MASK 转换为 API 使用的 RGBA PNG 蒙版
+
+        ComfyUI 蒙版中 1 表示需要重绘的区域，API 以透明像素标记编辑区域，
+        因此 alpha = (1 - mask) * 255，整个通道一次向量化计算。
+        蒙版按与第一张输入图像相同的规则缩放，保证两者上传尺寸一致。
+
+        Args:
+            mask: 蒙版张量 (B, H, W) 或 (H, W)，取值 [0, 1]；批量蒙版只使用第一张
+            image_size: 第一张输入图像的尺寸 (width, height)
+            target_size: 目标输出尺寸 (width, height)
+            compress_level: PNG 压缩级别 0-9
+
+        Returns:
+            蒙版名称和 PNG 字节数据
+
+        Raises:
+            ValueError: 当蒙版形状或尺寸与输入图像不匹配时
+        """
+        tensor = mask.detach()
+        if tensor.dim() == 3:
+            if tensor.shape[0] > 1:
+                logger.warning(f"Mask batch of {tensor.shape[0]} provided, only the first mask is used")
+            tensor = tensor[0]
+        if tensor.dim() != 2:
+            raise ValueError(f"Unsupported mask shape: {tuple(mask.shape)}")
+
+        height, width = tensor.shape
+        if (width, height) != tuple(image_size):
+            raise ValueError(f"Mask size {width}x{height} does not match image size {image_size[0]}x{image_size[1]}")
+
+        rgba = np.zeros((height, width, 4), dtype=np.uint8)
+        rgba[..., 3] = (1.0 - tensor.float().clamp(0.0, 1.0)).mul(255.0).round_().to(torch.uint8).cpu().numpy()
+        pil_image = Image.fromarray(rgba)
+        if target_size is not None:
+            pil_image = cls.resize_image_if_needed(pil_image, cls.fit_upload_size(pil_image.size, target_size))
+
+        level = cls.DEFAULT_CONFIG["png_compress_level"] if compress_level is None else compress_level
+        buffer = io.BytesIO()
+        pil_image.save(buffer, format="PNG", compress_level=level)
+        logger.info(f"Prepared inpainting mask: {pil_image.size}, {buffer.tell()} bytes")
+        return "mask.png", buffer.getvalue()
+
     @classmethod
     def validate_image_size(cls, image: Image.Image) -> None:
         """
@@ -266,6 +636,25 @@ class ImageProcessor:
         
         logger.debug(f"Image size validation passed: {width}x{height}")
     
+    @classmethod
+    def letterbox(cls, image: Image.Image, size: Tuple[int, int]) -> Image.Image:
+        """
+        保持宽高比缩放到目标尺寸以内，并居中填充黑边
+
+        Args:
+            image: PIL 图像对象
+            size: 目标尺寸 (width, height)
+
+        Returns:
+            目标尺寸的图像
+        """
+        width, height = size
+        scale = min(width / image.width, height / image.height)
+        fitted = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        canvas = Image.new(image.mode, size)
+        canvas.paste(cls.resize_image_if_needed(image, fitted), ((width - fitted[0]) // 2, (height - fitted[1]) // 2))
+        return canvas
+
     @classmethod
     def resize_image_if_needed(cls, image: Image.Image, target_size: Optional[Tuple[int, int]] = None) -> Image.Image:
         """
@@ -0,0 +1,113 @@
+"""
+后台任务模块
+
+该模块提供了提交/收取节点使用的后台执行器，包括：
+- 由本包管理的线程池，提交后立即返回轻量的任务句柄
+- 按句柄等待并取回结果（或重新抛出任务中的异常）
+- 只保留有限数量的已完成任务，未完成的任务不会被丢弃
+
+环境变量：
+- OPENAI_IMAGE_API_JOB_WORKERS: 同时在后台执行的任务数
+"""
+
+import itertools
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ImageJob:
+    """后台任务句柄（在节点之间以 OPENAI_IMAGE_JOB 类型传递）"""
+    id: str
+    description: str = ""
+
+
+class ImageJobManager:
+    """后台任务执行器与任务表"""
+
+    # 默认配置
+    DEFAULT_CONFIG = {
+        "workers": 8,
+        "max_retained": 64,
+    }
+
+    _instance: Optional["ImageJobManager"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, workers: Optional[int] = None, max_retained: Optional[int] = None):
+        self.workers = workers or int(os.getenv("OPENAI_IMAGE_API_JOB_WORKERS") or self.DEFAULT_CONFIG["workers"])
+        self.max_retained = max_retained or self.DEFAULT_CONFIG["max_retained"]
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="openai-image-job")
+        self._jobs: "OrderedDict[str, Future]" = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls) -> "ImageJobManager":
+        """获取进程共享的任务管理器"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def submit(self, fn: Callable[..., Any], *args, description: str = "", **kwargs) -> ImageJob:
+        """
+        在后台执行函数
+
+        Args:
+            fn: 要执行的函数
+            *args: 位置参数
+            description: 日志中显示的任务描述
+            **kwargs: 关键字参数
+
+        Returns:
+            任务句柄
+        """
+        with self._lock:
+            job = ImageJob(id=f"job-{next(self._ids)}", description=description)
+            self._jobs[job.id] = self._executor.submit(fn, *args, **kwargs)
+            self._trim()
+        logger.debug(f"Submitted background image job {job.id}: {description}")
+        return job
+
+    def result(self, job: ImageJob, timeout: Optional[float] = None) -> Any:
+        """
+        等待任务完成并返回结果
+
+        Args:
+            job: 任务句柄
+            timeout: 最长等待秒数，None 表示一直等待
+
+        Returns:
+            任务函数的返回值
+
+        Raises:
+            RuntimeError: 任务不存在（已被清理或来自之前的进程）
+            Exception: 任务中抛出的异常
+        """
+        with self._lock:
+            future = self._jobs.get(job.id)
+        if future is None:
+            raise RuntimeError(f"Image job {job.id} is no longer available; re-run the submit node")
+        return future.result(timeout=timeout)
+
+    def pending(self) -> int:
+        """尚未完成的任务数"""
+        with self._lock:
+            return sum(1 for future in self._jobs.values() if not future.done())
+
+    def _trim(self) -> None:
+        """超过保留上限时按提交顺序丢弃已完成的任务（调用方需持有锁）"""
+        excess = len(self._jobs) - self.max_retained
+        if excess <= 0:
+            return
+        for job_id in [job_id for job_id, future in self._jobs.items() if future.done()][:excess]:
+            del self._jobs[job_id]
@@ -0,0 +1,334 @@
+"""
+任务日志模块
+
+该模块提供了只追加的持久化请求日志，包括：
+- 调用 API 前记录请求参数（start），完成后记录结果文件（done）或错误（failed）
+- 每条记录写入后 fsync，结果文件先原子落盘再记录 done
+- 进程重启后，相同请求直接从日志中的结果返回，不再重复调用 API
+- 报告上次运行中已发出但未完成的请求（interrupted）
+- 按保留天数压缩日志并删除过期结果，不受响应缓存容量淘汰影响
+- 运行期间日志行数超过阈值时压缩为仍然有效的记录，长时间运行的进程日志不会无限增长
+- 结果总大小超过上限时按最近使用顺序淘汰（结果文件与内存索引）
+- 结果文件优先硬链接响应缓存中的同一文件，不在磁盘上保存第二份数据
+
+环境变量：
+- OPENAI_IMAGE_API_JOURNAL: 设为 0 时禁用日志
+- OPENAI_IMAGE_API_JOURNAL_DIR: 日志与结果目录
+- OPENAI_IMAGE_API_JOURNAL_DAYS: 保留天数
+- OPENAI_IMAGE_API_JOURNAL_MAX_MB: 结果总大小上限（MB）
+
+用法：
+    python -m src.openai_image_api.journal    # 列出上次运行中未完成的请求
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .image_request import ImageRequest
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class Journal:
+    """只追加的持久化请求日志"""
+
+    # 默认配置
+    DEFAULT_CONFIG = {
+        "journal_dir": os.path.join(os.path.expanduser("~"), ".cache", "comfy_openai_image_api", "journal"),
+        "journal_name": "journal.jsonl",
+        "retention_days": 7,
+        "max_mb": 512,
+        # 行数超过此值且超过有效记录数两倍时压缩日志
+        "compact_lines": 10000,
+    }
+
+    _instance: Optional["Journal"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, journal_dir: Optional[str] = None, retention_days: Optional[float] = None,
+                 max_bytes: Optional[int] = None):
+        self.root = Path(journal_dir or os.getenv("OPENAI_IMAGE_API_JOURNAL_DIR") or self.DEFAULT_CONFIG["journal_dir"])
+        if retention_days is None:
+            retention_days = float(os.getenv("OPENAI_IMAGE_API_JOURNAL_DAYS") or self.DEFAULT_CONFIG["retention_days"])
+        self.retention_seconds = retention_days * 86400
+        if max_bytes is None:
+            max_mb = float(os.getenv("OPENAI_IMAGE_API_JOURNAL_MAX_MB") or self.DEFAULT_CONFIG["max_mb"])
+            max_bytes = int(max_mb * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self.path = self.root / self.DEFAULT_CONFIG["journal_name"]
+        self._lock = threading.Lock()
+        # 已完成请求的 done 记录，按最近使用排序（最久未使用的在前）
+        self._state: Optional["OrderedDict[str, dict]"] = None
+        self._interrupted: List[dict] = []
+        # 尚未完成的 start 记录，以及日志文件当前的行数
+        self._pending: Dict[str, dict] = {}
+        self._lines = 0
+
+    @classmethod
+    def get(cls) -> Optional["Journal"]:
+        """获取进程共享的日志实例，禁用时返回 None"""
+        if os.getenv("OPENAI_IMAGE_API_JOURNAL", "1").strip().lower() in ("0", "false", "no", "off"):
+            return None
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def lookup(self, key: str) -> Optional[List[bytes]]:
+        """
+        查找已完成请求的结果
+
+        Args:
+            key: 请求哈希
+
+        Returns:
+            PNG 数据列表，未完成或结果已丢失时返回 None
+        """
+        with self._lock:
+            state = self._load()
+            entry = state.get(key)
+            if entry is None:
+                return None
+            state.move_to_end(key)
+        try:
+            data = [(self._result_dir(key) / f"{i}.png").read_bytes() for i in range(entry["files"])]
+        except OSError as e:
+            logger.warning(f"Journal result for {key[:12]} is unreadable: {e}")
+            with self._lock:
+                self._state.pop(key, None)
+            return None
+        logger.info(f"Journal hit: {key[:12]}")
+        return data
+
+    def begin(self, key: str, request: ImageRequest) -> None:
+        """
+        在调用 API 前记录请求参数
+
+        Args:
+            key: 请求哈希
+            request: 图像请求描述（输入图像只记录数量）
+        """
+        self._append({
+            "event": "start",
+            "key": key,
+            "pid": os.getpid(),
+            "provider": request.provider,
+            "model": request.model,
+            "prompt": request.prompt,
+            "size": request.size,
+            "quality": request.quality,
+            "variant": request.variant,
+            "images": len(request.images or ()),
+            "mask": request.mask is not None,
+            "user": request.user,
+        })
+
+    def complete(self, key: str, images: List[bytes], source_dir: Optional[Path] = None) -> None:
+        """
+        保存结果并记录请求完成
+
+        Args:
+            key: 请求哈希
+            images: PNG 数据列表
+            source_dir: 已保存相同结果的响应缓存条目目录，可用时以硬链接代替复制
+        """
+        result_dir = self._result_dir(key)
+        tmp_dir: Optional[Path] = None
+        try:
+            result_dir.parent.mkdir(parents=True, exist_ok=True)
+            tmp_dir = Path(tempfile.mkdtemp(prefix=".tmp-", dir=result_dir.parent))
+            for i, data in enumerate(images):
+                target = tmp_dir / f"{i}.png"
+                if source_dir is not None and self._link(source_dir / f"{i}.png", target, len(data)):
+                    continue
+                with open(target, "wb") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+            if result_dir.exists():
+                shutil.rmtree(result_dir, ignore_errors=True)
+            os.replace(tmp_dir, result_dir)
+        except OSError as e:
+            logger.warning(f"Failed to write journal result {key[:12]}: {e}")
+            if tmp_dir is not None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        entry = self._append({"event": "done", "key": key, "files": len(images), "bytes": sum(len(d) for d in images)})
+        if entry is not None:
+            with self._lock:
+                self._state[key] = entry
+                self._state.move_to_end(key)
+                self._prune()
+
+    def fail(self, key: str, error: BaseException) -> None:
+        """
+        记录请求失败
+
+        Args:
+            key: 请求哈希
+            error: 调用抛出的异常
+        """
+        self._append({"event": "failed", "key": key, "error": str(error)})
+
+    def interrupted(self) -> List[dict]:
+        """之前的进程已开始但未完成的请求（最近的在后）"""
+        with self._lock:
+            self._load()
+            return list(self._interrupted)
+
+    def _append(self, entry: dict) -> Optional[dict]:
+        """追加一条记录并落盘，写入失败只记录警告并返回 None"""
+        with self._lock:
+            self._load()
+            return self._write(entry)
+
+    def _write(self, entry: dict) -> Optional[dict]:
+        """写入一条记录（调用方需持有锁）"""
+        entry = {"time": round(time.time(), 3), **entry}
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            logger.warning(f"Failed to append to request journal: {e}")
+            return None
+        self._lines += 1
+        if entry["event"] == "start":
+            self._pending[entry["key"]] = entry
+        else:
+            self._pending.pop(entry["key"], None)
+        return entry
+
+    def _load(self) -> "OrderedDict[str, dict]":
+        """首次使用时回放日志，并压缩掉过期记录（调用方需持有锁）"""
+        if self._state is not None:
+            return self._state
+
+        self._state = OrderedDict()
+        entries: List[dict] = []
+        if self.path.is_file():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # 崩溃时可能留下半行，忽略即可
+                        continue
+
+        cutoff = time.time() - self.retention_seconds
+        expired = {e["key"] for e in entries if e.get("time", 0) < cutoff}
+        kept = [e for e in entries if e.get("time", 0) >= cutoff]
+        latest: Dict[str, dict] = {}
+        for entry in kept:
+            latest[entry["key"]] = entry
+        for key, entry in sorted(latest.items(), key=lambda item: item[1].get("time", 0)):
+            if entry["event"] == "done":
+                if "bytes" not in entry:
+                    entry["bytes"] = self._result_bytes(key)
+                self._state[key] = entry
+        # 过期的键若在保留期内再次完成过，结果目录仍然有效
+        expired -= set(self._state)
+        self._pending = {key: entry for key, entry in latest.items() if entry["event"] == "start"}
+        self._lines = len(entries)
+        self._interrupted = [e for e in latest.values() if e["event"] == "start" and e.get("pid") != os.getpid()]
+        if self._interrupted:
+            logger.warning(f"{len(self._interrupted)} request(s) were still in flight when a previous run stopped; "
+                           f"identical requests will be sent again")
+
+        if expired:
+            for key in expired:
+                shutil.rmtree(self._result_dir(key), ignore_errors=True)
+            if self._rewrite(kept):
+                self._lines = len(kept)
+        self._prune()
+        return self._state
+
+    def _prune(self) -> None:
+        """结果总大小超过上限时淘汰最久未使用的结果（调用方需持有锁）"""
+        total = sum(entry["bytes"] for entry in self._state.values())
+        while total > self.max_bytes and self._state:
+            key, entry = self._state.popitem(last=False)
+            shutil.rmtree(self._result_dir(key), ignore_errors=True)
+            self._write({"event": "evicted", "key": key})
+            total -= entry["bytes"]
+            logger.debug(f"Evicted journal result: {key[:12]}")
+        self._compact()
+
+    def _compact(self) -> None:
+        """日志行数过多时只保留有效的 done 与未完成的 start 记录（调用方需持有锁）"""
+        live = len(self._state) + len(self._pending)
+        if self._lines <= max(self.DEFAULT_CONFIG["compact_lines"], 2 * live):
+            return
+        entries = sorted([*self._pending.values(), *self._state.values()], key=lambda e: e.get("time", 0))
+        if self._rewrite(entries):
+            logger.debug(f"Compacted request journal from {self._lines} to {len(entries)} line(s)")
+            self._lines = len(entries)
+
+    @staticmethod
+    def _link(source: Path, target: Path, size: int) -> bool:
+        """硬链接响应缓存中的同一文件并落盘（文件不存在、大小不符或跨文件系统时返回 False）"""
+        try:
+            if source.stat().st_size != size:
+                return False
+            os.link(source, target)
+            with open(target, "rb") as f:
+                os.fsync(f.fileno())
+        except OSError:
+            return False
+        return True
+
+    def _result_bytes(self, key: str) -> int:
+        """结果目录中文件的总大小"""
+        try:
+            return sum(f.stat().st_size for f in self._result_dir(key).glob("*.png"))
+        except OSError:
+            return 0
+
+    def _rewrite(self, entries: List[dict]) -> bool:
+        """原子替换日志文件，失败时记录警告并返回 False"""
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=self.root)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to compact request journal: {e}")
+            return False
+        return True
+
+    def _result_dir(self, key: str) -> Path:
+        """结果目录"""
+        return self.root / "results" / key[:2] / key
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="List image requests that were in flight when a previous run stopped")
+    parser.add_argument("--dir", help="Journal directory (default: OPENAI_IMAGE_API_JOURNAL_DIR or the cache directory)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    for entry in Journal(journal_dir=args.dir).interrupted():
+        print(json.dumps(entry, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""
+多端点负载均衡模块
+
+该模块提供了跨多个 Azure OpenAI 区域/部署的请求路由，包括：
+- 最少未完成请求（least_outstanding）与加权随机（weighted）两种路由策略
+- 基于近期错误率与延迟的被动健康检查
+- 熔断：连续失败或错误率过高的端点暂时移出路由，冷却后半开探测
+- 被限流（429）的端点在 Retry-After 期间跳过，由其他端点接管
+
+环境变量：
+- AZURE_OPENAI_POOL: 端点池配置（JSON 数组或 JSON / YAML 文件路径），见 AzureConfigManager.create_pool_configs
+- AZURE_OPENAI_POOL_STRATEGY: 路由策略，least_outstanding（默认）或 weighted
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+from .azure_config import AzureConfigResolver, AzureOpenAIConfig
+from .retry import ErrorKind
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EndpointHealth:
+    """端点的被动健康状态"""
+    outstanding: int = 0
+    latency_ewma: float = 0.0
+    error_rate: float = 0.0
+    samples: int = 0
+    consecutive_failures: int = 0
+    open_until: float = 0.0
+    open_count: int = 0
+    throttled_until: float = 0.0
+    probing: bool = False
+
+
+class PoolMember:
+    """端点池成员"""
+
+    def __init__(self, config: AzureOpenAIConfig):
+        self.config = config
+        self.health = EndpointHealth()
+
+    @property
+    def name(self) -> str:
+        """端点标识（端点 + 部署）"""
+        return f"{self.config.endpoint.rstrip('/')}/{self.config.deployment}"
+
+    def __repr__(self) -> str:
+        return f"PoolMember({self.name})"
+
+
+class AzureLoadBalancer:
+    """Azure OpenAI 多端点负载均衡器"""
+
+    # 默认配置
+    DEFAULT_CONFIG = {
+        "strategy": "least_outstanding",
+        "ewma_alpha": 0.2,
+        "failure_threshold": 3,
+        "error_rate_threshold": 0.5,
+        "min_samples": 5,
+        "open_seconds": 30.0,
+        "max_open_seconds": 300.0,
+        "throttle_seconds": 5.0,
+    }
+
+    SUPPORTED_STRATEGIES = ["least_outstanding", "weighted"]
+
+    _instance: Optional["AzureLoadBalancer"] = None
+    _instance_configs: Optional[List[AzureOpenAIConfig]] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, configs: Iterable[AzureOpenAIConfig], strategy: Optional[str] = None):
+        self.members = [PoolMember(config) for config in configs]
+        if not self.members:
+            raise ValueError("Azure OpenAI load balancer requires at least one endpoint")
+        self.strategy = strategy or self.DEFAULT_CONFIG["strategy"]
+        if self.strategy not in self.SUPPORTED_STRATEGIES:
+            raise ValueError(f"Unsupported load balancing strategy: {self.strategy}. "
+                             f"Supported: {', '.join(self.SUPPORTED_STRATEGIES)}")
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["AzureLoadBalancer"]:
+        """
+        根据 AZURE_OPENAI_POOL 获取进程共享的负载均衡器
+
+        池配置不变时复用同一实例（保留健康状态），配置（包括池文件内容）变化时重建。
+
+        Returns:
+            负载均衡器，未配置池时返回 None
+        """
+        configs = AzureConfigResolver.get().pool_configs()
+        with cls._instance_lock:
+            if not configs:
+                cls._instance = None
+                cls._instance_configs = None
+                return None
+            if cls._instance is None or configs is not cls._instance_configs:
+                cls._instance = cls(configs, os.getenv("AZURE_OPENAI_POOL_STRATEGY") or None)
+                cls._instance_configs = configs
+                logger.info(f"Azure OpenAI load balancer ready: {len(cls._instance.members)} endpoints, "
+                            f"strategy: {cls._instance.strategy}")
+            return cls._instance
+
+    def select(self, exclude: Iterable[PoolMember] = ()) -> PoolMember:
+        """
+        选择一个端点并将其未完成请求数加一
+
+        Args:
+            exclude: 本次请求已尝试过的端点
+
+        Returns:
+            选中的端点（调用完成后必须调用 record_success 或 record_failure）
+        """
+        excluded = set(id(m) for m in exclude)
+        with self._lock:
+            now = time.monotonic()
+            candidates = [m for m in self.members if id(m) not in excluded] or list(self.members)
+            available = [m for m in candidates if self._is_available(m, now)]
+
+            if available:
+                member = self._choose(available)
+            else:
+                # 所有端点都不可用时选择最早恢复的端点，避免请求直接失败
+                member = min(candidates, key=lambda m: max(m.health.open_until, m.health.throttled_until))
+                logger.warning(f"No healthy Azure OpenAI endpoint available, falling back to {member.name}")
+
+            health = member.health
+            if health.open_until and now >= health.open_until:
+                health.probing = True
+                logger.info(f"Probing Azure OpenAI endpoint after circuit cooldown: {member.name}")
+            health.outstanding += 1
+            return member
+
+    def record_success(self, member: PoolMember, latency: float) -> None:
+        """记录成功请求"""
+        alpha = self.DEFAULT_CONFIG["ewma_alpha"]
+        with self._lock:
+            health = member.health
+            health.outstanding = max(0, health.outstanding - 1)
+            health.latency_ewma = latency if health.samples == 0 else (1 - alpha) * health.latency_ewma + alpha * latency
+            health.error_rate = (1 - alpha) * health.error_rate
+            health.samples += 1
+            health.consecutive_failures = 0
+            if health.open_until or health.probing:
+                logger.info(f"Azure OpenAI endpoint recovered: {member.name}")
+            health.open_until = 0.0
+            health.open_count = 0
+            health.probing = False
+
+    def record_failure(self, member: PoolMember, kind: str, retry_after: Optional[float] = None) -> None:
+        """
+        记录失败请求
+
+        Args:
+            member: 端点
+            kind: 错误类别（ErrorKind）
+            retry_after: 服务端建议的等待秒数
+        """
+        alpha = self.DEFAULT_CONFIG["ewma_alpha"]
+        with self._lock:
+            now = time.monotonic()
+            health = member.health
+            health.outstanding = max(0, health.outstanding - 1)
+
+            if kind == ErrorKind.RATE_LIMIT:
+                # 限流不代表端点故障，只在建议的等待时间内跳过
+                wait = retry_after if retry_after is not None else self.DEFAULT_CONFIG["throttle_seconds"]
+                health.throttled_until = max(health.throttled_until, now + wait)
+                health.probing = False
+                logger.warning(f"Azure OpenAI endpoint throttled for {wait:.1f}s: {member.name}")
+                return
+
+            if kind not in (ErrorKind.SERVER, ErrorKind.TIMEOUT):
+                # 客户端错误与内容过滤与端点健康无关
+                health.probing = False
+                return
+
+            health.error_rate = (1 - alpha) * health.error_rate + alpha
+            health.samples += 1
+            health.consecutive_failures += 1
+
+            unhealthy = (
+                health.probing
+                or health.consecutive_failures >= self.DEFAULT_CONFIG["failure_threshold"]
+                or (health.samples >= self.DEFAULT_CONFIG["min_samples"]
+                    and health.error_rate >= self.DEFAULT_CONFIG["error_rate_threshold"])
+            )
+            health.probing = False
+            if unhealthy:
+                cooldown = min(self.DEFAULT_CONFIG["max_open_seconds"],
+                               self.DEFAULT_CONFIG["open_seconds"] * (2 ** health.open_count))
+                health.open_until = now + cooldown
+                health.open_count += 1
+                logger.warning(f"Circuit opened for Azure OpenAI endpoint {member.name} for {cooldown:.0f}s "
+                               f"(error rate {health.error_rate:.2f}, {health.consecutive_failures} consecutive failures)")
+
+    def snapshot(self) -> List[dict]:
+        """各端点健康状态摘要"""
+        with self._lock:
+            now = time.monotonic()
+            return [
+                {
+                    "endpoint": m.name,
+                    "weight": m.config.weight,
+                    "available": self._is_available(m, now),
+                    "outstanding": m.health.outstanding,
+                    "latency_ewma": round(m.health.latency_ewma, 3),
+                    "error_rate": round(m.health.error_rate, 3),
+                }
+                for m in self.members
+            ]
+
+    @staticmethod
+    def _is_available(member: PoolMember, now: float) -> bool:
+        """端点当前是否可以接收请求（调用方需持有锁）"""
+        health = member.health
+        if now < health.throttled_until:
+            return False
+        if now < health.open_until:
+            return False
+        # 熔断冷却结束后只放行一个探测请求
+        return not (health.open_until and health.probing)
+
+    def _choose(self, available: List[PoolMember]) -> PoolMember:
+        """按策略从可用端点中选择（调用方需持有锁）"""
+        if self.strategy == "weighted":
+            weights = [m.config.weight * max(0.05, 1.0 - m.health.error_rate) for m in available]
+            return random.choices(available, weights=weights, k=1)[0]
+        # 近期错误率优先于延迟：快速失败的端点延迟很低，不能因此显得比健康端点更快
+        # （错误率按 0.1 取整，衰减后的少量历史错误不影响按延迟选择）
+        return min(
+            available,
+            key=lambda m: (m.health.outstanding / m.config.weight, round(m.health.error_rate, 1),
+                           m.health.latency_ewma, random.random())
+        )
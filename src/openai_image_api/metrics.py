@@ -0,0 +1,308 @@
+"""
+指标模块
+
+该模块提供了进程内的计数器、仪表与直方图注册表，包括：
+- 各阶段耗时（配置解析、输入编码、API 调用、结果解码）
+- 按部署统计的请求数、API 延迟、上传/下载字节数
+- 重试次数、缓存命中、请求合并与负载均衡故障转移次数
+- 各端点/部署当前的自适应并发上限及其调整次数
+- Prometheus 文本格式导出：本地 HTTP 端点（/metrics）或写入文件
+
+环境变量：
+- OPENAI_IMAGE_API_METRICS_PORT: 启动本地指标 HTTP 服务的端口（未设置时不启动）
+- OPENAI_IMAGE_API_METRICS_HOST: 指标 HTTP 服务监听地址（默认 127.0.0.1）
+- OPENAI_IMAGE_API_METRICS_FILE: 每次节点执行后写入指标快照的文件路径
+"""
+
+import atexit
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """累积分桶直方图"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """记录一个观测值"""
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class Metrics:
+    """计数器、仪表与直方图注册表"""
+
+    # 默认配置
+    DEFAULT_CONFIG = {
+        "prefix": "openai_image_api",
+        "buckets": (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+        "host": "127.0.0.1",
+    }
+
+    # 指标说明（Prometheus HELP 行）
+    HELP = {
+        "requests_total": "Image API calls by deployment, operation and outcome",
+        "stage_seconds": "Time spent in each node stage",
+        "api_seconds": "Image API call latency by deployment, including retries",
+        "upload_bytes_total": "Prompt and input image bytes sent to the image API",
+        "download_bytes_total": "Image bytes received from the image API",
+        "retries_total": "Retried image API attempts by error kind",
+        "cache_lookups_total": "Response cache lookups by result",
+        "failovers_total": "Load balancer failovers by error kind",
+        "spend_usd_total": "Image API spend in USD (actual usage when reported, otherwise estimated)",
+        "coalesced_total": "Requests served by joining an identical in-flight request",
+        "concurrency_limit": "Current adaptive concurrency limit per endpoint/deployment",
+        "concurrency_adjustments_total": "Adaptive concurrency limit changes by reason",
+    }
+
+    _instance: Optional["Metrics"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, buckets: Optional[Tuple[float, ...]] = None):
+        self.buckets = buckets or self.DEFAULT_CONFIG["buckets"]
+        self._counters: Dict[str, Dict[LabelSet, float]] = {}
+        self._gauges: Dict[str, Dict[LabelSet, float]] = {}
+        self._histograms: Dict[str, Dict[LabelSet, Histogram]] = {}
+        self._lock = threading.Lock()
+        self._server: Optional["ThreadingHTTPServer"] = None
+        self.dump_path: Optional[str] = None
+
+    @classmethod
+    def get(cls) -> "Metrics":
+        """获取进程共享的指标注册表（首次调用时按环境变量启动导出）"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+                cls._instance._configure_exports()
+            return cls._instance
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        """
+        计数器加值
+
+        Args:
+            name: 指标名称（不含前缀）
+            value: 增量
+            **labels: 标签
+        """
+        key = self._label_set(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        """
+        设置仪表当前值
+
+        Args:
+            name: 指标名称（不含前缀）
+            value: 当前值
+            **labels: 标签
+        """
+        key = self._label_set(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """
+        直方图记录观测值
+
+        Args:
+            name: 指标名称（不含前缀）
+            value: 观测值（秒）
+            **labels: 标签
+        """
+        key = self._label_set(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: str) -> Iterator[None]:
+        """计时上下文，退出时（包括异常退出）记录耗时"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe(name, elapsed, **labels)
+            logger.debug(f"{name}{dict(labels)} took {elapsed:.3f}s")
+
+    def stage(self, stage: str):
+        """节点阶段计时（stage_seconds{stage=...}）"""
+        return self.timer("stage_seconds", stage=stage)
+
+    def counter_value(self, name: str, **labels: str) -> float:
+        """读取计数器当前值"""
+        with self._lock:
+            return self._counters.get(name, {}).get(self._label_set(labels), 0.0)
+
+    def gauge_value(self, name: str, **labels: str) -> Optional[float]:
+        """读取仪表当前值"""
+        with self._lock:
+            return self._gauges.get(name, {}).get(self._label_set(labels))
+
+    def histogram_count(self, name: str, **labels: str) -> int:
+        """读取直方图观测次数"""
+        with self._lock:
+            histogram = self._histograms.get(name, {}).get(self._label_set(labels))
+            return histogram.count if histogram is not None else 0
+
+    def reset(self) -> None:
+        """清空全部指标"""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        """
+        以 Prometheus 文本格式导出全部指标
+
+        Returns:
+            Prometheus exposition 格式文本
+        """
+        prefix = self.DEFAULT_CONFIG["prefix"]
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                full = f"{prefix}_{name}"
+                self._header(lines, full, name, "counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{full}{self._format_labels(labels)} {value:g}")
+            for name, series in sorted(self._gauges.items()):
+                full = f"{prefix}_{name}"
+                self._header(lines, full, name, "gauge")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{full}{self._format_labels(labels)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                full = f"{prefix}_{name}"
+                self._header(lines, full, name, "histogram")
+                for labels, histogram in sorted(series.items()):
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f"{full}_bucket{self._format_labels(labels + (('le', f'{bound:g}'),))} {count}")
+                    lines.append(f"{full}_bucket{self._format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{full}_sum{self._format_labels(labels)} {histogram.sum:.6f}")
+                    lines.append(f"{full}_count{self._format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: Optional[str] = None) -> None:
+        """
+        原子写入指标快照文件
+
+        Args:
+            path: 文件路径，默认使用 OPENAI_IMAGE_API_METRICS_FILE
+        """
+        path = path or self.dump_path
+        if not path:
+            return
+        directory = os.path.dirname(os.path.abspath(path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=".metrics-", dir=directory)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write metrics file {path}: {e}")
+
+    def serve(self, port: int, host: Optional[str] = None) -> int:
+        """
+        在后台线程中启动 /metrics HTTP 服务
+
+        Args:
+            port: 监听端口（0 表示随机端口）
+            host: 监听地址
+
+        Returns:
+            实际监听的端口
+        """
+        if self._server is not None:
+            return self._server.server_address[1]
+
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(f"Metrics request: {format % args}")
+
+        self._server = ThreadingHTTPServer((host or self.DEFAULT_CONFIG["host"], port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="openai-image-metrics", daemon=True).start()
+        bound = self._server.server_address[1]
+        logger.info(f"Metrics endpoint listening on http://{self._server.server_address[0]}:{bound}/metrics")
+        return bound
+
+    def shutdown(self) -> None:
+        """停止 HTTP 服务"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _configure_exports(self) -> None:
+        """按环境变量启动 HTTP 服务与文件导出"""
+        port = os.getenv("OPENAI_IMAGE_API_METRICS_PORT")
+        if port:
+            try:
+                self.serve(int(port), os.getenv("OPENAI_IMAGE_API_METRICS_HOST") or None)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Failed to start metrics endpoint on port {port}: {e}")
+        self.dump_path = os.getenv("OPENAI_IMAGE_API_METRICS_FILE") or None
+        if self.dump_path:
+            atexit.register(self.dump)
+
+    def _header(self, lines: List[str], full: str, name: str, kind: str) -> None:
+        """写入 HELP/TYPE 行"""
+        if name in self.HELP:
+            lines.append(f"# HELP {full} {self.HELP[name]}")
+        lines.append(f"# TYPE {full} {kind}")
+
+    @staticmethod
+    def _label_set(labels: Dict[str, str]) -> LabelSet:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    @staticmethod
+    def _format_labels(labels: LabelSet) -> str:
+        if not labels:
+            return ""
+        escaped = (k + '="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+                   for k, v in labels)
+        return "{" + ",".join(escaped) + "}"
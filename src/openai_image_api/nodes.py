@@ -1,33 +1,46 @@
-from inspect import cleandoc
+from __future__ import annotations
+
 import base64
-import numpy as np
-import torch
-from PIL import Image
-import io
 import os
 import logging
-from typing import Optional, Union, Tuple, List
-from openai import OpenAI, AzureOpenAI
+import sqlite3
+import time
+import asyncio
+import dataclasses
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Dict, Optional, Union, Tuple, List
+from urllib.parse import urlparse
 
-# 导入本地模块
-from .azure_config import AzureConfigManager, AzureOpenAIConfig
-from .image_utils import ImageProcessor
+# 导入本地模块（仅依赖标准库；torch、numpy、PIL 与 openai SDK 在首次执行时才导入，
+# 以缩短 ComfyUI 启动时注册节点的耗时）
+from .azure_config import AzureConfigManager, AzureConfigResolver, AzureOpenAIConfig
+from .client_pool import ClientPool
+from .engine import ImageRequestEngine
+from .image_request import ImageRequest
+from .jobs import ImageJob, ImageJobManager
+from .journal import Journal
+from .response_cache import ResponseCache
+from .retry import RateLimiter, RetryPolicy, call_with_retry, classify_error, retry_after_seconds, ErrorKind
+from .load_balancer import AzureLoadBalancer
+from .metrics import Metrics
+from .shared_frames import SharedFrameStore
+from .single_flight import SingleFlight
+from .budget import BudgetExceededError, BudgetGovernor
 
-# Try to load environment variables from .env file
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-except ImportError:
-    # dotenv is optional, continue without it
-    pass
+if TYPE_CHECKING:
+    import torch
+    from openai import AsyncOpenAI, AsyncAzureOpenAI
+    from .preview import PreviewReporter
 
 # 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
+def load_environment() -> None:
+    """从 .env 文件加载环境变量，文件变化时重新加载（python-dotenv 为可选依赖）"""
+    AzureConfigResolver.get().refresh()
+
+
 # ANSI escape codes for colors
 RED = "\033[91m"
 RESET = "\033[0m"
@@ -55,7 +68,11 @@ class OpenAIImageAPI:
         "supported_qualities": ["low", "medium", "high"],
         "supported_providers": ["openai", "azure"],
         "max_retries": 3,
-        "timeout": 60
+        "timeout": 60,
+        "upload_format": "auto",
+        "edit_modes": ["reference", "per_frame"],
+        "frame_error_modes": ["fail", "use_input"],
+        "max_frame_workers": 8
     }
     
     def __init__(self):
@@ -77,6 +94,7 @@ class OpenAIImageAPI:
             },
             "optional": {
                 "image": ("IMAGE",),
+                "mask": ("MASK",),
                 "api_key": ("STRING", {
                     "multiline": False,
                     "default": ""
@@ -93,6 +111,36 @@ class OpenAIImageAPI:
                     "multiline": False,
                     "default": s.CONFIG["default_model"]
                 }),
+                "priority": ("INT", {
+                    "default": 0,
+                    "min": -100,
+                    "max": 100
+                }),
+                "use_cache": ("BOOLEAN", {
+                    "default": True
+                }),
+                "force_refresh": ("BOOLEAN", {
+                    "default": False
+                }),
+                "partial_images": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 3
+                }),
+                "n": ("INT", {
+                    "default": 1,
+                    "min": 1,
+                    "max": 10
+                }),
+                "budget_user": ("STRING", {
+                    "multiline": False,
+                    "default": ""
+                }),
+                "edit_mode": (s.CONFIG["edit_modes"],),
+                "on_frame_error": (s.CONFIG["frame_error_modes"],),
+            },
+            "hidden": {
+                "unique_id": "UNIQUE_ID"
             }
         }
 
@@ -100,9 +148,9 @@ class OpenAIImageAPI:
     FUNCTION = "generate_image"
     CATEGORY = "image/OpenAI"
 
-    def _create_azure_client(self, config: AzureOpenAIConfig) -> AzureOpenAI:
+    def _create_azure_client(self, config: AzureOpenAIConfig) -> AsyncAzureOpenAI:
         """
-        创建 Azure OpenAI 客户端
+        创建 Azure OpenAI 异步客户端
         
         Args:
             config: Azure OpenAI 配置
@@ -110,12 +158,15 @@ class OpenAIImageAPI:
         Returns:
             配置好的 Azure OpenAI 客户端
         """
+        from openai import AsyncAzureOpenAI
+
         try:
-            client = AzureOpenAI(
+            client = AsyncAzureOpenAI(
                 api_key=config.api_key,
                 api_version=config.api_version,
                 azure_endpoint=config.endpoint,
-                timeout=config.timeout
+                timeout=config.timeout,
+                max_retries=config.max_retries
             )
             logger.info(f"Azure OpenAI client created successfully for endpoint: {config.endpoint}")
             return client
@@ -123,9 +174,9 @@ class OpenAIImageAPI:
             logger.error(f"Failed to create Azure OpenAI client: {e}")
             raise RuntimeError(f"Failed to create Azure OpenAI client: {e}")
 
-    def _create_openai_client(self, api_key: str) -> OpenAI:
+    def _create_openai_client(self, api_key: str) -> AsyncOpenAI:
         """
-        创建 OpenAI 客户端
+        创建 OpenAI 异步客户端
         
         Args:
             api_key: OpenAI API 密钥
@@ -133,10 +184,13 @@ class OpenAIImageAPI:
         Returns:
             配置好的 OpenAI 客户端
         """
+        from openai import AsyncOpenAI
+
         try:
-            client = OpenAI(
+            client = AsyncOpenAI(
                 api_key=api_key,
-                timeout=self.CONFIG["timeout"]
+                timeout=self.CONFIG["timeout"],
+                max_retries=self.CONFIG["max_retries"]
             )
             logger.info("OpenAI client created successfully")
             return client
@@ -144,15 +198,508 @@ class OpenAIImageAPI:
             logger.error(f"Failed to create OpenAI client: {e}")
             raise RuntimeError(f"Failed to create OpenAI client: {e}")
 
+    @staticmethod
+    def _close_client(client: Union[AsyncOpenAI, AsyncAzureOpenAI]) -> None:
+        """在引擎事件循环中关闭异步客户端"""
+        ImageRequestEngine.get().run_in_loop(client.close())
+
+    def _get_azure_client(self, config: AzureOpenAIConfig) -> AsyncAzureOpenAI:
+        """
+        从进程级连接池获取 Azure OpenAI 客户端，配置不变时复用已有连接
+
+        Args:
+            config: Azure OpenAI 配置
+
+        Returns:
+            可复用的 Azure OpenAI 客户端
+        """
+        key = ClientPool.make_key(
+            provider="azure",
+            api_key=config.api_key,
+            endpoint=config.endpoint,
+            api_version=config.api_version,
+            timeout=config.timeout
+        )
+        return ClientPool.get_client(key, lambda: self._create_azure_client(config), closer=self._close_client)
+
+    def _get_openai_client(self, api_key: str) -> AsyncOpenAI:
+        """
+        从进程级连接池获取 OpenAI 客户端，密钥不变时复用已有连接
+
+        Args:
+            api_key: OpenAI API 密钥
+
+        Returns:
+            可复用的 OpenAI 客户端
+        """
+        key = ClientPool.make_key(
+            provider="openai",
+            api_key=api_key,
+            endpoint=os.getenv("OPENAI_BASE_URL"),
+            timeout=self.CONFIG["timeout"]
+        )
+        return ClientPool.get_client(key, lambda: self._create_openai_client(api_key), closer=self._close_client)
+
     def _validate_openai_config(self, api_key: str) -> None:
         """验证 OpenAI 配置参数"""
         if not api_key:
             raise RuntimeError("OpenAI API key is required. Set OPENAI_API_KEY environment variable or provide api_key parameter.")
 
+    def _resolve_client(self, provider: str, model: str, api_key: Optional[str] = None,
+                        azure_endpoint: Optional[str] = None, azure_api_version: Optional[str] = None,
+                        azure_deployment: Optional[str] = None
+                        ) -> Tuple[Union[AsyncOpenAI, AsyncAzureOpenAI, AzureLoadBalancer], str]:
+        """
+        解析服务配置并获取客户端
+
+        Azure 未显式指定端点且配置了 AZURE_OPENAI_POOL 时返回多端点负载均衡器，
+        请求会在池中各端点之间路由与故障转移。
+
+        Args:
+            provider: 服务提供商 (openai 或 azure)
+            model: 使用的模型
+            api_key: API 密钥
+            azure_endpoint: Azure 端点
+            azure_api_version: Azure API 版本
+            azure_deployment: Azure 部署名称
+
+        Returns:
+            (客户端或负载均衡器, 模型/部署名称)
+        """
+        load_environment()
+
+        if provider == "azure" and not (azure_endpoint and azure_endpoint.strip()):
+            balancer = AzureLoadBalancer.from_env()
+            if balancer is not None:
+                logger.info(f"Using Azure OpenAI load balancer: {balancer.snapshot()}")
+                return balancer, azure_deployment or AzureConfigManager.DEFAULT_CONFIG["deployment"]
+
+        if provider == "azure":
+            # 解析（缓存的）已验证配置，配置来源变化时自动重新加载
+            config = AzureConfigResolver.get().resolve(
+                endpoint=azure_endpoint,
+                api_key=api_key,
+                api_version=azure_api_version,
+                deployment=azure_deployment
+            )
+            return self._get_azure_client(config), config.deployment
+
+        # 处理 OpenAI 配置
+        key = api_key.strip() if api_key else None
+        key = key or os.getenv("OPENAI_API_KEY")
+
+        self._validate_openai_config(key)
+        return self._get_openai_client(key), model
+
+    def _call_image_api(self, client: Union[AsyncOpenAI, AsyncAzureOpenAI, AzureLoadBalancer],
+                        request: ImageRequest, priority: int = 0, max_retries: Optional[int] = None,
+                        preview: Optional[PreviewReporter] = None) -> List[bytes]:
+        """
+        通过异步请求引擎调用图像生成/编辑 API
+
+        调用线程阻塞等待结果，请求本身在引擎的共享事件循环中按端点/部署自适应限制并发、按优先级调度；
+        限流、服务端错误与超时按客户端的 max_retries 配置退避重试。
+
+        Args:
+            client: OpenAI 或 Azure OpenAI 异步客户端，或多端点负载均衡器
+            request: 图像请求描述
+            priority: 调度优先级，数值越大越先执行
+            max_retries: 覆盖客户端的重试次数
+            preview: 提供时以流式方式请求，并把部分图像推送给预览
+
+        Returns:
+            API 返回的 PNG 数据列表
+        """
+        if isinstance(client, AzureLoadBalancer):
+            return self._call_balanced(client, request, priority, preview)
+
+        # 重试由 call_with_retry 统一处理，关闭 SDK 内置重试以免叠加
+        api = client.with_options(max_retries=0).images.with_raw_response
+        policy = RetryPolicy(max_retries=client.max_retries if max_retries is None else max_retries)
+        bucket = RateLimiter.get_bucket(f"{client.base_url}|{request.model}")
+
+        kwargs = {
+            "model": request.model,
+            "prompt": request.prompt,
+            "size": request.size,
+            "quality": request.quality
+        }
+        if request.n > 1:
+            kwargs["n"] = request.n
+        if request.operation == "generation":
+            logger.info("Calling image generation API")
+            method = api.generate
+        else:
+            logger.info("Calling image editing API")
+            method = api.edit
+            kwargs["image"] = list(request.images)
+            if request.mask is not None:
+                kwargs["mask"] = request.mask
+        if preview is not None:
+            kwargs.update(stream=True, partial_images=preview.partial_images)
+
+        async def attempt():
+            response = await method(**kwargs)
+            if preview is None:
+                return response
+            bucket.observe_headers(response.headers)
+            return await self._consume_stream(response.parse(), preview)
+
+        metrics = Metrics.get()
+        endpoint = urlparse(str(client.base_url)).netloc
+        # 每个端点/部署一个调度通道，并发上限按延迟与限流自动调整
+        lane = f"{endpoint}/{request.model}"
+        engine = ImageRequestEngine.get()
+
+        # 同一通道中的请求耗时差异很大，延迟只与同类请求比较
+        cost_class = (request.operation, request.size, request.quality, request.n, preview is not None)
+
+        def call():
+            return call_with_retry(attempt, policy, bucket, f"Image {request.operation}", limit=engine.limit(lane),
+                                   cost_class=cost_class)
+
+        labels = {"endpoint": endpoint, "deployment": request.model, "operation": request.operation}
+        user = request.user or "default"
+
+        # 发送前检查预算与配额，并预占估算用量
+        # 用量数据库出错（锁等待超时、磁盘已满）只记录日志，不影响请求本身，也不丢弃已付费的结果
+        governor = BudgetGovernor.get()
+        reservation = None
+        if governor is not None:
+            try:
+                reservation = governor.reserve(user, lane, request.size, request.quality, images=request.n,
+                                               prompt=request.prompt, input_images=len(request.images or ()))
+            except BudgetExceededError:
+                metrics.inc("requests_total", status="rejected", **labels)
+                raise
+            except sqlite3.Error as e:
+                logger.warning(f"Budget database unavailable, sending request without usage accounting: {e}")
+
+        upload_bytes = len(request.prompt.encode("utf-8")) + sum(len(data) for _, data in request.images or ())
+        upload_bytes += len(request.mask[1]) if request.mask is not None else 0
+        metrics.inc("upload_bytes_total", upload_bytes, **labels)
+        started = time.perf_counter()
+        try:
+            result = engine.run(lane, call, priority)
+        except Exception as e:
+            if reservation is not None:
+                try:
+                    governor.release(reservation)
+                except sqlite3.Error as db_error:
+                    logger.warning(f"Failed to release budget reservation: {db_error}")
+            metrics.inc("requests_total", status=classify_error(e), **labels)
+            raise
+        finally:
+            metrics.observe("api_seconds", time.perf_counter() - started, **labels)
+        usage = getattr(result, "usage", None)
+        cost = None
+        if reservation is not None:
+            try:
+                cost = governor.commit(reservation, usage)
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to record usage in budget database: {e}")
+        if cost is None:
+            _, cost = BudgetGovernor.usage_cost(usage) or BudgetGovernor.estimate(
+                request.size, request.quality, request.n, request.prompt, len(request.images or ()))
+        png_images = [base64.b64decode(item.b64_json) for item in result.data]
+        metrics.inc("requests_total", status="ok", **labels)
+        metrics.inc("spend_usd_total", cost, user=user, **labels)
+        metrics.inc("download_bytes_total", sum(len(data) for data in png_images), **labels)
+        return png_images
+
+    @staticmethod
+    async def _consume_stream(stream, preview: PreviewReporter):
+        """
+        读取流式响应，部分图像交给线程池解码并推送预览，返回全部最终图像
+
+        Args:
+            stream: 流式响应事件迭代器
+            preview: 预览推送器
+
+        Returns:
+            与非流式响应结构相同的结果对象（data 仅含最终图像）
+        """
+        loop = asyncio.get_running_loop()
+        completed = []
+        async for event in stream:
+            if event.type.endswith("partial_image"):
+                # 预览解码不阻塞事件循环中的其他请求
+                loop.run_in_executor(None, preview.on_partial, event.partial_image_index, event.b64_json)
+            elif event.type.endswith("completed"):
+                completed.append(event)
+        if not completed:
+            raise RuntimeError("Image stream ended without a completed image")
+        preview.complete()
+        return SimpleNamespace(data=completed, usage=getattr(completed[-1], "usage", None))
+
+    def _call_balanced(self, balancer: AzureLoadBalancer, request: ImageRequest, priority: int = 0,
+                       preview: Optional[PreviewReporter] = None) -> List[bytes]:
+        """
+        通过负载均衡器调用 API，限流、服务端错误与超时时故障转移到其他端点
+
+        每次尝试只调用一个端点一次；所有端点都尝试过后按退避策略继续，
+        总尝试次数为端点数加上首个端点配置的 max_retries。
+
+        Args:
+            balancer: 多端点负载均衡器
+            request: 图像请求描述（model 为逻辑部署名称）
+            priority: 调度优先级，数值越大越先执行
+            preview: 提供时以流式方式请求
+
+        Returns:
+            API 返回的 PNG 数据列表
+        """
+        policy = RetryPolicy(max_retries=balancer.members[0].config.max_retries)
+        attempts = len(balancer.members) + policy.max_retries
+        tried = []
+        for attempt in range(attempts):
+            member = balancer.select(exclude=tried)
+            client = self._get_azure_client(member.config)
+            member_request = dataclasses.replace(request, model=member.config.deployment)
+            started = time.monotonic()
+            try:
+                result = self._call_image_api(client, member_request, priority, max_retries=0, preview=preview)
+            except Exception as e:
+                kind = classify_error(e)
+                retry_after = retry_after_seconds(getattr(getattr(e, "response", None), "headers", None))
+                balancer.record_failure(member, kind, retry_after)
+                if kind not in ErrorKind.RETRYABLE or attempt == attempts - 1:
+                    raise
+                tried.append(member)
+                if len(tried) >= len(balancer.members):
+                    tried = []
+                    delay = policy.backoff(attempt - len(balancer.members) + 1)
+                    logger.warning(f"All Azure OpenAI endpoints failed, retrying in {delay:.1f}s")
+                    time.sleep(delay)
+                else:
+                    logger.warning(f"Failing over from {member.name} after {kind} error: {e}")
+                Metrics.get().inc("failovers_total", kind=kind)
+                continue
+            balancer.record_success(member, time.monotonic() - started)
+            return result
+        raise RuntimeError("Azure OpenAI load balancer exhausted all attempts")
+
+    def _fetch_images(self, client: Union[AsyncOpenAI, AsyncAzureOpenAI, AzureLoadBalancer], request: ImageRequest,
+                      priority: int = 0, use_cache: bool = True, force_refresh: bool = False,
+                      preview: Optional[PreviewReporter] = None) -> List[bytes]:
+        """
+        获取请求结果的 PNG 数据（优先使用响应缓存与任务日志）
+
+        缓存未命中时，与正在进行的相同请求合并为一次 API 调用；调用前后写入任务日志。
+        不读缓存（use_cache=False 或 force_refresh）时结果不会被回放，也不写任务日志。
+
+        Args:
+            client: OpenAI 或 Azure OpenAI 异步客户端，或多端点负载均衡器
+            request: 图像请求描述
+            priority: 调度优先级，数值越大越先执行
+            use_cache: 是否读写响应缓存
+            force_refresh: 忽略已有缓存重新调用 API（结果仍会写入缓存）
+            preview: 提供时以流式方式请求并推送部分图像预览
+
+        Returns:
+            PNG 数据列表
+        """
+        metrics = Metrics.get()
+        cache = ResponseCache.get() if use_cache else None
+        journal = Journal.get() if cache is not None and not force_refresh else None
+        key = request.cache_key
+
+        png_images = None
+        if cache is not None and not force_refresh:
+            png_images = cache.lookup(key)
+            source = "hit"
+            if png_images is None and journal is not None:
+                # 缓存已淘汰或上次运行在写入缓存前退出时，从任务日志恢复已付费的结果
+                png_images = journal.lookup(key)
+                source = "journal"
+                if png_images is not None:
+                    cache.store(key, png_images)
+            metrics.inc("cache_lookups_total", result="miss" if png_images is None else source)
+        if png_images is None:
+            def call() -> List[bytes]:
+                if journal is not None:
+                    journal.begin(key, request)
+                try:
+                    with metrics.stage("api"):
+                        result = self._call_image_api(client, request, priority, preview=preview)
+                except BaseException as e:
+                    if journal is not None:
+                        journal.fail(key, e)
+                    raise
+                if cache is not None:
+                    cache.store(key, result)
+                if journal is not None:
+                    journal.complete(key, result, cache.path(key))
+                return result
+
+            png_images, shared = SingleFlight.get().do(key, call)
+            if shared:
+                metrics.inc("coalesced_total")
+                png_images = list(png_images)
+        return png_images
+
+    def _run_request(self, client: Union[AsyncOpenAI, AsyncAzureOpenAI, AzureLoadBalancer], request: ImageRequest,
+                     priority: int = 0, use_cache: bool = True, force_refresh: bool = False,
+                     preview: Optional[PreviewReporter] = None) -> torch.Tensor:
+        """
+        执行请求并把返回的全部图像解码为一个批量
+
+        优先使用主机共享帧存储中已解码的结果，解码后的帧也会发布到共享存储。
+
+        Args:
+            client: OpenAI 或 Azure OpenAI 异步客户端，或多端点负载均衡器
+            request: 图像请求描述
+            priority: 调度优先级，数值越大越先执行
+            use_cache: 是否读写响应缓存
+            force_refresh: 忽略已有缓存重新调用 API（结果仍会写入缓存）
+            preview: 提供时以流式方式请求并推送部分图像预览
+
+        Returns:
+            图像张量 (n, H, W, C)，尺寸不同的图像按第一张的尺寸缩放并填充
+        """
+        metrics = Metrics.get()
+        store = SharedFrameStore.get() if use_cache else None
+        key = request.cache_key
+        if store is not None and not force_refresh:
+            # 同一主机上的其他 ComfyUI 进程可能已经解码过相同请求的结果
+            with metrics.stage("decode"):
+                frames = store.lookup(key)
+            if frames is not None:
+                metrics.inc("cache_lookups_total", result="shared")
+                return frames
+
+        png_images = self._fetch_images(client, request, priority, use_cache, force_refresh, preview)
+
+        from .image_utils import ImageProcessor
+
+        # 处理响应
+        with metrics.stage("decode"):
+            frames = ImageProcessor.decode_images(png_images[:request.n])
+        if store is not None:
+            store.publish(key, ImageProcessor.batch_to_uint8(frames))
+        return frames
+
+    def _edit_frames(self, client: Union[AsyncOpenAI, AsyncAzureOpenAI, AzureLoadBalancer], request: ImageRequest,
+                     image: torch.Tensor, mask: Optional[torch.Tensor] = None, priority: int = 0,
+                     use_cache: bool = True, force_refresh: bool = False, on_frame_error: str = "fail") -> torch.Tensor:
+        """
+        用同一提示并发编辑批量中的每一帧，按原顺序组合结果
+
+        每帧单独编码、单独请求（各自命中缓存、合并与日志），成功的帧即使其他帧失败也已保存，
+        重新执行时不会再次付费。
+
+        Args:
+            client: OpenAI 或 Azure OpenAI 异步客户端，或多端点负载均衡器
+            request: 图像请求描述（images 与 mask 按帧填充）
+            image: 输入帧 (B, H, W, C)
+            mask: 可选的重绘蒙版，单张作用于所有帧，或与帧数相同的批量逐帧对应
+            priority: 调度优先级，数值越大越先执行
+            use_cache: 是否读写响应缓存
+            force_refresh: 忽略已有缓存重新调用 API
+            on_frame_error: fail 时任一帧失败即报错；use_input 时失败的帧用缩放后的输入帧代替
+
+        Returns:
+            编辑后的图像张量 (B, H, W, 3)
+
+        Raises:
+            ValueError: 蒙版数量与帧数不匹配
+            RuntimeError: 有帧失败（fail 模式）或全部帧失败
+        """
+        import torch
+
+        from .image_utils import ImageProcessor
+
+        frames = image if image.dim() == 4 else image.unsqueeze(0)
+        masks = None
+        if mask is not None:
+            masks = mask if mask.dim() == 3 else mask.unsqueeze(0)
+            if masks.shape[0] not in (1, frames.shape[0]):
+                raise ValueError(f"Mask batch of {masks.shape[0]} does not match {frames.shape[0]} frames")
+        metrics = Metrics.get()
+
+        def edit(index: int) -> bytes:
+            frame_mask = None if masks is None else masks[min(index, masks.shape[0] - 1)]
+            with metrics.stage("encode"):
+                images, mask_upload = self._prepare_upload(frames[index:index + 1], request.size, frame_mask)
+            frame_request = dataclasses.replace(request, images=tuple(images), mask=mask_upload)
+            return self._fetch_images(client, frame_request, priority, use_cache, force_refresh)[0]
+
+        count = frames.shape[0]
+        logger.info(f"Editing {count} frames independently")
+        workers = min(count, self.CONFIG["max_frame_workers"])
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="openai-image-frame") as executor:
+            futures = [executor.submit(edit, i) for i in range(count)]
+            results: List[Optional[bytes]] = []
+            errors: Dict[int, Exception] = {}
+            for i, future in enumerate(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    errors[i] = e
+                    results.append(None)
+
+        if errors:
+            details = "; ".join(f"frame {i}: {e}" for i, e in list(errors.items())[:3])
+            summary = f"{len(errors)} of {count} frames failed ({details})"
+            if on_frame_error != "use_input" or len(errors) == count:
+                raise RuntimeError(summary)
+            logger.warning(f"{summary}; using the input frames instead")
+
+        with metrics.stage("decode"):
+            decoded = ImageProcessor.decode_images([data for data in results if data is not None])
+        if not errors:
+            return decoded
+
+        height, width = decoded.shape[1:3]
+        out = torch.empty((count, height, width, 3), dtype=decoded.dtype)
+        successful = iter(decoded)
+        for i in range(count):
+            if i in errors:
+                frame = frames[i, ..., :3].permute(2, 0, 1).unsqueeze(0).float()
+                frame = torch.nn.functional.interpolate(frame, size=(height, width), mode="bilinear", align_corners=False)
+                out[i] = frame[0].permute(1, 2, 0).clamp(0.0, 1.0)
+            else:
+                out[i] = next(successful)
+        return out
+
+    def _prepare_upload(self, image: torch.Tensor, size: str, mask: Optional[torch.Tensor] = None
+                        ) -> Tuple[List[Tuple[str, bytes]], Optional[Tuple[str, bytes]]]:
+        """
+        编码编辑输入：缩小到请求的输出分辨率并选择体积最小的合适格式
+
+        提供蒙版时输入图像统一使用 PNG（API 要求蒙版与图像格式、尺寸一致）。
+
+        Args:
+            image: 输入图像张量 (B, H, W, C)
+            size: 请求的输出尺寸（例如 1024x1536）
+            mask: 可选的重绘蒙版（作用于第一张输入图像）
+
+        Returns:
+            (图像名称和字节数据的列表, 蒙版名称和字节数据或 None)
+        """
+        from .image_utils import ImageProcessor
+
+        width, height = (int(v) for v in size.split("x"))
+        image_format = self.CONFIG["upload_format"] if mask is None else "PNG"
+        images = ImageProcessor.prepare_images_for_api(image, target_size=(width, height), image_format=image_format)
+        if mask is None:
+            return images, None
+        frame_size = (image.shape[-2], image.shape[-3])
+        return images, ImageProcessor.prepare_mask_for_api(mask, frame_size, target_size=(width, height))
+
+    @classmethod
+    def IS_CHANGED(s, force_refresh: bool = False, **kwargs):
+        # 强制刷新时返回 NaN（NaN != NaN），让 ComfyUI 每次都重新执行节点
+        return float("nan") if force_refresh else ""
+
     def generate_image(self, prompt: str, model: str, size: str, quality: str, provider: str, 
                       image: Optional[torch.Tensor] = None, api_key: Optional[str] = None, 
                       azure_endpoint: Optional[str] = None, azure_api_version: Optional[str] = None, 
-                      azure_deployment: Optional[str] = None) -> Tuple[torch.Tensor]:
+                      azure_deployment: Optional[str] = None, priority: int = 0,
+                      use_cache: bool = True, force_refresh: bool = False, partial_images: int = 0,
+                      mask: Optional[torch.Tensor] = None, budget_user: str = "",
+                      edit_mode: str = "reference", on_frame_error: str = "fail", n: int = 1,
+                      unique_id: Optional[str] = None) -> Tuple[torch.Tensor]:
         """
         生成或编辑图像
         
@@ -167,67 +714,63 @@ class OpenAIImageAPI:
             azure_endpoint: Azure 端点
             azure_api_version: Azure API 版本
             azure_deployment: Azure 部署名称
+            priority: 调度优先级，数值越大越先执行
+            use_cache: 是否使用响应缓存
+            force_refresh: 忽略已有缓存重新调用 API
+            partial_images: 流式返回的部分图像数量（0 表示不使用流式预览）
+            mask: 可选的重绘蒙版（1 表示需要重绘的区域，作用于第一张输入图像）
+            budget_user: 用量核算与预算控制使用的用户或工作流标签
+            edit_mode: reference 把整批输入作为一次编辑的参考图；per_frame 用同一提示逐帧并发编辑
+            on_frame_error: 逐帧编辑时某帧失败的处理方式（fail 报错，use_input 用输入帧代替）
+            n: 一次调用返回的图像数量，全部结果组成一个批量
+            unique_id: ComfyUI 节点 ID（隐藏输入）
             
         Returns:
             生成的图像张量
         """
         operation_type = "editing" if image is not None and image.numel() > 0 else "generation"
         logger.info(f"Starting image {operation_type} with prompt: {prompt[:50]}...")
+        metrics = Metrics.get()
         
         try:
             # 初始化客户端
-            if provider == "azure":
-                # 创建 Azure 配置
-                config = AzureConfigManager.create_config(
-                    endpoint=azure_endpoint,
-                    api_key=api_key,
-                    api_version=azure_api_version,
-                    deployment=azure_deployment
+            with metrics.stage("config"):
+                client, model_name = self._resolve_client(
+                    provider, model, api_key, azure_endpoint, azure_api_version, azure_deployment
                 )
-                
-                # 验证配置
-                AzureConfigManager.validate_config(config)
-                
-                # 创建客户端
-                client = self._create_azure_client(config)
-                model_name = config.deployment
-                
-                # 记录配置摘要（隐藏敏感信息）
-                config_summary = AzureConfigManager.get_config_summary(config)
-                logger.info(f"Using Azure OpenAI config: {config_summary}")
-                
-            else:
-                # 处理 OpenAI 配置
-                key = api_key.strip() if api_key else None
-                key = key or os.getenv("OPENAI_API_KEY")
-                
-                self._validate_openai_config(key)
-                client = self._create_openai_client(key)
-                model_name = model
-            
+
             # 调用相应的 API
-            if operation_type == "generation":
-                logger.info("Calling image generation API")
-                result = client.images.generate(
-                    model=model_name,
-                    prompt=prompt,
-                    size=size,
-                    quality=quality
-                )
-            else:
-                logger.info("Calling image editing API")
-                images = ImageProcessor.prepare_images_for_api(image)
-                
-                result = client.images.edit(
-                    model=model_name,
-                    image=images,
-                    prompt=prompt,
-                    size=size,
-                    quality=quality
-                )
-            
-            # 处理响应
-            image_tensor = ImageProcessor.base64_to_tensor(result.data[0].b64_json)
+            images, mask_upload = None, None
+            if mask is not None and operation_type != "editing":
+                raise ValueError("A mask requires an input image to edit")
+            if operation_type == "editing" and edit_mode == "per_frame":
+                if n > 1:
+                    raise ValueError("n > 1 is not supported with per_frame edits")
+                request = ImageRequest(provider=provider, model=model_name, prompt=prompt, size=size,
+                                       quality=quality, user=budget_user.strip())
+                image_tensor = self._edit_frames(client, request, image, mask, priority, use_cache,
+                                                 force_refresh, on_frame_error)
+                logger.info(f"Per-frame image editing completed successfully: {tuple(image_tensor.shape)}")
+                return (image_tensor,)
+            if operation_type == "editing":
+                with metrics.stage("encode"):
+                    images, mask_upload = self._prepare_upload(image, size, mask)
+            request = ImageRequest(
+                provider=provider,
+                model=model_name,
+                prompt=prompt,
+                size=size,
+                quality=quality,
+                images=tuple(images) if images else None,
+                mask=mask_upload,
+                n=n,
+                user=budget_user.strip()
+            )
+            preview = None
+            if partial_images > 0:
+                from .preview import PreviewReporter
+                preview = PreviewReporter(partial_images, unique_id)
+            image_tensor = self._run_request(client, request, priority, use_cache, force_refresh, preview)
             logger.info(f"Image {operation_type} completed successfully")
             
             return (image_tensor,)
@@ -237,14 +780,252 @@ class OpenAIImageAPI:
             logger.error(error_message)
             print(f"{RED}{error_message}{RESET}")
             raise RuntimeError(error_message) from e
+        finally:
+            metrics.dump()
+
+
+class OpenAIImageBatchAPI(OpenAIImageAPI):
+    """
+    A node for generating a batch of images concurrently using OpenAI's Image API
+
+    Each non-empty line of `prompts` is one prompt; every prompt is requested `n` times.
+    Requests are dispatched concurrently (at most `max_concurrency` in flight) and all
+    results are stacked, in prompt order, into a single (B, H, W, C) IMAGE tensor, so the
+    wall time of a batch approaches the latency of the slowest request.
+    """
+
+    @classmethod
+    def INPUT_TYPES(s):
+        input_types = super().INPUT_TYPES()
+        required = {
+            "prompts": ("STRING", {
+                "multiline": True,
+                "default": "A beautiful image"
+            }),
+        }
+        required.update({k: v for k, v in input_types["required"].items() if k != "prompt"})
+        required.update({
+            "n": ("INT", {"default": 1, "min": 1, "max": 64}),
+            "max_concurrency": ("INT", {"default": 4, "min": 1, "max": 32}),
+        })
+        optional = {k: v for k, v in input_types["optional"].items()
+                    if k not in ("partial_images", "edit_mode", "on_frame_error", "n")}
+        return {"required": required, "optional": optional, "hidden": input_types["hidden"]}
+
+    FUNCTION = "generate_batch"
+
+    @staticmethod
+    def parse_prompts(prompts: str, n: int) -> List[Tuple[str, int]]:
+        """
+        将多行提示拆分为请求列表
+
+        Args:
+            prompts: 多行提示，每行一个
+            n: 每个提示的图像数量
+
+        Returns:
+            按顺序展开后的 (提示, 变体序号) 列表；重复的提示行继续编号，
+            避免被当作相同请求合并
+        """
+        lines = [line.strip() for line in prompts.splitlines() if line.strip()]
+        seen: Dict[str, int] = {}
+        expanded = []
+        for line in lines:
+            start = seen.get(line, 0)
+            expanded.extend((line, start + i) for i in range(n))
+            seen[line] = start + n
+        return expanded
+
+    def generate_batch(self, prompts: str, model: str, size: str, quality: str, provider: str,
+                       n: int = 1, max_concurrency: int = 4,
+                       image: Optional[torch.Tensor] = None, api_key: Optional[str] = None,
+                       azure_endpoint: Optional[str] = None, azure_api_version: Optional[str] = None,
+                       azure_deployment: Optional[str] = None, priority: int = 0,
+                       use_cache: bool = True, force_refresh: bool = False,
+                       mask: Optional[torch.Tensor] = None, budget_user: str = "",
+                       unique_id: Optional[str] = None) -> Tuple[torch.Tensor]:
+        """
+        并发生成或编辑一批图像
+
+        Args:
+            prompts: 多行提示，每行一个
+            model: 使用的模型
+            size: 图像尺寸
+            quality: 图像质量
+            provider: 服务提供商 (openai 或 azure)
+            n: 每个提示的图像数量
+            max_concurrency: 最大并发请求数
+            image: 可选的输入图像（用于编辑，所有请求共享）
+            api_key: API 密钥
+            azure_endpoint: Azure 端点
+            azure_api_version: Azure API 版本
+            azure_deployment: Azure 部署名称
+            priority: 调度优先级，数值越大越先执行
+            use_cache: 是否使用响应缓存
+            force_refresh: 忽略已有缓存重新调用 API
+            mask: 可选的重绘蒙版（所有请求共享）
+            budget_user: 用量核算与预算控制使用的用户或工作流标签
+            unique_id: ComfyUI 节点 ID（隐藏输入）
+
+        Returns:
+            批量图像张量 (B, H, W, C)
+        """
+        operation_type = "editing" if image is not None and image.numel() > 0 else "generation"
+        prompt_list = self.parse_prompts(prompts, n)
+        if not prompt_list:
+            raise RuntimeError("At least one non-empty prompt is required for batch generation.")
+        logger.info(f"Starting batch image {operation_type} of {len(prompt_list)} requests "
+                    f"(max {max_concurrency} in flight)")
+
+        metrics = Metrics.get()
+
+        try:
+            with metrics.stage("config"):
+                client, model_name = self._resolve_client(
+                    provider, model, api_key, azure_endpoint, azure_api_version, azure_deployment
+                )
+            images, mask_upload = None, None
+            if mask is not None and operation_type != "editing":
+                raise ValueError("A mask requires an input image to edit")
+            if operation_type == "editing":
+                with metrics.stage("encode"):
+                    images, mask_upload = self._prepare_upload(image, size, mask)
+            requests = [
+                ImageRequest(
+                    provider=provider,
+                    model=model_name,
+                    prompt=p,
+                    size=size,
+                    quality=quality,
+                    images=tuple(images) if images else None,
+                    variant=variant,
+                    mask=mask_upload,
+                    user=budget_user.strip()
+                )
+                for p, variant in prompt_list
+            ]
+
+            workers = min(max_concurrency, len(requests))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="openai-image-batch") as executor:
+                futures = [
+                    executor.submit(self._fetch_images, client, request, priority, use_cache, force_refresh)
+                    for request in requests
+                ]
+                png_images = [future.result()[0] for future in futures]
+
+            # 一次性并行解码到预分配的批量张量
+            from .image_utils import ImageProcessor
+            with metrics.stage("decode"):
+                batch = ImageProcessor.decode_images(png_images)
+            logger.info(f"Batch image {operation_type} completed successfully: {tuple(batch.shape)}")
+            return (batch,)
+
+        except Exception as e:
+            error_message = f"Error in batch image {operation_type}: {str(e)}"
+            logger.error(error_message)
+            print(f"{RED}{error_message}{RESET}")
+            raise RuntimeError(error_message) from e
+        finally:
+            metrics.dump()
+
+class OpenAIImageSubmitAPI(OpenAIImageAPI):
+    """
+    A node that starts an image generation/edit in the background
+
+    Takes the same parameters as the main node but returns immediately with an
+    OPENAI_IMAGE_JOB handle. The request runs on a package-managed executor while
+    ComfyUI executes other branches; connect the handle to the collect node to
+    get the image.
+    """
+
+    @classmethod
+    def INPUT_TYPES(s):
+        input_types = super().INPUT_TYPES()
+        optional = {k: v for k, v in input_types["optional"].items() if k != "partial_images"}
+        return {"required": input_types["required"], "optional": optional, "hidden": input_types["hidden"]}
+
+    RETURN_TYPES = ("OPENAI_IMAGE_JOB",)
+    RETURN_NAMES = ("job",)
+    FUNCTION = "submit_image"
+
+    def submit_image(self, prompt: str, model: str, size: str, quality: str, provider: str,
+                     unique_id: Optional[str] = None, **kwargs) -> Tuple[ImageJob]:
+        """
+        在后台提交图像生成或编辑
+
+        Args:
+            prompt: 图像生成/编辑提示
+            model: 使用的模型
+            size: 图像尺寸
+            quality: 图像质量
+            provider: 服务提供商 (openai 或 azure)
+            unique_id: ComfyUI 节点 ID（隐藏输入）
+            **kwargs: 与 generate_image 相同的可选参数
+
+        Returns:
+            任务句柄
+        """
+        job = ImageJobManager.get().submit(
+            self.generate_image, prompt, model, size, quality, provider, unique_id=unique_id,
+            description=prompt[:50], **kwargs
+        )
+        logger.info(f"Submitted image job {job.id} with prompt: {prompt[:50]}...")
+        return (job,)
+
+
+class OpenAIImageCollectAPI:
+    """
+    A node that waits for a background image job and outputs its image
+
+    Errors raised by the request are reported here.
+    """
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "job": ("OPENAI_IMAGE_JOB",),
+            }
+        }
+
+    RETURN_TYPES = ("IMAGE",)
+    FUNCTION = "collect_image"
+    CATEGORY = "image/OpenAI"
+
+    def collect_image(self, job: ImageJob) -> Tuple[torch.Tensor]:
+        """
+        等待后台任务完成并返回图像
+
+        Args:
+            job: 提交节点返回的任务句柄
+
+        Returns:
+            生成的图像张量
+
+        Raises:
+            RuntimeError: 任务失败或已不可用
+        """
+        metrics = Metrics.get()
+        try:
+            with metrics.stage("collect"):
+                return ImageJobManager.get().result(job)
+        finally:
+            metrics.dump()
+
 
 # A dictionary that contains all nodes you want to export with their names
 # NOTE: names should be globally unique
 NODE_CLASS_MAPPINGS = {
-    "OpenAI Image API": OpenAIImageAPI
+    "OpenAI Image API": OpenAIImageAPI,
+    "OpenAI Image Batch API": OpenAIImageBatchAPI,
+    "OpenAI Image Submit API": OpenAIImageSubmitAPI,
+    "OpenAI Image Collect API": OpenAIImageCollectAPI
 }
 
 # A dictionary that contains the friendly/humanly readable titles for the nodes
 NODE_DISPLAY_NAME_MAPPINGS = {
-    "OpenAI Image API": "OpenAI/Azure OpenAI Image API with gpt-image-1"
+    "OpenAI Image API": "OpenAI/Azure OpenAI Image API with gpt-image-1",
+    "OpenAI Image Batch API": "OpenAI/Azure OpenAI Image Batch API with gpt-image-1",
+    "OpenAI Image Submit API": "OpenAI/Azure OpenAI Image Submit (background)",
+    "OpenAI Image Collect API": "OpenAI/Azure OpenAI Image Collect"
 }
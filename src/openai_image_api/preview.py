@@ -0,0 +1,99 @@
+"""
+流式预览模块
+
+该模块负责把 gpt-image-1 流式返回的部分图像推送到 ComfyUI，包括：
+- 通过 comfy.utils.ProgressBar 在节点上显示预览图与进度
+- 通过 PromptServer 发送 openai_image_api.partial_image 事件（web/js 扩展使用）
+
+在 ComfyUI 之外运行（例如测试或命令行）时，ComfyUI 模块不可用，预览只记录日志。
+"""
+
+import base64
+import io
+import logging
+import threading
+from typing import Optional
+
+from PIL import Image
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+try:
+    import comfy.utils as comfy_utils
+except ImportError:
+    comfy_utils = None
+
+try:
+    from server import PromptServer
+except ImportError:
+    PromptServer = None
+
+
+class PreviewReporter:
+    """部分图像预览推送器"""
+
+    # 默认配置
+    DEFAULT_CONFIG = {
+        "max_preview_size": 512,
+    }
+
+    EVENT_NAME = "openai_image_api.partial_image"
+
+    def __init__(self, partial_images: int, node_id: Optional[str] = None):
+        """
+        Args:
+            partial_images: 请求的部分图像数量（1-3）
+            node_id: ComfyUI 节点 ID（隐藏输入 UNIQUE_ID）
+        """
+        self.partial_images = partial_images
+        self.node_id = node_id
+        self.total = partial_images + 1
+        self._latest = -1
+        self._lock = threading.Lock()
+        # ProgressBar 需在节点执行线程中创建，以便关联当前执行的节点
+        self._progress = comfy_utils.ProgressBar(self.total) if comfy_utils is not None else None
+
+    def on_partial(self, index: int, b64_json: str) -> None:
+        """
+        处理一张部分图像（在线程池中调用）
+
+        Args:
+            index: 部分图像序号（从 0 开始）
+            b64_json: base64 编码的图像
+        """
+        try:
+            image = Image.open(io.BytesIO(base64.b64decode(b64_json)))
+            image.load()
+        except Exception as e:
+            logger.warning(f"Failed to decode partial image {index}: {e}")
+            return
+
+        # 解码在线程池中并行进行，只推送比已显示的更新的预览
+        with self._lock:
+            if index <= self._latest:
+                return
+            self._latest = index
+
+            logger.info(f"Received partial image {index + 1}/{self.partial_images}: {image.size}")
+            if self._progress is not None:
+                max_size = self.DEFAULT_CONFIG["max_preview_size"]
+                self._progress.update_absolute(index + 1, self.total, ("JPEG", image.convert("RGB"), max_size))
+            self._send_event({"index": index, "total": self.partial_images, "done": False})
+
+    def complete(self) -> None:
+        """标记流式生成完成（之后到达的部分图像不再推送）"""
+        with self._lock:
+            self._latest = self.partial_images
+            if self._progress is not None:
+                self._progress.update_absolute(self.total, self.total)
+            self._send_event({"index": self.partial_images, "total": self.partial_images, "done": True})
+
+    def _send_event(self, data: dict) -> None:
+        """向前端发送事件"""
+        if PromptServer is None or self.node_id is None:
+            return
+        try:
+            PromptServer.instance.send_sync(self.EVENT_NAME, {"node": self.node_id, **data})
+        except Exception as e:
+            logger.debug(f"Failed to send partial image event: {e}")
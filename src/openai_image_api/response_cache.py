@@ -0,0 +1,173 @@
+"""
+响应缓存模块
+
+该模块提供了基于内容寻址的磁盘缓存，包括：
+- 以请求哈希为键保存 API 返回的 PNG 数据
+- 按总大小限制的 LRU 淘汰策略
+- 原子写入，进程崩溃不会留下半个缓存条目
+
+环境变量：
+- OPENAI_IMAGE_API_CACHE_DIR: 缓存目录
+- OPENAI_IMAGE_API_CACHE_MAX_MB: 缓存总大小上限（MB）
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """内容寻址的 PNG 响应缓存"""
+
+    # 默认配置
+    DEFAULT_CONFIG = {
+        "cache_dir": os.path.join(os.path.expanduser("~"), ".cache", "comfy_openai_image_api", "responses"),
+        "max_mb": 1024,
+    }
+
+    _instance: Optional["ResponseCache"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = Path(cache_dir or os.getenv("OPENAI_IMAGE_API_CACHE_DIR") or self.DEFAULT_CONFIG["cache_dir"])
+        if max_bytes is None:
+            max_mb = float(os.getenv("OPENAI_IMAGE_API_CACHE_MAX_MB") or self.DEFAULT_CONFIG["max_mb"])
+            max_bytes = int(max_mb * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index: Optional[Dict[str, Tuple[float, int]]] = None
+
+    @classmethod
+    def get(cls) -> "ResponseCache":
+        """获取进程共享的缓存实例"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def lookup(self, key: str) -> Optional[List[bytes]]:
+        """
+        查找缓存条目
+
+        Args:
+            key: 请求哈希
+
+        Returns:
+            缓存的 PNG 数据列表，未命中时返回 None
+        """
+        entry_dir = self._entry_dir(key)
+        files = sorted(entry_dir.glob("*.png"), key=lambda p: int(p.stem)) if entry_dir.is_dir() else []
+        if not files:
+            return None
+
+        try:
+            data = [f.read_bytes() for f in files]
+            now = time.time()
+            os.utime(entry_dir, (now, now))
+        except OSError as e:
+            logger.warning(f"Failed to read cache entry {key[:12]}: {e}")
+            return None
+
+        with self._lock:
+            index = self._load_index()
+            index[key] = (time.time(), sum(len(d) for d in data))
+        logger.info(f"Response cache hit: {key[:12]}")
+        return data
+
+    def store(self, key: str, images: List[bytes]) -> None:
+        """
+        写入缓存条目并按需淘汰最久未使用的条目
+
+        Args:
+            key: 请求哈希
+            images: PNG 数据列表
+        """
+        if not images:
+            return
+        size = sum(len(d) for d in images)
+        if size > self.max_bytes:
+            logger.debug(f"Skipping cache store for {key[:12]}: {size} bytes exceeds cache size")
+            return
+
+        entry_dir = self._entry_dir(key)
+        tmp_dir: Optional[Path] = None
+        try:
+            entry_dir.parent.mkdir(parents=True, exist_ok=True)
+            tmp_dir = Path(tempfile.mkdtemp(prefix=".tmp-", dir=entry_dir.parent))
+            for i, data in enumerate(images):
+                (tmp_dir / f"{i}.png").write_bytes(data)
+            if entry_dir.exists():
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+        except OSError as e:
+            logger.warning(f"Failed to write cache entry {key[:12]}: {e}")
+            if tmp_dir is not None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        with self._lock:
+            index = self._load_index()
+            index[key] = (time.time(), size)
+            self._evict(index)
+        logger.debug(f"Stored {len(images)} image(s) in response cache: {key[:12]}")
+
+    def clear(self) -> None:
+        """删除全部缓存条目"""
+        with self._lock:
+            shutil.rmtree(self.root, ignore_errors=True)
+            self._index = {}
+
+    def total_bytes(self) -> int:
+        """当前缓存总大小"""
+        with self._lock:
+            return sum(size for _, size in self._load_index().values())
+
+    def path(self, key: str) -> Path:
+        """
+        缓存条目目录（条目可能不存在或已被淘汰）
+
+        Args:
+            key: 请求哈希
+
+        Returns:
+            条目目录，其中的文件名为 0.png、1.png ...
+        """
+        return self._entry_dir(key)
+
+    def _entry_dir(self, key: str) -> Path:
+        """缓存条目目录"""
+        return self.root / key[:2] / key
+
+    def _load_index(self) -> Dict[str, Tuple[float, int]]:
+        """首次使用时扫描缓存目录建立 LRU 索引（调用方需持有锁）"""
+        if self._index is None:
+            self._index = {}
+            if self.root.is_dir():
+                for entry_dir in self.root.glob("*/*"):
+                    if not entry_dir.is_dir() or entry_dir.name.startswith("."):
+                        continue
+                    try:
+                        size = sum(f.stat().st_size for f in entry_dir.glob("*.png"))
+                        self._index[entry_dir.name] = (entry_dir.stat().st_mtime, size)
+                    except OSError:
+                        continue
+        return self._index
+
+    def _evict(self, index: Dict[str, Tuple[float, int]]) -> None:
+        """淘汰最久未使用的条目直到总大小低于上限（调用方需持有锁）"""
+        total = sum(size for _, size in index.values())
+        for key, (_, size) in sorted(index.items(), key=lambda item: item[1][0]):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            del index[key]
+            total -= size
+            logger.debug(f"Evicted response cache entry: {key[:12]}")
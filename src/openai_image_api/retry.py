@@ -0,0 +1,296 @@
+"""
+重试与限流模块
+
+该模块提供了感知速率限制的重试机制，包括：
+- 错误分类（429、5xx、超时、内容过滤、其他客户端错误）
+- 解析 Retry-After / retry-after-ms 与 x-ratelimit-* 响应头
+- 带抖动的指数退避
+- 按部署维护的客户端令牌桶，端点被限流时暂停发送
+
+令牌桶只在请求引擎的事件循环中使用，不需要额外的线程锁。
+
+环境变量：
+- OPENAI_IMAGE_API_RPM: 每个部署每分钟允许发送的请求数（0 表示不限制，仅在被限流时暂停）
+"""
+
+import asyncio
+import email.utils
+import logging
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Hashable, Mapping, Optional
+
+from .metrics import Metrics
+
+if TYPE_CHECKING:
+    from .concurrency import AdaptiveLimit
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class ErrorKind:
+    """错误类别"""
+    RATE_LIMIT = "rate_limit"
+    SERVER = "server"
+    TIMEOUT = "timeout"
+    CONTENT_FILTER = "content_filter"
+    CLIENT = "client"
+    UNKNOWN = "unknown"
+
+    RETRYABLE = frozenset({RATE_LIMIT, SERVER, TIMEOUT})
+
+
+CONTENT_FILTER_CODES = frozenset({"content_filter", "content_policy_violation", "moderation_blocked"})
+
+
+def classify_error(error: BaseException) -> str:
+    """
+    对 API 调用异常进行分类
+
+    Args:
+        error: 调用时抛出的异常
+
+    Returns:
+        ErrorKind 中的类别
+    """
+    import openai
+
+    if isinstance(error, (openai.APITimeoutError, asyncio.TimeoutError)):
+        return ErrorKind.TIMEOUT
+    if isinstance(error, openai.APIConnectionError):
+        return ErrorKind.TIMEOUT
+
+    status = getattr(error, "status_code", None)
+    if status is None:
+        return ErrorKind.UNKNOWN
+    if status == 429:
+        return ErrorKind.RATE_LIMIT
+    if status >= 500:
+        return ErrorKind.SERVER
+    if status == 408:
+        return ErrorKind.TIMEOUT
+    if getattr(error, "code", None) in CONTENT_FILTER_CODES:
+        return ErrorKind.CONTENT_FILTER
+    return ErrorKind.CLIENT
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    解析 x-ratelimit-reset-* 风格的时长（例如 "250ms"、"6m0s"、"1.5"）
+
+    Args:
+        value: 响应头中的时长字符串
+
+    Returns:
+        秒数，无法解析时返回 None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def retry_after_seconds(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """
+    从响应头中读取服务端建议的等待时间
+
+    Args:
+        headers: 响应头
+
+    Returns:
+        等待秒数，未提供或无法解析时返回 None
+    """
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000.0
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+        try:
+            parsed = email.utils.parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            # 格式错误的响应头不能覆盖原始 API 错误
+            return None
+        if parsed is not None:
+            return max(0.0, parsed.timestamp() - time.time())
+    return None
+
+
+@dataclass
+class RetryPolicy:
+    """重试策略"""
+    max_retries: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次重试前的等待时间（full jitter 指数退避）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class TokenBucket:
+    """单个部署的客户端令牌桶"""
+
+    def __init__(self, requests_per_minute: float = 0):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1.0, self.rate * 10)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def pause(self, seconds: float) -> None:
+        """暂停发送直到指定时长之后（只会延长，不会缩短）"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def observe_headers(self, headers: Optional[Mapping[str, str]]) -> None:
+        """根据 x-ratelimit-remaining-* 响应头提前暂停，避免触发 429"""
+        if not headers:
+            return
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining is None:
+                continue
+            try:
+                exhausted = float(remaining) <= 0
+            except ValueError:
+                continue
+            if exhausted:
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}")) or 1.0
+                logger.warning(f"Rate limit {kind} quota exhausted, pausing for {reset:.1f}s")
+                self.pause(reset)
+
+    async def acquire(self) -> None:
+        """等待直到允许发送一个请求"""
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            if self.rate <= 0:
+                return
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    """按部署维护的令牌桶注册表"""
+
+    _buckets: Dict[str, TokenBucket] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_bucket(cls, key: str) -> TokenBucket:
+        """
+        获取部署对应的令牌桶
+
+        Args:
+            key: 部署标识（端点 + 部署名称）
+
+        Returns:
+            TokenBucket 对象
+        """
+        with cls._lock:
+            bucket = cls._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(float(os.getenv("OPENAI_IMAGE_API_RPM") or 0))
+                cls._buckets[key] = bucket
+            return bucket
+
+
+async def call_with_retry(call: Callable[[], Awaitable[Any]],
+                          policy: RetryPolicy,
+                          bucket: Optional[TokenBucket] = None,
+                          description: str = "image API call",
+                          limit: Optional["AdaptiveLimit"] = None,
+                          cost_class: Hashable = None) -> Any:
+    """
+    执行调用，按错误类别重试
+
+    调用返回原始响应（带 headers 与 parse()）时，会读取其限流响应头并返回解析后的结果。
+
+    Args:
+        call: 返回协程的可调用对象，每次尝试调用一次
+        policy: 重试策略
+        bucket: 可选的令牌桶
+        description: 日志中使用的调用描述
+        limit: 可选的自适应并发控制器，每次尝试后报告耗时或错误类别
+        cost_class: 报告耗时时使用的请求成本类别
+
+    Returns:
+        调用结果
+
+    Raises:
+        最后一次尝试的异常（不可重试的错误、或服务端要求等待超过 max_delay 时会立即抛出）
+    """
+    attempt = 0
+    while True:
+        if bucket is not None:
+            await bucket.acquire()
+        started = time.monotonic()
+        try:
+            response = await call()
+        except Exception as e:
+            kind = classify_error(e)
+            if limit is not None:
+                limit.on_failure(kind, started)
+            response_headers = getattr(getattr(e, "response", None), "headers", None)
+            server_delay = retry_after_seconds(response_headers)
+            # 服务端要求的等待时间也受 max_delay 限制，超过上限时直接失败而不是长时间挂起
+            too_long = server_delay is not None and server_delay > policy.max_delay
+            delay = min(server_delay, policy.max_delay) if server_delay is not None else policy.backoff(attempt)
+            if bucket is not None:
+                bucket.observe_headers(response_headers)
+                if kind == ErrorKind.RATE_LIMIT:
+                    bucket.pause(delay)
+
+            if kind not in ErrorKind.RETRYABLE or attempt >= policy.max_retries or too_long:
+                if kind in ErrorKind.RETRYABLE and too_long:
+                    logger.error(f"{description} failed: server asked to retry after {server_delay:.0f}s, "
+                                 f"above the {policy.max_delay:.0f}s limit ({kind})")
+                elif kind in ErrorKind.RETRYABLE and policy.max_retries > 0:
+                    logger.error(f"{description} failed after {attempt + 1} attempt(s) ({kind})")
+                raise
+
+            attempt += 1
+            Metrics.get().inc("retries_total", kind=kind)
+            logger.warning(f"{description} hit {kind} error ({e}), retry {attempt}/{policy.max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+
+        if limit is not None:
+            limit.on_success(time.monotonic() - started, started, cost_class)
+        headers = getattr(response, "headers", None)
+        if bucket is not None:
+            bucket.observe_headers(headers)
+        parse = getattr(response, "parse", None)
+        return parse() if callable(parse) else response
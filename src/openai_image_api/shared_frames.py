@@ -0,0 +1,232 @@
+"""
+共享帧存储模块
+
+该模块提供了同一主机上多个 ComfyUI 进程共享的解码结果存储，包括：
+- 以请求哈希为键保存解码后的 uint8 帧 (B, H, W, C)，默认位于 /dev/shm（内存文件系统）
+- 读取时通过 mmap 直接映射文件并转换为浮点张量，不再解码 PNG
+- 原子发布（临时文件 + rename），读取方不会看到半个条目
+- 按总大小限制的 LRU 淘汰，多进程之间以文件修改时间为准；写入前先腾出空间，
+  空间不足（ENOSPC）时淘汰后重试一次
+- 默认目录按用户区分；目录不属于当前用户或可被其他用户写入时禁用存储，
+  避免其他本地用户预先放入伪造的条目
+- 默认上限不超过存储目录所在文件系统可用空间的一部分（容器中的 /dev/shm 通常只有 64MB）
+
+环境变量：
+- OPENAI_IMAGE_API_SHARED_FRAMES: 设为 0 时禁用共享帧存储
+- OPENAI_IMAGE_API_SHARED_FRAMES_DIR: 存储目录
+- OPENAI_IMAGE_API_SHARED_FRAMES_MAX_MB: 存储总大小上限（MB），设置后不再按可用空间限制
+"""
+
+import errno
+import logging
+import os
+import stat
+import struct
+import tempfile
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import numpy as np
+    import torch
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+def _default_dir() -> str:
+    """优先使用 /dev/shm，其他平台退回系统临时目录（目录名包含用户 ID）"""
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    uid = os.getuid() if hasattr(os, "getuid") else os.getenv("USERNAME", "user")
+    return os.path.join(base, f"comfy_openai_image_api_frames_{uid}")
+
+
+class SharedFrameStore:
+    """多进程共享的解码帧存储"""
+
+    # 默认配置
+    DEFAULT_CONFIG = {
+        "max_mb": 1024,
+        # 未显式设置上限时，最多使用文件系统可用空间的比例
+        "free_fraction": 0.25,
+        "suffix": ".u8",
+    }
+
+    # 文件头：魔数、帧数、高、宽、通道数
+    HEADER = struct.Struct("<4sIIII")
+    MAGIC = b"OIF1"
+
+    _instance: Optional["SharedFrameStore"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.root = Path(root or os.getenv("OPENAI_IMAGE_API_SHARED_FRAMES_DIR") or _default_dir())
+        if max_bytes is None and os.getenv("OPENAI_IMAGE_API_SHARED_FRAMES_MAX_MB"):
+            max_bytes = int(float(os.getenv("OPENAI_IMAGE_API_SHARED_FRAMES_MAX_MB")) * 1024 * 1024)
+        if max_bytes is None:
+            max_bytes = int(self.DEFAULT_CONFIG["max_mb"] * 1024 * 1024)
+            free = self._free_bytes()
+            if free is not None:
+                max_bytes = min(max_bytes, int(free * self.DEFAULT_CONFIG["free_fraction"]))
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._trusted: Optional[bool] = None
+
+    @classmethod
+    def get(cls) -> Optional["SharedFrameStore"]:
+        """获取进程共享的存储实例，禁用时返回 None"""
+        if os.getenv("OPENAI_IMAGE_API_SHARED_FRAMES", "1").strip().lower() in ("0", "false", "no", "off"):
+            return None
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def lookup(self, key: str) -> Optional["torch.Tensor"]:
+        """
+        读取已发布的帧
+
+        Args:
+            key: 请求哈希
+
+        Returns:
+            图像张量 (B, H, W, C)，取值 [0, 1]；未命中或条目损坏时返回 None
+        """
+        import numpy as np
+        import torch
+
+        if not self._check_root():
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                magic, count, height, width, channels = self.HEADER.unpack(f.read(self.HEADER.size))
+            if magic != self.MAGIC:
+                raise ValueError("bad header")
+            shape = (count, height, width, channels)
+            # 写时复制映射：不复制文件内容，也不会修改共享条目
+            pixels = np.memmap(path, dtype=np.uint8, mode="c", offset=self.HEADER.size, shape=shape)
+            frames = torch.from_numpy(pixels).to(torch.float32).div_(255.0)
+            del pixels
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Ignoring unreadable shared frame entry {key[:12]}: {e}")
+            return None
+        logger.info(f"Shared frame store hit: {key[:12]} {tuple(frames.shape)}")
+        return frames
+
+    def publish(self, key: str, pixels: "np.ndarray") -> None:
+        """
+        发布解码后的帧并按需淘汰最久未使用的条目
+
+        Args:
+            key: 请求哈希
+            pixels: uint8 数组 (B, H, W, C)
+        """
+        import numpy as np
+
+        pixels = np.ascontiguousarray(pixels)
+        size = self.HEADER.size + pixels.nbytes
+        if pixels.ndim != 4 or size > self.max_bytes or not self._check_root():
+            return
+        path = self._path(key)
+        # 先腾出空间再写入：tmpfs 写满后写入会一直失败，发布之后再淘汰就来不及了
+        self._evict(reserve=size)
+        for attempt in range(2):
+            tmp_path: Optional[str] = None
+            try:
+                fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=self.root)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(self.HEADER.pack(self.MAGIC, *pixels.shape))
+                    f.write(pixels.data)
+                os.replace(tmp_path, path)
+                break
+            except OSError as e:
+                if tmp_path is not None and os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                if attempt == 0 and e.errno == errno.ENOSPC:
+                    # 文件系统已满（其他进程或其他程序占用），淘汰足够的条目后重试一次
+                    logger.debug(f"Shared frame store is out of space, evicting before retrying {key[:12]}")
+                    self._evict(reserve=size, shortfall=size - (self._free_bytes() or 0))
+                    continue
+                logger.warning(f"Failed to publish shared frames {key[:12]}: {e}")
+                return
+        logger.debug(f"Published {pixels.shape[0]} frame(s) to shared store: {key[:12]}")
+
+    def _check_root(self) -> bool:
+        """
+        创建并检查存储目录（首次使用时检查一次）
+
+        目录必须是当前用户拥有的真实目录，且组与其他用户不可写；
+        否则其他本地用户可以在可预测的请求哈希下放入伪造的帧。
+
+        Returns:
+            目录可信时返回 True，否则记录警告并返回 False（存储被禁用）
+        """
+        if self._trusted is not None:
+            return self._trusted
+        try:
+            self.root.mkdir(mode=0o700, parents=True, exist_ok=True)
+            info = os.lstat(self.root)
+        except OSError as e:
+            logger.warning(f"Shared frame store disabled, cannot use {self.root}: {e}")
+            self._trusted = False
+            return False
+        problem = None
+        if not stat.S_ISDIR(info.st_mode):
+            problem = "not a directory"
+        elif hasattr(os, "getuid") and info.st_uid != os.getuid():
+            problem = f"owned by uid {info.st_uid}"
+        elif info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            problem = f"writable by other users (mode {stat.S_IMODE(info.st_mode):o})"
+        if problem is not None:
+            logger.warning(f"Shared frame store disabled, {self.root} is {problem}")
+        self._trusted = problem is None
+        return self._trusted
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}{self.DEFAULT_CONFIG['suffix']}"
+
+    def _free_bytes(self) -> Optional[int]:
+        """存储目录（或其最近的已存在上级目录）所在文件系统的可用空间"""
+        path = self.root
+        while not path.exists() and path != path.parent:
+            path = path.parent
+        try:
+            stat = os.statvfs(path)
+        except (AttributeError, OSError):
+            # Windows 没有 statvfs
+            return None
+        return stat.f_bavail * stat.f_frsize
+
+    def _evict(self, reserve: int = 0, shortfall: int = 0) -> None:
+        """
+        淘汰最久未使用的条目（其他进程可能同时淘汰，删除失败直接忽略）
+
+        Args:
+            reserve: 即将写入的字节数，淘汰到总大小加上它不超过上限
+            shortfall: 至少需要释放的字节数
+        """
+        with self._lock:
+            entries = []
+            for path in self.root.glob(f"*{self.DEFAULT_CONFIG['suffix']}"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            freed = 0
+            for _, size, path in sorted(entries):
+                if total + reserve <= self.max_bytes and freed >= shortfall:
+                    break
+                try:
+                    path.unlink()
+                except OSError:
+                    continue
+                total -= size
+                freed += size
+                logger.debug(f"Evicted shared frame entry: {path.stem[:12]}")
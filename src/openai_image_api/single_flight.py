@@ -0,0 +1,81 @@
+"""
+请求合并模块
+
+该模块提供了相同请求的并发合并（single-flight），包括：
+- 以请求哈希为键，同一时刻只向上游发起一次调用
+- 后到的相同请求等待首个调用的结果（或异常）
+- 调用结束后立即移除记录，之后的请求重新调用（或命中响应缓存）
+
+多个图分支或多个用户的工作流同时提交完全相同的请求时，只消耗一次配额。
+"""
+
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """相同请求的并发合并器"""
+
+    _instance: Optional["SingleFlight"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls) -> "SingleFlight":
+        """获取进程共享的合并器实例"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def do(self, key: str, fn: Callable[[], T]) -> Tuple[T, bool]:
+        """
+        执行调用，已有相同键的调用在进行中时等待其结果
+
+        Args:
+            key: 请求哈希
+            fn: 实际调用
+
+        Returns:
+            (调用结果, 是否复用了其他调用方的结果)
+
+        Raises:
+            首个调用抛出的异常（所有等待者都会收到）
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            logger.info(f"Joining in-flight request: {key[:12]}")
+            return future.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        """进行中的不同请求数"""
+        with self._lock:
+            return len(self._calls)
@@ -1,6 +1,43 @@
 import os
 import sys
 
+import pytest
+
 # Add the project root directory to Python path
 # This allows the tests to import the project
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+@pytest.fixture(autouse=True)
+def isolated_budget_store(tmp_path, monkeypatch):
+    """Keep usage accounting from tests out of the user's budget database."""
+    from src.openai_image_api.budget import BudgetGovernor
+
+    monkeypatch.setenv("OPENAI_IMAGE_API_BUDGET_DB", str(tmp_path / "budget.sqlite"))
+    monkeypatch.setattr(BudgetGovernor, "_instance", None)
+
+
+@pytest.fixture(autouse=True)
+def isolated_journal(tmp_path, monkeypatch):
+    """Keep journal entries from tests out of the user's request journal."""
+    from src.openai_image_api.journal import Journal
+
+    monkeypatch.setenv("OPENAI_IMAGE_API_JOURNAL_DIR", str(tmp_path / "journal"))
+    monkeypatch.setattr(Journal, "_instance", None)
+
+
+@pytest.fixture(autouse=True)
+def isolated_shared_frames(tmp_path, monkeypatch):
+    """Keep decoded frames from tests out of the host-wide shared frame store."""
+    from src.openai_image_api.shared_frames import SharedFrameStore
+
+    monkeypatch.setenv("OPENAI_IMAGE_API_SHARED_FRAMES_DIR", str(tmp_path / "frames"))
+    monkeypatch.setattr(SharedFrameStore, "_instance", None)
+
+
+@pytest.fixture(autouse=True)
+def isolated_config_resolver(monkeypatch):
+    """Resolve Azure configuration afresh for every test instead of reusing another test's cache."""
+    from src.openai_image_api.azure_config import AzureConfigResolver
+
+    monkeypatch.setattr(AzureConfigResolver, "_instance", None)
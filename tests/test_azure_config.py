@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+"""Tests for the versioned Azure configuration resolver."""
+
+import dataclasses
+import json
+import os
+
+import pytest
+from src.openai_image_api.azure_config import AzureConfigManager, AzureConfigResolver
+from src.openai_image_api.client_pool import ClientPool
+
+
+@pytest.fixture(autouse=True)
+def clean_environment(monkeypatch):
+    """Give each test its own environment without the host's Azure variables."""
+    environ = {k: v for k, v in os.environ.items()
+               if not any(k in names for names in AzureConfigManager.ENV_MAPPINGS.values())}
+    monkeypatch.setattr(os, "environ", environ)
+    ClientPool.clear()
+    yield
+    ClientPool.clear()
+
+
+def _touch(path, content, tick):
+    """Write a file and move its mtime forward so the change is visible on coarse clocks."""
+    path.write_text(content, encoding="utf-8")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + tick * 1_000_000_000))
+
+
+def test_resolve_is_memoized_until_environment_changes(monkeypatch, tmp_path):
+    monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", "eastus.openai.azure.com")
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY", "first")
+    resolver = AzureConfigResolver(refresh_interval=0, dotenv_path=str(tmp_path / ".env"))
+
+    config = resolver.resolve()
+    assert config.endpoint == "https://eastus.openai.azure.com"
+    assert resolver.resolve() is config
+    assert resolver.version == 1
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        config.api_key = "changed"
+
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY", "second")
+    assert resolver.resolve().api_key == "second"
+    assert resolver.version == 2
+
+
+def test_explicit_arguments_are_cached_separately(monkeypatch, tmp_path):
+    monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", "eastus.openai.azure.com")
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY", "key")
+    resolver = AzureConfigResolver(refresh_interval=0, dotenv_path=str(tmp_path / ".env"))
+
+    default = resolver.resolve()
+    override = resolver.resolve(deployment="img-east")
+    assert override.deployment == "img-east"
+    assert default.deployment == AzureConfigManager.DEFAULT_CONFIG["deployment"]
+    assert resolver.resolve(deployment="img-east") is override
+
+
+def test_dotenv_changes_are_hot_reloaded(tmp_path):
+    dotenv = tmp_path / ".env"
+    _touch(dotenv, "AZURE_OPENAI_ENDPOINT=eastus.openai.azure.com\nAZURE_OPENAI_API_KEY=old\n", 0)
+    resolver = AzureConfigResolver(refresh_interval=0, dotenv_path=str(dotenv))
+    assert resolver.resolve().api_key == "old"
+
+    _touch(dotenv, "AZURE_OPENAI_ENDPOINT=westus.openai.azure.com\nAZURE_OPENAI_API_KEY=new\n", 1)
+    config = resolver.resolve()
+    assert (config.endpoint, config.api_key) == ("https://westus.openai.azure.com", "new")
+    assert resolver.version == 2
+
+
+def test_process_environment_takes_precedence_over_dotenv(monkeypatch, tmp_path):
+    dotenv = tmp_path / ".env"
+    _touch(dotenv, "AZURE_OPENAI_ENDPOINT=eastus.openai.azure.com\nAZURE_OPENAI_API_KEY=from-file\n", 0)
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY", "from-process")
+    resolver = AzureConfigResolver(refresh_interval=0, dotenv_path=str(dotenv))
+    assert resolver.resolve().api_key == "from-process"
+
+    _touch(dotenv, "AZURE_OPENAI_API_KEY=from-file\n", 1)
+    resolver.refresh()
+    assert "AZURE_OPENAI_ENDPOINT" not in os.environ
+    assert os.environ["AZURE_OPENAI_API_KEY"] == "from-process"
+
+
+def test_refresh_interval_skips_checks(monkeypatch, tmp_path):
+    monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", "eastus.openai.azure.com")
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY", "first")
+    resolver = AzureConfigResolver(refresh_interval=3600, dotenv_path=str(tmp_path / ".env"))
+    config = resolver.resolve()
+
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY", "second")
+    assert resolver.resolve() is config
+    assert resolver.refresh(force=True) == 2
+    assert resolver.resolve().api_key == "second"
+
+
+def test_configuration_change_retires_pooled_azure_clients(monkeypatch, tmp_path):
+    monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", "eastus.openai.azure.com")
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY", "first")
+    resolver = AzureConfigResolver(refresh_interval=0, dotenv_path=str(tmp_path / ".env"))
+    config = resolver.resolve()
+    ClientPool.get_client(ClientPool.make_key("azure", config.api_key, config.endpoint), object)
+    ClientPool.get_client(ClientPool.make_key("openai", "sk-test"), object)
+
+    monkeypatch.setenv("AZURE_OPENAI_API_KEY", "second")
+    resolver.refresh()
+    assert ClientPool.size() == 1
+
+
+def test_pool_file_is_reused_until_its_content_changes(monkeypatch, tmp_path):
+    pool = tmp_path / "pool.json"
+    _touch(pool, json.dumps([{"endpoint": "eastus.openai.azure.com", "api_key": "a"}]), 0)
+    monkeypatch.setenv("AZURE_OPENAI_POOL", str(pool))
+    resolver = AzureConfigResolver(refresh_interval=0, dotenv_path=str(tmp_path / ".env"))
+
+    configs = resolver.pool_configs()
+    assert resolver.pool_configs() is configs
+
+    _touch(pool, json.dumps([{"endpoint": "eastus.openai.azure.com", "api_key": "a"},
+                             {"endpoint": "westus.openai.azure.com", "api_key": "b", "weight": 2}]), 1)
+    reloaded = resolver.pool_configs()
+    assert [c.endpoint for c in reloaded] == ["https://eastus.openai.azure.com", "https://westus.openai.azure.com"]
+    assert reloaded[1].weight == 2.0
+
+
+def test_yaml_pool_file(tmp_path):
+    pytest.importorskip("yaml")
+    pool = tmp_path / "pool.yaml"
+    pool.write_text("- endpoint: eastus.openai.azure.com\n  api_key: a\n  deployment: img-east\n", encoding="utf-8")
+    configs = AzureConfigManager.create_pool_configs(str(pool))
+    assert [(c.endpoint, c.deployment) for c in configs] == [("https://eastus.openai.azure.com", "img-east")]
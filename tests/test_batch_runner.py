@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+"""Tests for the offline batch job runner."""
+
+import json
+
+import pytest
+
+from benchmarks.mock_image_api import MockImageAPIServer, MockSettings
+from src.openai_image_api.batch_runner import BatchRunner, main
+
+
+def test_read_jobs_from_jsonl_and_csv(tmp_path):
+    """Test JSONL and CSV records become jobs with resolved image paths."""
+    (tmp_path / "in.png").write_bytes(b"png")
+    jsonl = tmp_path / "jobs.jsonl"
+    jsonl.write_text('{"id": "a", "prompt": "a cat", "n": 2}\n\n{"prompt": "edit", "images": ["in.png"]}\n')
+    csv_file = tmp_path / "jobs.csv"
+    csv_file.write_text("id,prompt,images,quality\nx,a dog,in.png;in.png,low\n")
+
+    first, second = BatchRunner.read_jobs(str(jsonl))
+    assert (first.id, first.n) == ("a", 2)
+    assert second.id == "000003"
+    assert second.images == [str(tmp_path / "in.png")]
+
+    (row,) = BatchRunner.read_jobs(str(csv_file))
+    assert (row.id, row.quality, len(row.images)) == ("x", "low", 2)
+
+    jsonl.write_text('{"prompt": ""}\n')
+    with pytest.raises(ValueError):
+        list(BatchRunner.read_jobs(str(jsonl)))
+
+
+def test_run_writes_images_and_resumes(monkeypatch, tmp_path):
+    """Test a run writes images and a manifest, and a rerun skips completed jobs."""
+    jobs = tmp_path / "jobs.jsonl"
+    jobs.write_text("".join(json.dumps({"id": f"job{i}", "prompt": f"prompt {i}"}) + "\n" for i in range(5)))
+    out = tmp_path / "out"
+
+    with MockImageAPIServer(MockSettings(width=8, height=8)) as server:
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        args = [str(jobs), "-o", str(out), "--workers", "2", "--api-key", "test-key", "--no-cache"]
+        assert main(args) == 0
+        assert sorted(p.name for p in out.glob("*.png")) == [f"job{i}.png" for i in range(5)]
+        entries = [json.loads(line) for line in (out / "manifest.jsonl").read_text().splitlines()]
+        assert sorted(e["id"] for e in entries if e["status"] == "ok") == [f"job{i}" for i in range(5)]
+
+        assert main(args) == 0
+        assert server.stats["requests"] == 5
+
+
+def test_inputs_use_the_upload_encoder_and_n_is_one_request(monkeypatch, tmp_path):
+    """Test input files are downscaled for upload and n images come from a single request."""
+    import io
+
+    from PIL import Image
+
+    Image.new("RGB", (2048, 2048), (200, 30, 30)).save(tmp_path / "big.png")
+    jobs = tmp_path / "jobs.jsonl"
+    jobs.write_text(json.dumps({"id": "edit", "prompt": "make it blue", "images": ["big.png"], "n": 3}) + "\n")
+    runner = BatchRunner(output_dir=str(tmp_path / "out"), size="1024x1024", api_key="test-key", use_cache=False)
+    requests = []
+    fetch = runner.node._fetch_images
+    monkeypatch.setattr(runner.node, "_fetch_images", lambda client, request, **kw: requests.append(request)
+                        or fetch(client, request, **kw))
+
+    with MockImageAPIServer(MockSettings(width=8, height=8)) as server:
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        assert runner.run(BatchRunner.read_jobs(str(jobs))) == {"ok": 1, "failed": 0, "skipped": 0}
+        assert server.stats["requests"] == 1
+    assert sorted(p.name for p in (tmp_path / "out").glob("*.png")) == ["edit_0.png", "edit_1.png", "edit_2.png"]
+    ((name, data),) = requests[0].images
+    assert Image.open(io.BytesIO(data)).size == (1024, 1024)
+
+
+def test_n_above_the_api_limit_is_rejected(tmp_path):
+    jobs = tmp_path / "jobs.jsonl"
+    jobs.write_text('{"prompt": "a cat", "n": 11}\n')
+    with pytest.raises(ValueError, match="n must be between"):
+        list(BatchRunner.read_jobs(str(jobs)))
+
+
+@pytest.mark.parametrize("record, message", [
+    ('{"prompt": "a cat", "n": "two"}', "Record 2: n must be an integer"),
+    ('{"prompt": "a cat", "size": "512x512"}', "Record 2: unsupported size"),
+    ('{"prompt": "a cat", "quality": "ultra"}', "Record 2: unsupported quality"),
+])
+def test_invalid_record_fields_are_rejected_with_their_line(tmp_path, record, message):
+    jobs = tmp_path / "jobs.jsonl"
+    jobs.write_text('{"prompt": "a dog"}\n' + record + "\n")
+    with pytest.raises(ValueError, match=message):
+        list(BatchRunner.read_jobs(str(jobs)))
@@ -0,0 +1,37 @@
+"""Tests for the benchmark mock image API server."""
+
+from benchmarks.mock_image_api import MockImageAPIServer, MockSettings
+
+
+def test_node_round_trip_against_mock_server(monkeypatch):
+    """Test the node generates an image through the real SDK against the mock server."""
+    from src.openai_image_api.nodes import OpenAIImageAPI
+
+    with MockImageAPIServer(MockSettings(width=16, height=16)) as server:
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        (tensor,) = OpenAIImageAPI().generate_image("a cat", "gpt-image-1", "1024x1024", "low", "openai",
+                                                    api_key="test-key", use_cache=False)
+        assert tuple(tensor.shape) == (1, 16, 16, 3)
+        assert server.stats["requests"] == 1
+
+
+def test_mock_server_retries_injected_rate_limits(monkeypatch):
+    """Test injected 429 responses are retried until the request succeeds."""
+    from src.openai_image_api.nodes import OpenAIImageAPI
+
+    settings = MockSettings(width=8, height=8, rate_limit_ratio=0.5, retry_after_ms=1)
+    with MockImageAPIServer(settings) as server:
+        monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+        node = OpenAIImageAPI()
+        monkeypatch.setitem(node.CONFIG, "max_retries", 20)
+        (tensor,) = node.generate_image("a dog", "gpt-image-1", "1024x1024", "low", "openai",
+                                        api_key="test-key", use_cache=False)
+        assert tuple(tensor.shape) == (1, 8, 8, 3)
+        assert server.stats["requests"] == server.stats["rate_limited"] + 1
+
+
+def test_node_registration_does_not_import_heavy_modules():
+    """Test importing the nodes and reading INPUT_TYPES only needs the standard library."""
+    from benchmarks.import_time import measure
+
+    assert measure(runs=1)["heavy_modules_loaded"] == []
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+"""Tests for the budget and quota governor."""
+
+import os
+
+import pytest
+
+from src.openai_image_api.budget import BudgetGovernor
+
+
+def _governor(tmp_path, **limits):
+    return BudgetGovernor(db_path=str(tmp_path / "usage.sqlite"), **limits)
+
+
+def test_estimate_scales_with_size_quality_and_count():
+    low_tokens, low_cost = BudgetGovernor.estimate("1024x1024", "low")
+    high_tokens, high_cost = BudgetGovernor.estimate("1024x1536", "high", images=2)
+    assert low_cost == pytest.approx(0.011, abs=0.001)
+    assert high_tokens > low_tokens and high_cost == pytest.approx(0.5, abs=0.01)
+
+
+def test_usage_replaces_estimate(tmp_path):
+    governor = _governor(tmp_path)
+    reservation = governor.reserve("alice", "east/gpt-image-1", "1024x1024", "high")
+    usage = {"input_tokens": 50, "output_tokens": 272, "input_tokens_details": {"text_tokens": 50, "image_tokens": 0}}
+    cost = governor.commit(reservation, usage)
+    assert cost == pytest.approx((50 * 5 + 272 * 40) / 1_000_000)
+    [row] = governor.summary()
+    assert (row["user"], row["images"], row["tokens"]) == ("alice", 1, 322)
+
+
+def test_user_budget_rejects_before_sending(tmp_path):
+    governor = _governor(tmp_path, user_daily_budget=0.2)
+    governor.reserve("alice", "east/gpt-image-1", "1024x1024", "high")
+    with pytest.raises(RuntimeError, match="alice"):
+        governor.reserve("alice", "east/gpt-image-1", "1024x1024", "high")
+    # other users are unaffected, and released reservations free the budget
+    governor.release(governor.reserve("bob", "east/gpt-image-1", "1024x1024", "high"))
+    assert [row["user"] for row in governor.summary()] == ["alice"]
+
+
+def test_images_per_minute_quota(tmp_path):
+    governor = _governor(tmp_path, ipm=2)
+    governor.reserve("alice", "east/gpt-image-1", "1024x1024", "low")
+    governor.reserve("bob", "east/gpt-image-1", "1024x1024", "low")
+    with pytest.raises(RuntimeError, match="IPM"):
+        governor.reserve("carol", "east/gpt-image-1", "1024x1024", "low")
+    governor.reserve("carol", "west/gpt-image-1", "1024x1024", "low")
+
+
+def test_node_rejects_over_budget_requests(monkeypatch):
+    """Test the node refuses to call the API once the budget is spent."""
+    from tests.test_openai_image_api import FakeClient
+    from src.openai_image_api.nodes import OpenAIImageAPI
+
+    monkeypatch.setenv("OPENAI_IMAGE_API_BUDGET_USER_USD_DAILY", "0.015")
+    node = OpenAIImageAPI()
+    client = FakeClient()
+    monkeypatch.setattr(node, "_resolve_client", lambda *args: (client, "gpt-image-1"))
+
+    node.generate_image("a cat", "gpt-image-1", "1024x1024", "low", "openai", use_cache=False, budget_user="alice")
+    with pytest.raises(RuntimeError, match="budget"):
+        node.generate_image("a dog", "gpt-image-1", "1024x1024", "low", "openai", use_cache=False, budget_user="alice")
+    assert client.images.prompts == ["a cat"]
+
+
+def test_disabled_governor_records_nothing(monkeypatch):
+    """Test the node skips accounting and budget checks when the governor is disabled."""
+    from tests.test_openai_image_api import FakeClient
+    from src.openai_image_api.nodes import OpenAIImageAPI
+
+    monkeypatch.setenv("OPENAI_IMAGE_API_BUDGET", "0")
+    monkeypatch.setenv("OPENAI_IMAGE_API_BUDGET_USER_USD_DAILY", "0.015")
+    assert BudgetGovernor.get() is None
+    node = OpenAIImageAPI()
+    client = FakeClient()
+    monkeypatch.setattr(node, "_resolve_client", lambda *args: (client, "gpt-image-1"))
+
+    for prompt in ("a cat", "a dog"):
+        node.generate_image(prompt, "gpt-image-1", "1024x1024", "low", "openai", use_cache=False, budget_user="alice")
+    assert client.images.prompts == ["a cat", "a dog"]
+    assert not os.path.exists(os.environ["OPENAI_IMAGE_API_BUDGET_DB"])
+
+
+def test_budget_database_errors_do_not_lose_paid_results(monkeypatch, tmp_path):
+    """Test a failing budget database neither blocks requests nor discards results that were paid for."""
+    import sqlite3
+
+    from tests.test_openai_image_api import FakeClient
+    from src.openai_image_api.nodes import OpenAIImageAPI
+    from src.openai_image_api.response_cache import ResponseCache
+
+    def locked(*args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(ResponseCache, "_instance", ResponseCache(cache_dir=str(tmp_path / "cache")))
+    monkeypatch.setenv("OPENAI_IMAGE_API_SHARED_FRAMES", "0")
+    node = OpenAIImageAPI()
+    client = FakeClient()
+    monkeypatch.setattr(node, "_resolve_client", lambda *args: (client, "gpt-image-1"))
+    args = ("a cat", "gpt-image-1", "1024x1024", "low", "openai")
+
+    monkeypatch.setattr(BudgetGovernor, "commit", locked)
+    (image,) = node.generate_image(*args)
+    assert image.shape == (1, 8, 8, 3)
+    node.generate_image(*args)
+    assert client.images.prompts == ["a cat"]
+
+    monkeypatch.setattr(BudgetGovernor, "reserve", locked)
+    node.generate_image("a dog", *args[1:], use_cache=False)
+    assert client.images.prompts == ["a cat", "a dog"]
+
+
+def test_release_errors_do_not_hide_the_api_error(monkeypatch):
+    """Test the original API error is raised when releasing the reservation also fails."""
+    import sqlite3
+
+    from tests.test_openai_image_api import FakeClient
+    from src.openai_image_api.nodes import OpenAIImageAPI
+
+    def locked(*args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+
+    async def broken(**kwargs):
+        raise ValueError("bad request")
+
+    node = OpenAIImageAPI()
+    client = FakeClient()
+    client.images.generate = broken
+    monkeypatch.setattr(node, "_resolve_client", lambda *args: (client, "gpt-image-1"))
+    monkeypatch.setattr(BudgetGovernor, "release", locked)
+    with pytest.raises(Exception, match="bad request"):
+        node.generate_image("a cat", "gpt-image-1", "1024x1024", "low", "openai", use_cache=False)
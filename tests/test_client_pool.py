@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+"""Tests for the process-wide client pool."""
+
+import pytest
+from src.openai_image_api.client_pool import ClientPool
+
+
+class FakeClient:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def empty_pool():
+    ClientPool.clear()
+    yield
+    ClientPool.clear()
+
+
+def test_same_key_reuses_client():
+    key = ClientPool.make_key("azure", "secret", "https://a.openai.azure.com/", "2025-04-01-preview", 60)
+    first = ClientPool.get_client(key, FakeClient)
+    second = ClientPool.get_client(key, FakeClient)
+    assert first is second
+    assert ClientPool.size() == 1
+
+
+def test_key_is_not_stored_in_plain_text():
+    key = ClientPool.make_key("openai", "secret-key", timeout=60)
+    assert "secret-key" not in repr(key)
+
+
+def test_changed_config_retires_previous_client():
+    old_key = ClientPool.make_key("azure", "secret", "https://a.openai.azure.com", "2024-12-01-preview", 60)
+    new_key = ClientPool.make_key("azure", "secret", "https://a.openai.azure.com", "2025-04-01-preview", 60)
+    old = ClientPool.get_client(old_key, FakeClient)
+    new = ClientPool.get_client(new_key, FakeClient)
+    assert old is not new
+    assert ClientPool.size() == 1
+    assert not old.closed  # closed only after the grace period
+
+    ClientPool.clear()
+    assert old.closed and new.closed
+
+
+def test_invalidate_by_endpoint():
+    key = ClientPool.make_key("azure", "secret", "https://a.openai.azure.com/", "v", 60)
+    ClientPool.get_client(key, FakeClient)
+    assert ClientPool.invalidate(provider="azure", endpoint="https://a.openai.azure.com") == 1
+    assert ClientPool.size() == 0
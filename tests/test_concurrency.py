@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+"""Tests for the adaptive (AIMD) concurrency limit."""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+from src.openai_image_api.concurrency import AdaptiveLimit
+from src.openai_image_api.engine import ImageRequestEngine
+from src.openai_image_api.metrics import Metrics
+from src.openai_image_api.retry import ErrorKind, RetryPolicy, call_with_retry
+
+
+def _saturate(limit):
+    limit.in_flight = limit.current
+
+
+def test_limit_grows_only_while_saturated():
+    limit = AdaptiveLimit("lane", initial=2, minimum=1, maximum=4, adaptive=True)
+    for _ in range(10):
+        limit.on_success(1.0, time.monotonic())
+    assert limit.current == 2
+
+    for _ in range(8):
+        _saturate(limit)
+        limit.on_success(1.0, time.monotonic())
+    assert limit.current == 4
+    assert [reason for _, _, reason in limit.recent()] == ["initial", "increase", "increase"]
+
+
+def test_overload_halves_once_per_round():
+    limit = AdaptiveLimit("lane", initial=8, minimum=1, maximum=16, adaptive=True)
+    started = time.monotonic()
+    limit.on_failure(ErrorKind.RATE_LIMIT, started)
+    # 同一轮中更早发出的请求再失败不会继续减少
+    limit.on_failure(ErrorKind.SERVER, started)
+    assert limit.current == 4
+    limit.on_failure(ErrorKind.TIMEOUT, time.monotonic())
+    assert limit.current == 2
+    limit.on_failure(ErrorKind.CONTENT_FILTER, time.monotonic())
+    assert limit.current == 2
+
+
+def test_latency_inflation_backs_off():
+    limit = AdaptiveLimit("lane", initial=10, minimum=1, maximum=16, adaptive=True)
+    for _ in range(5):
+        limit.on_success(1.0, time.monotonic())
+    limit.on_success(5.0, time.monotonic())
+    assert limit.current == 9
+    assert limit.recent()[-1][2] == "latency"
+
+
+def test_mixed_request_costs_do_not_collapse_the_limit():
+    limit = AdaptiveLimit("lane", initial=8, minimum=1, maximum=16, adaptive=True)
+    # 低质量单图约 1 秒、高质量四图约 6 秒，交替出现且都没有过载
+    for i in range(40):
+        if i % 3:
+            limit.on_success(1.0, time.monotonic(), ("generation", "1024x1024", "low", 1, False))
+        else:
+            limit.on_success(6.0, time.monotonic(), ("generation", "1024x1536", "high", 4, False))
+    assert limit.current == 8
+
+    limit.on_success(15.0, time.monotonic(), ("generation", "1024x1536", "high", 4, False))
+    assert limit.current == 7
+
+
+def test_fixed_limit_when_adaptation_is_disabled(monkeypatch):
+    monkeypatch.setenv("OPENAI_IMAGE_API_ADAPTIVE_CONCURRENCY", "0")
+    limit = AdaptiveLimit("lane", maximum=6)
+    limit.on_failure(ErrorKind.RATE_LIMIT, time.monotonic())
+    assert limit.current == 6
+
+
+def test_changes_are_exported_as_metrics(monkeypatch):
+    metrics = Metrics()
+    monkeypatch.setattr(Metrics, "_instance", metrics)
+    limit = AdaptiveLimit("example.com/gpt-image-1", initial=4, maximum=8, adaptive=True)
+    limit.on_failure(ErrorKind.RATE_LIMIT, time.monotonic())
+    assert metrics.gauge_value("concurrency_limit", lane="example.com/gpt-image-1") == 2
+    assert metrics.counter_value("concurrency_adjustments_total", lane="example.com/gpt-image-1",
+                                 reason="rate_limit") == 1
+    assert '# TYPE openai_image_api_concurrency_limit gauge' in metrics.render()
+
+
+def test_retry_reports_each_attempt_to_the_limit():
+    limit = AdaptiveLimit("lane", initial=4, maximum=8, adaptive=True)
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        if len(calls) == 1:
+            error = RuntimeError("throttled")
+            error.status_code = 429
+            error.response = SimpleNamespace(headers={"retry-after-ms": "10"})
+            raise error
+        return "ok"
+
+    assert asyncio.run(call_with_retry(attempt, RetryPolicy(max_retries=2), limit=limit)) == "ok"
+    assert [reason for _, _, reason in limit.recent()] == ["initial", "rate_limit"]
+
+
+def test_engine_dispatch_follows_the_lowered_limit():
+    engine = ImageRequestEngine(max_concurrency_per_endpoint=4)
+    active = 0
+    peak = 0
+
+    async def lower():
+        engine.limit("lane").on_failure(ErrorKind.RATE_LIMIT, time.monotonic())
+        engine.limit("lane").on_failure(ErrorKind.RATE_LIMIT, time.monotonic())
+
+    async def call():
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.02)
+        active -= 1
+
+    engine.run("lane", lower)
+    futures = [engine.submit("lane", call) for _ in range(6)]
+    for future in futures:
+        future.result(timeout=5)
+    assert peak == 1
+    assert engine.stats()["lane"] == {"queued": 0, "in_flight": 0, "limit": 1}
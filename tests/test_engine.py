@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+"""Tests for the asyncio request engine."""
+
+import asyncio
+import threading
+
+from src.openai_image_api.engine import ImageRequestEngine
+
+
+def test_run_returns_coroutine_result():
+    engine = ImageRequestEngine()
+
+    async def call():
+        return 42
+
+    assert engine.run("lane", call) == 42
+
+
+def test_lane_concurrency_is_bounded():
+    engine = ImageRequestEngine(max_concurrency_per_endpoint=2)
+    active = 0
+    peak = 0
+
+    async def call():
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.02)
+        active -= 1
+
+    futures = [engine.submit("lane", call) for _ in range(6)]
+    for future in futures:
+        future.result(timeout=5)
+    assert peak == 2
+
+
+def test_higher_priority_runs_first():
+    engine = ImageRequestEngine(max_concurrency_per_endpoint=1)
+    gate = threading.Event()
+    order = []
+
+    async def blocker():
+        while not gate.is_set():
+            await asyncio.sleep(0.005)
+
+    def record(name):
+        async def call():
+            order.append(name)
+        return call
+
+    first = engine.submit("lane", blocker)
+    low = engine.submit("lane", record("low"), priority=0)
+    high = engine.submit("lane", record("high"), priority=10)
+    gate.set()
+    for future in (first, low, high):
+        future.result(timeout=5)
+    assert order == ["high", "low"]
+
+
+def test_exceptions_propagate_to_caller():
+    engine = ImageRequestEngine()
+
+    async def call():
+        raise ValueError("boom")
+
+    try:
+        engine.run("lane", call)
+    except ValueError as e:
+        assert str(e) == "boom"
+    else:
+        raise AssertionError("expected ValueError")
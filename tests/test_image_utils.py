@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+"""Tests for `ImageProcessor` conversions."""
+
+import io
+
+import numpy as np
+import torch
+from PIL import Image
+from src.openai_image_api.image_utils import ImageProcessor
+
+
+def _decode(data):
+    return np.array(Image.open(io.BytesIO(data)))
+
+
+def test_prepare_batch_encodes_every_frame():
+    batch = torch.rand(3, 16, 24, 3)
+    images = ImageProcessor.prepare_images_for_api(batch)
+    assert [name for name, _ in images] == ["image_0.png", "image_1.png", "image_2.png"]
+    for i, (_, data) in enumerate(images):
+        expected = (batch[i].numpy() * 255).round().astype(np.uint8)
+        assert np.array_equal(_decode(data), expected)
+
+
+def test_prepare_single_image_and_compress_level():
+    image = torch.rand(16, 16, 4)
+    [(name, fast)] = ImageProcessor.prepare_images_for_api(image, compress_level=0)
+    [(_, small)] = ImageProcessor.prepare_images_for_api(image, compress_level=9)
+    assert name == "image_0.png"
+    assert np.array_equal(_decode(fast), _decode(small))
+    assert _decode(fast).shape == (16, 16, 4)
+
+
+def test_batch_to_uint8_handles_ranges_and_layouts():
+    assert ImageProcessor.batch_to_uint8(torch.full((1, 2, 2, 3), 2.0)).max() == 2
+    assert ImageProcessor.batch_to_uint8(torch.full((1, 2, 2, 3), 1.0)).max() == 255
+    assert ImageProcessor.batch_to_uint8(torch.zeros(3, 8, 8)).shape == (1, 8, 8, 3)
+    assert ImageProcessor.batch_to_uint8(torch.zeros(8, 8, 1)).shape == (1, 8, 8, 1)
+
+
+def test_decode_images_preallocates_batch():
+    import base64
+
+    frames = []
+    for value in (0, 128, 255):
+        buffer = io.BytesIO()
+        Image.new("RGB", (6, 4), (value, value, value)).save(buffer, format="PNG")
+        frames.append(buffer.getvalue())
+
+    batch = ImageProcessor.decode_images([frames[0], base64.b64encode(frames[1]).decode("ascii"), frames[2]])
+    assert batch.shape == (3, 4, 6, 3)
+    assert batch.dtype == torch.float32
+    assert torch.allclose(batch[:, 0, 0, 0], torch.tensor([0.0, 128 / 255, 1.0]))
+    assert torch.equal(batch[1:2], ImageProcessor.bytes_to_tensor(frames[1]))
+
+
+def test_auto_upload_format_keeps_png_only_for_alpha():
+    opaque = torch.rand(1, 32, 32, 3)
+    transparent = torch.rand(1, 32, 32, 4)
+    transparent[..., 3] = 0.5
+    [(name, data)] = ImageProcessor.prepare_images_for_api(opaque, image_format="auto")
+    assert name == "image_0.jpg" and Image.open(io.BytesIO(data)).format == "JPEG"
+    [(name, data)] = ImageProcessor.prepare_images_for_api(transparent, image_format="auto")
+    assert name == "image_0.png" and _decode(data).shape == (32, 32, 4)
+
+
+def test_upload_is_downscaled_to_cover_target_size():
+    image = torch.rand(1, 400, 200, 3)
+    [(_, data)] = ImageProcessor.prepare_images_for_api(image, target_size=(100, 100))
+    assert Image.open(io.BytesIO(data)).size == (100, 200)
+    # smaller inputs are never upscaled
+    [(_, data)] = ImageProcessor.prepare_images_for_api(image, target_size=(1024, 1024))
+    assert Image.open(io.BytesIO(data)).size == (200, 400)
+
+
+def test_upload_respects_max_bytes():
+    image = torch.rand(1, 256, 256, 3)
+    [(_, data)] = ImageProcessor.prepare_images_for_api(image, image_format="PNG", max_bytes=60_000)
+    assert len(data) <= 60_000
+    assert Image.open(io.BytesIO(data)).size[0] < 256
+
+
+def test_prepare_mask_inverts_into_alpha_and_validates_size():
+    import pytest
+
+    mask = torch.zeros(1, 4, 6)
+    mask[0, :, :3] = 1.0
+    name, data = ImageProcessor.prepare_mask_for_api(mask, (6, 4))
+    alpha = _decode(data)[..., 3]
+    assert name == "mask.png" and alpha.shape == (4, 6)
+    assert (alpha[:, :3] == 0).all() and (alpha[:, 3:] == 255).all()
+
+    with pytest.raises(ValueError):
+        ImageProcessor.prepare_mask_for_api(mask, (8, 8))
+
+
+def test_decode_images_fits_mismatched_sizes():
+    frames = []
+    for size in ((8, 4), (4, 4), (8, 2)):
+        buffer = io.BytesIO()
+        Image.new("RGB", size, (255, 255, 255)).save(buffer, format="PNG")
+        frames.append(buffer.getvalue())
+
+    batch = ImageProcessor.decode_images(frames)
+    assert batch.shape == (3, 4, 8, 3)
+    assert batch[0].min() == 1.0
+    # 4x4 居中放在 8x4 中，左右各填充 2 列黑边
+    assert batch[1, :, :2].max() == 0.0 and batch[1, :, 2:6].min() == 1.0
+    assert batch[2, 0].max() == 0.0 and batch[2, 1:3].min() == 1.0
+
+
+def test_unmodified_decoded_images_reuse_original_bytes():
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 16), (10, 20, 30)).save(buffer, format="PNG")
+    original = buffer.getvalue()
+
+    batch = ImageProcessor.decode_images([original])
+    assert ImageProcessor.prepare_images_for_api(batch, image_format="auto") == [("image_0.png", original)]
+    assert ImageProcessor.prepare_images_for_api(batch, image_format="PNG", target_size=(32, 32)) == \
+        [("image_0.png", original)]
+
+    # 需要缩小、要求其他格式或张量被原地修改时重新编码
+    [(name, _)] = ImageProcessor.prepare_images_for_api(batch, image_format="JPEG")
+    assert name == "image_0.jpg"
+    [(_, data)] = ImageProcessor.prepare_images_for_api(batch, image_format="PNG", target_size=(8, 8))
+    assert Image.open(io.BytesIO(data)).size == (16, 8)
+    batch.mul_(0.5)
+    [(_, data)] = ImageProcessor.prepare_images_for_api(batch, image_format="PNG")
+    assert data != original
+    assert ImageProcessor.encoded_frames(batch) is None
+    assert ImageProcessor.encoded_frames(batch.clone()) is None
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+"""Tests for the background job manager."""
+
+import threading
+
+import pytest
+from src.openai_image_api.jobs import ImageJob, ImageJobManager
+
+
+def test_submit_returns_before_the_job_finishes():
+    manager = ImageJobManager(workers=2)
+    release = threading.Event()
+    job = manager.submit(lambda: release.wait(5) and "done", description="slow")
+    assert isinstance(job, ImageJob) and job.description == "slow"
+    assert manager.pending() == 1
+    release.set()
+    assert manager.result(job, timeout=5) == "done"
+    assert manager.pending() == 0
+
+
+def test_job_errors_are_raised_on_result():
+    manager = ImageJobManager(workers=1)
+
+    def fail():
+        raise RuntimeError("boom")
+
+    job = manager.submit(fail)
+    with pytest.raises(RuntimeError, match="boom"):
+        manager.result(job, timeout=5)
+
+
+def test_only_finished_jobs_are_trimmed():
+    manager = ImageJobManager(workers=2, max_retained=2)
+    release = threading.Event()
+    slow = manager.submit(release.wait, 5)
+    first = manager.submit(lambda: 1)
+    assert manager.result(first, timeout=5) == 1
+    manager.submit(lambda: 2)
+
+    with pytest.raises(RuntimeError, match="no longer available"):
+        manager.result(first)
+    release.set()
+    assert manager.result(slow, timeout=5) is True
+    with pytest.raises(RuntimeError, match="no longer available"):
+        manager.result(ImageJob(id="job-unknown"))
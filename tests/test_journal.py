@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""Tests for the persistent request journal."""
+
+import json
+import os
+import time
+
+from src.openai_image_api.image_request import ImageRequest
+from src.openai_image_api.journal import Journal
+
+
+def _request(prompt="a cat"):
+    return ImageRequest(provider="openai", model="gpt-image-1", prompt=prompt, size="1024x1024", quality="low")
+
+
+def test_completed_request_survives_restart(tmp_path):
+    request = _request()
+    journal = Journal(journal_dir=str(tmp_path))
+    journal.begin(request.cache_key, request)
+    assert journal.lookup(request.cache_key) is None
+    journal.complete(request.cache_key, [b"first", b"second"])
+
+    restarted = Journal(journal_dir=str(tmp_path))
+    assert restarted.lookup(request.cache_key) == [b"first", b"second"]
+    assert restarted.interrupted() == []
+
+
+def test_in_flight_requests_are_reported_after_restart(tmp_path):
+    done, lost, failed = _request("done"), _request("lost"), _request("failed")
+    journal = Journal(journal_dir=str(tmp_path))
+    for request in (done, lost, failed):
+        journal.begin(request.cache_key, request)
+    journal.complete(done.cache_key, [b"png"])
+    journal.fail(failed.cache_key, RuntimeError("boom"))
+    # 模拟上一个进程写入的记录与崩溃时留下的半行
+    lines = (tmp_path / "journal.jsonl").read_text().splitlines()
+    lines = [json.dumps({**json.loads(line), "pid": -1}) if '"start"' in line else line for line in lines]
+    (tmp_path / "journal.jsonl").write_text("\n".join(lines) + '\n{"event": "st')
+
+    restarted = Journal(journal_dir=str(tmp_path))
+    assert [entry["prompt"] for entry in restarted.interrupted()] == ["lost"]
+    assert restarted.lookup(lost.cache_key) is None
+    assert restarted.lookup(failed.cache_key) is None
+
+
+def test_expired_entries_are_compacted(tmp_path):
+    old, recent = _request("old"), _request("recent")
+    journal = Journal(journal_dir=str(tmp_path))
+    journal.complete(old.cache_key, [b"old"])
+    journal.complete(recent.cache_key, [b"recent"])
+    entries = [json.loads(line) for line in (tmp_path / "journal.jsonl").read_text().splitlines()]
+    entries[0]["time"] = time.time() - 30 * 86400
+    (tmp_path / "journal.jsonl").write_text("".join(json.dumps(e) + "\n" for e in entries))
+
+    restarted = Journal(journal_dir=str(tmp_path), retention_days=7)
+    assert restarted.lookup(old.cache_key) is None
+    assert restarted.lookup(recent.cache_key) == [b"recent"]
+    assert len((tmp_path / "journal.jsonl").read_text().splitlines()) == 1
+    assert not (tmp_path / "results" / old.cache_key[:2] / old.cache_key).exists()
+
+
+def test_journal_is_compacted_while_running(monkeypatch, tmp_path):
+    monkeypatch.setitem(Journal.DEFAULT_CONFIG, "compact_lines", 10)
+    done, pending = _request("done"), _request("pending")
+    journal = Journal(journal_dir=str(tmp_path))
+    journal.begin(pending.cache_key, pending)
+    for i in range(10):
+        failed = _request(f"failed {i}")
+        journal.begin(failed.cache_key, failed)
+        journal.fail(failed.cache_key, RuntimeError("boom"))
+    journal.begin(done.cache_key, done)
+    journal.complete(done.cache_key, [b"done"])
+
+    entries = [json.loads(line) for line in (tmp_path / "journal.jsonl").read_text().splitlines()]
+    assert [(e["event"], e["key"]) for e in entries] == [("start", pending.cache_key), ("done", done.cache_key)]
+    restarted = Journal(journal_dir=str(tmp_path))
+    assert restarted.lookup(done.cache_key) == [b"done"]
+
+
+def test_journal_can_be_disabled(monkeypatch):
+    monkeypatch.setenv("OPENAI_IMAGE_API_JOURNAL", "0")
+    assert Journal.get() is None
+    monkeypatch.delenv("OPENAI_IMAGE_API_JOURNAL")
+    assert Journal.get() is not None
+    assert os.environ["OPENAI_IMAGE_API_JOURNAL_DIR"] in str(Journal.get().root)
+
+
+def test_results_are_pruned_by_size(tmp_path):
+    first, second, third = _request("first"), _request("second"), _request("third")
+    journal = Journal(journal_dir=str(tmp_path), max_bytes=10)
+    journal.complete(first.cache_key, [b"1111"])
+    journal.complete(second.cache_key, [b"2222"])
+    assert journal.lookup(first.cache_key) == [b"1111"]
+    journal.complete(third.cache_key, [b"3333"])
+
+    assert journal.lookup(second.cache_key) is None
+    assert not (tmp_path / "results" / second.cache_key[:2] / second.cache_key).exists()
+    restarted = Journal(journal_dir=str(tmp_path), max_bytes=10)
+    assert restarted.lookup(first.cache_key) == [b"1111"]
+    assert restarted.lookup(second.cache_key) is None
+    assert restarted.lookup(third.cache_key) == [b"3333"]
+
+
+def test_results_are_linked_from_the_response_cache(tmp_path):
+    request = _request()
+    source = tmp_path / "cache"
+    source.mkdir()
+    (source / "0.png").write_bytes(b"png")
+    journal = Journal(journal_dir=str(tmp_path / "journal"))
+    journal.complete(request.cache_key, [b"png"], source)
+
+    result = tmp_path / "journal" / "results" / request.cache_key[:2] / request.cache_key / "0.png"
+    assert os.path.samefile(result, source / "0.png")
+    (source / "0.png").unlink()
+    assert Journal(journal_dir=str(tmp_path / "journal")).lookup(request.cache_key) == [b"png"]
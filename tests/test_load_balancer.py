@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+"""Tests for the multi-endpoint Azure load balancer."""
+
+import json
+
+import pytest
+from src.openai_image_api.azure_config import AzureConfigManager, AzureOpenAIConfig
+from src.openai_image_api.load_balancer import AzureLoadBalancer
+from src.openai_image_api.retry import ErrorKind
+
+
+def _config(region, weight=1.0):
+    return AzureOpenAIConfig(endpoint=f"https://{region}.openai.azure.com", api_key="key",
+                             api_version="2025-04-01-preview", deployment="gpt-image-1", weight=weight)
+
+
+def test_pool_configs_from_json():
+    pool = json.dumps([
+        {"endpoint": "eastus.openai.azure.com", "api_key": "a", "deployment": "img-east"},
+        {"endpoint": "https://westus.openai.azure.com", "api_key": "b", "weight": 2},
+    ])
+    configs = AzureConfigManager.create_pool_configs(pool)
+    assert [c.endpoint for c in configs] == ["https://eastus.openai.azure.com", "https://westus.openai.azure.com"]
+    assert configs[0].deployment == "img-east"
+    assert configs[1].weight == 2.0
+
+
+def test_pool_entry_requires_endpoint():
+    with pytest.raises(ValueError):
+        AzureConfigManager.create_pool_configs(json.dumps([{"api_key": "a"}]))
+
+
+def test_least_outstanding_spreads_requests():
+    balancer = AzureLoadBalancer([_config("eastus"), _config("westus")])
+    first = balancer.select()
+    second = balancer.select()
+    assert first is not second
+
+
+def test_flaky_fast_endpoint_loses_to_healthy_slow_one():
+    balancer = AzureLoadBalancer([_config("eastus"), _config("westus")])
+    east, west = balancer.members
+    balancer.select(exclude=[east])
+    balancer.record_success(west, 20.0)
+    for ok in (True, False, True):
+        balancer.select(exclude=[west])
+        if ok:
+            balancer.record_success(east, 0.5)
+        else:
+            balancer.record_failure(east, ErrorKind.SERVER)
+    assert east.health.open_until == 0.0
+
+    for _ in range(6):
+        member = balancer.select()
+        assert member is west
+        balancer.record_success(member, 20.0)
+
+
+def test_throttled_endpoint_is_skipped():
+    balancer = AzureLoadBalancer([_config("eastus"), _config("westus")])
+    east, west = balancer.members
+    balancer.record_failure(balancer.select(exclude=[west]), ErrorKind.RATE_LIMIT, retry_after=60)
+    for _ in range(3):
+        member = balancer.select()
+        assert member is west
+        balancer.record_success(member, 0.1)
+
+
+def test_circuit_opens_after_consecutive_failures_and_recovers():
+    balancer = AzureLoadBalancer([_config("eastus"), _config("westus")])
+    east, west = balancer.members
+    for _ in range(AzureLoadBalancer.DEFAULT_CONFIG["failure_threshold"]):
+        balancer.select(exclude=[west])
+        balancer.record_failure(east, ErrorKind.SERVER)
+    assert not balancer.snapshot()[0]["available"]
+    assert balancer.select() is west
+
+    east.health.open_until = 1e-9  # cooldown elapsed
+    probe = balancer.select(exclude=[west])
+    assert probe is east and east.health.probing
+    balancer.record_success(east, 0.2)
+    assert balancer.snapshot()[0]["available"]
+
+
+def test_client_errors_do_not_affect_health():
+    balancer = AzureLoadBalancer([_config("eastus")])
+    member = balancer.select()
+    balancer.record_failure(member, ErrorKind.CONTENT_FILTER)
+    assert member.health.error_rate == 0.0
+    assert member.health.outstanding == 0
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+"""Tests for the metrics registry and Prometheus export."""
+
+import urllib.request
+
+from src.openai_image_api.metrics import Metrics
+
+
+def test_counters_and_histograms_render_as_prometheus_text():
+    """Test counters and histograms render with labels and cumulative buckets."""
+    metrics = Metrics(buckets=(0.1, 1.0))
+    metrics.inc("requests_total", deployment="gpt-image-1", status="ok")
+    metrics.inc("requests_total", deployment="gpt-image-1", status="ok")
+    metrics.observe("stage_seconds", 0.05, stage="decode")
+    metrics.observe("stage_seconds", 0.5, stage="decode")
+
+    text = metrics.render()
+    assert "# TYPE openai_image_api_requests_total counter" in text
+    assert 'openai_image_api_requests_total{deployment="gpt-image-1",status="ok"} 2' in text
+    assert 'openai_image_api_stage_seconds_bucket{stage="decode",le="0.1"} 1' in text
+    assert 'openai_image_api_stage_seconds_bucket{stage="decode",le="1"} 2' in text
+    assert 'openai_image_api_stage_seconds_bucket{stage="decode",le="+Inf"} 2' in text
+    assert 'openai_image_api_stage_seconds_count{stage="decode"} 2' in text
+
+
+def test_timer_records_on_exception():
+    """Test a failing stage is still timed."""
+    metrics = Metrics()
+    try:
+        with metrics.stage("encode"):
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    assert metrics.histogram_count("stage_seconds", stage="encode") == 1
+
+
+def test_dump_and_serve(tmp_path):
+    """Test metrics can be written to a file and scraped over HTTP."""
+    metrics = Metrics()
+    metrics.inc("cache_lookups_total", result="hit")
+
+    path = tmp_path / "metrics.prom"
+    metrics.dump(str(path))
+    assert 'openai_image_api_cache_lookups_total{result="hit"} 1' in path.read_text()
+
+    port = metrics.serve(0)
+    try:
+        body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5).read().decode()
+        assert 'openai_image_api_cache_lookups_total{result="hit"} 1' in body
+    finally:
+        metrics.shutdown()
@@ -2,6 +2,8 @@
 
 """Tests for `openai_image_api` package."""
 
+import os
+
 import pytest
 from src.openai_image_api.nodes import OpenAIImageAPI
 
@@ -43,3 +45,412 @@ def test_input_types():
     
     # Check model options
     assert input_types["required"]["model"][0] == ["gpt-image-1"]
+
+def _png_b64(width=8, height=8, color=(255, 0, 0)):
+    import base64
+    import io
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+class FakeImages:
+    def __init__(self):
+        self.prompts = []
+
+    @property
+    def with_raw_response(self):
+        return self
+
+    async def generate(self, model, prompt, size, quality):
+        from types import SimpleNamespace
+
+        self.prompts.append(prompt)
+        return SimpleNamespace(data=[SimpleNamespace(b64_json=_png_b64())])
+
+
+class FakeClient:
+    base_url = "https://fake.example.com/v1/"
+    max_retries = 0
+
+    def __init__(self):
+        self.images = FakeImages()
+
+    def with_options(self, **kwargs):
+        return self
+
+
+def test_batch_node_input_types():
+    """Test the batch node exposes prompts, n and concurrency inputs."""
+    from src.openai_image_api.nodes import OpenAIImageBatchAPI
+
+    required = OpenAIImageBatchAPI.INPUT_TYPES()["required"]
+    assert "prompts" in required
+    assert "prompt" not in required
+    assert "n" in required
+    assert "max_concurrency" in required
+    assert "n" not in OpenAIImageBatchAPI.INPUT_TYPES()["optional"]
+    assert OpenAIImageBatchAPI.FUNCTION == "generate_batch"
+
+
+def test_batch_node_stacks_results_in_order(monkeypatch):
+    """Test the batch node fans out every prompt and stacks the images."""
+    from src.openai_image_api.nodes import OpenAIImageBatchAPI
+
+    node = OpenAIImageBatchAPI()
+    client = FakeClient()
+    monkeypatch.setattr(node, "_resolve_client", lambda *args: (client, "gpt-image-1"))
+
+    (batch,) = node.generate_batch("a cat\n\na dog\n", "gpt-image-1", "1024x1024", "low", "openai",
+                                   n=2, max_concurrency=3, use_cache=False)
+    assert tuple(batch.shape) == (4, 8, 8, 3)
+    assert sorted(client.images.prompts) == ["a cat", "a cat", "a dog", "a dog"]
+
+
+def test_cached_generation_skips_api(monkeypatch, tmp_path):
+    """Test an identical second run is served from the response cache."""
+    from src.openai_image_api.nodes import OpenAIImageAPI
+    from src.openai_image_api.response_cache import ResponseCache
+
+    monkeypatch.setattr(ResponseCache, "_instance", ResponseCache(cache_dir=str(tmp_path)))
+    node = OpenAIImageAPI()
+    client = FakeClient()
+    monkeypatch.setattr(node, "_resolve_client", lambda *args: (client, "gpt-image-1"))
+
+    args = ("a cat", "gpt-image-1", "1024x1024", "low", "openai")
+    (first,) = node.generate_image(*args)
+    (second,) = node.generate_image(*args)
+    assert client.images.prompts == ["a cat"]
+    assert first.shape == second.shape == (1, 8, 8, 3)
+
+    node.generate_image(*args, force_refresh=True)
+    assert client.images.prompts == ["a cat", "a cat"]
+
+
+def test_journal_result_is_reused_after_restart(monkeypatch, tmp_path):
+    """Test a result recorded before a restart is reused even when the cache lost it."""
+    from src.openai_image_api.journal import Journal
+    from src.openai_image_api.nodes import OpenAIImageAPI
+    from src.openai_image_api.response_cache import ResponseCache
+
+    monkeypatch.setattr(ResponseCache, "_instance", ResponseCache(cache_dir=str(tmp_path / "cache")))
+    monkeypatch.setenv("OPENAI_IMAGE_API_SHARED_FRAMES", "0")
+    node = OpenAIImageAPI()
+    client = FakeClient()
+    monkeypatch.setattr(node, "_resolve_client", lambda *args: (client, "gpt-image-1"))
+
+    args = ("a cat", "gpt-image-1", "1024x1024", "low", "openai")
+    node.generate_image(*args)
+    ResponseCache.get().clear()
+    monkeypatch.setattr(Journal, "_instance", None)
+
+    (image,) = node.generate_image(*args)
+    assert client.images.prompts == ["a cat"]
+    assert image.shape == (1, 8, 8, 3)
+
+
+def test_uncached_requests_are_not_journaled(monkeypatch, tmp_path):
+    """Test requests whose results can never be replayed do not write to the journal."""
+    from src.openai_image_api.nodes import OpenAIImageAPI
+
+    monkeypatch.setenv("OPENAI_IMAGE_API_SHARED_FRAMES", "0")
+    node = OpenAIImageAPI()
+    client = FakeClient()
+    monkeypatch.setattr(node, "_resolve_client", lambda *args: (client, "gpt-image-1"))
+
+    node.generate_image("a cat", "gpt-image-1", "1024x1024", "low", "openai", use_cache=False)
+    assert client.images.prompts == ["a cat"]
+    assert not os.path.exists(os.environ["OPENAI_IMAGE_API_JOURNAL_DIR"])
+
+
+def test_sibling_process_reuses_shared_frames(monkeypatch, tmp_path):
+    """Test decoded frames published by one process are reused without the API or PNG decoding."""
+    from src.openai_image_api.image_utils import ImageProcessor
+    from src.openai_image_api.nodes import OpenAIImageAPI
+    from src.openai_image_api.response_cache import ResponseCache
+    from src.openai_image_api.shared_frames import SharedFrameStore
+
+    monkeypatch.setattr(ResponseCache, "_instance", ResponseCache(cache_dir=str(tmp_path / "cache")))
+    node = OpenAIImageAPI()
+    client = FakeClient()
+    monkeypatch.setattr(node, "_resolve_client", lambda *args: (client, "gpt-image-1"))
+
+    args = ("a cat", "gpt-image-1", "1024x1024", "low", "openai")
+    (first,) = node.generate_image(*args)
+    # 模拟另一个进程：新的存储实例，且不能解码 PNG
+    monkeypatch.setattr(SharedFrameStore, "_instance", None)
+
+    def fail_decode(images):
+        raise AssertionError("PNG decoded again")
+
+    monkeypatch.setattr(ImageProcessor, "decode_images", fail_decode)
+    (second,) = node.generate_image(*args)
+    assert client.images.prompts == ["a cat"]
+    assert first.dtype == second.dtype and (first - second).abs().max() == 0
+
+
+def test_azure_pool_fails_over_on_throttling(monkeypatch):
+    """Test a throttled pool endpoint fails over to the next one."""
+    from types import SimpleNamespace
+    from src.openai_image_api.nodes import OpenAIImageAPI
+
+    class Throttled(Exception):
+        status_code = 429
+        response = SimpleNamespace(headers={"retry-after": "30"})
+
+    class ThrottledImages(FakeImages):
+        async def generate(self, model, prompt, size, quality):
+            self.prompts.append(prompt)
+            raise Throttled("throttled")
+
+    pool = '[{"endpoint": "https://east.openai.azure.com", "api_key": "a"},' \
+           ' {"endpoint": "https://west.openai.azure.com", "api_key": "b"}]'
+    monkeypatch.setenv("AZURE_OPENAI_POOL", pool)
+    clients = {"https://east.openai.azure.com": FakeClient(), "https://west.openai.azure.com": FakeClient()}
+    clients["https://east.openai.azure.com"].images = ThrottledImages()
+    clients["https://east.openai.azure.com"].base_url = "https://east.openai.azure.com/openai/"
+    clients["https://west.openai.azure.com"].base_url = "https://west.openai.azure.com/openai/"
+
+    node = OpenAIImageAPI()
+    monkeypatch.setattr(node, "_get_azure_client", lambda config: clients[config.endpoint])
+    for _ in range(2):
+        (tensor,) = node.generate_image("a cat", "gpt-image-1", "1024x1024", "low", "azure", use_cache=False)
+        assert tuple(tensor.shape) == (1, 8, 8, 3)
+    # the throttled region is only tried once, then skipped while throttled
+    assert len(clients["https://east.openai.azure.com"].images.prompts) <= 1
+    assert len(clients["https://west.openai.azure.com"].images.prompts) == 2
+
+
+def test_streaming_partial_images_reach_preview(monkeypatch):
+    """Test streamed partial images are forwarded and the final image is returned."""
+    from types import SimpleNamespace
+    from src.openai_image_api.nodes import OpenAIImageAPI
+    from src.openai_image_api.preview import PreviewReporter
+
+    received = []
+    monkeypatch.setattr(PreviewReporter, "on_partial", lambda self, index, b64: received.append(index))
+
+    class StreamingImages(FakeImages):
+        async def generate(self, model, prompt, size, quality, stream=False, partial_images=0):
+            async def events():
+                for i in range(partial_images):
+                    yield SimpleNamespace(type="image_generation.partial_image", partial_image_index=i,
+                                          b64_json=_png_b64(4, 4))
+                yield SimpleNamespace(type="image_generation.completed", b64_json=_png_b64(8, 8))
+
+            assert stream
+            return SimpleNamespace(headers={}, parse=events)
+
+    node = OpenAIImageAPI()
+    client = FakeClient()
+    client.images = StreamingImages()
+    monkeypatch.setattr(node, "_resolve_client", lambda *args: (client, "gpt-image-1"))
+
+    (tensor,) = node.generate_image("a cat", "gpt-image-1", "1024x1024", "low", "openai",
+                                    use_cache=False, partial_images=2)
+    assert tuple(tensor.shape) == (1, 8, 8, 3)
+    import time
+    deadline = time.time() + 2
+    while len(received) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert sorted(received) == [0, 1]
+
+
+def test_generation_records_stage_and_request_metrics(monkeypatch):
+    """Test a generation records per-stage timings and per-deployment counters."""
+    from src.openai_image_api.metrics import Metrics
+    from src.openai_image_api.nodes import OpenAIImageAPI
+
+    metrics = Metrics()
+    monkeypatch.setattr(Metrics, "_instance", metrics)
+    node = OpenAIImageAPI()
+    client = FakeClient()
+    monkeypatch.setattr(node, "_resolve_client", lambda *args: (client, "gpt-image-1"))
+
+    node.generate_image("a cat", "gpt-image-1", "1024x1024", "low", "openai", use_cache=False)
+    for stage in ("config", "api", "decode"):
+        assert metrics.histogram_count("stage_seconds", stage=stage) == 1
+    labels = dict(endpoint="fake.example.com", deployment="gpt-image-1", operation="generation")
+    assert metrics.counter_value("requests_total", status="ok", **labels) == 1
+    assert metrics.counter_value("upload_bytes_total", **labels) == len("a cat")
+    assert metrics.counter_value("download_bytes_total", **labels) > 0
+
+
+def test_mask_is_sent_with_png_edit(monkeypatch):
+    """Test an inpainting mask is encoded and sent alongside PNG input images."""
+    import torch
+    from types import SimpleNamespace
+    from src.openai_image_api.nodes import OpenAIImageAPI
+
+    class EditImages(FakeImages):
+        async def edit(self, **kwargs):
+            self.prompts.append(kwargs)
+            return SimpleNamespace(data=[SimpleNamespace(b64_json=_png_b64())])
+
+    node = OpenAIImageAPI()
+    client = FakeClient()
+    client.images = EditImages()
+    monkeypatch.setattr(node, "_resolve_client", lambda *args: (client, "gpt-image-1"))
+
+    image, mask = torch.rand(1, 16, 16, 3), torch.zeros(1, 16, 16)
+    node.generate_image("fill", "gpt-image-1", "1024x1024", "low", "openai", image=image, mask=mask, use_cache=False)
+    (call,) = client.images.prompts
+    assert [name for name, _ in call["image"]] == ["image_0.png"]
+    assert call["mask"][0] == "mask.png"
+
+    with pytest.raises(RuntimeError):
+        node.generate_image("fill", "gpt-image-1", "1024x1024", "low", "openai", mask=mask, use_cache=False)
+
+
+def test_per_frame_edit_keeps_frame_order_and_handles_failures(monkeypatch):
+    """Test per-frame mode edits every frame separately and substitutes failed frames on request."""
+    import io
+    import torch
+    from types import SimpleNamespace
+    from PIL import Image
+    from src.openai_image_api.nodes import OpenAIImageAPI
+
+    class FrameImages(FakeImages):
+        async def edit(self, **kwargs):
+            ((_, data),) = kwargs["image"]
+            value = Image.open(io.BytesIO(data)).getpixel((0, 0))[0]
+            self.prompts.append(value)
+            if value == 255:
+                raise ValueError("frame rejected")
+            return SimpleNamespace(data=[SimpleNamespace(b64_json=_png_b64(color=(value, 0, 0)))])
+
+    node = OpenAIImageAPI()
+    client = FakeClient()
+    client.images = FrameImages()
+    monkeypatch.setattr(node, "_resolve_client", lambda *args: (client, "gpt-image-1"))
+
+    frames = torch.stack([torch.full((16, 16, 3), v / 255) for v in (10, 20, 30, 40)])
+    args = ("stylize", "gpt-image-1", "1024x1024", "low", "openai")
+    (out,) = node.generate_image(*args, image=frames, use_cache=False, edit_mode="per_frame")
+    assert tuple(out.shape) == (4, 8, 8, 3)
+    assert sorted(client.images.prompts) == [10, 20, 30, 40]
+    assert [round(v * 255) for v in out[:, 0, 0, 0].tolist()] == [10, 20, 30, 40]
+
+    frames[2] = 1.0
+    with pytest.raises(RuntimeError, match="1 of 4 frames failed"):
+        node.generate_image(*args, image=frames, use_cache=False, edit_mode="per_frame")
+    (out,) = node.generate_image(*args, image=frames, use_cache=False, edit_mode="per_frame",
+                                 on_frame_error="use_input")
+    assert tuple(out.shape) == (4, 8, 8, 3)
+    assert torch.allclose(out[2], torch.ones(8, 8, 3))
+
+
+def test_n_images_come_back_as_one_batch(monkeypatch):
+    """Test a multi-image request asks for n images once and returns all of them."""
+    from types import SimpleNamespace
+    from src.openai_image_api.nodes import OpenAIImageAPI
+
+    class MultiImages(FakeImages):
+        async def generate(self, model, prompt, size, quality, n=1):
+            self.prompts.append((prompt, n))
+            sizes = [(8, 8), (8, 8), (4, 8)][:n]
+            return SimpleNamespace(data=[SimpleNamespace(b64_json=_png_b64(w, h)) for w, h in sizes])
+
+    node = OpenAIImageAPI()
+    client = FakeClient()
+    client.images = MultiImages()
+    monkeypatch.setattr(node, "_resolve_client", lambda *args: (client, "gpt-image-1"))
+
+    assert "n" in OpenAIImageAPI.INPUT_TYPES()["optional"]
+    (batch,) = node.generate_image("a cat", "gpt-image-1", "1024x1024", "low", "openai", n=3, use_cache=False)
+    assert client.images.prompts == [("a cat", 3)]
+    assert tuple(batch.shape) == (3, 8, 8, 3)
+
+
+def test_chained_edit_uploads_original_png(monkeypatch):
+    """Test editing an unmodified API result uploads the PNG the API returned."""
+    import base64
+    from types import SimpleNamespace
+    from src.openai_image_api.nodes import OpenAIImageAPI
+
+    class EditImages(FakeImages):
+        async def edit(self, **kwargs):
+            self.prompts.append(kwargs)
+            return SimpleNamespace(data=[SimpleNamespace(b64_json=_png_b64(color=(0, 255, 0)))])
+
+    node = OpenAIImageAPI()
+    client = FakeClient()
+    client.images = EditImages()
+    monkeypatch.setattr(node, "_resolve_client", lambda *args: (client, "gpt-image-1"))
+
+    args = ("gpt-image-1", "1024x1024", "low", "openai")
+    (generated,) = node.generate_image("a cat", *args, use_cache=False)
+    (edited,) = node.generate_image("make it green", *args, image=generated, use_cache=False)
+    node.generate_image("add a hat", *args, image=edited, use_cache=False)
+    first, second = client.images.prompts[1:]
+    assert first["image"] == [("image_0.png", base64.b64decode(_png_b64()))]
+    assert second["image"] == [("image_0.png", base64.b64decode(_png_b64(color=(0, 255, 0))))]
+
+
+def test_identical_concurrent_requests_are_coalesced(monkeypatch):
+    """Test identical requests running at the same time share one API call."""
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    from src.openai_image_api.nodes import OpenAIImageAPI
+
+    class SlowImages(FakeImages):
+        async def generate(self, model, prompt, size, quality):
+            await asyncio.sleep(0.3)
+            return await super().generate(model, prompt, size, quality)
+
+    node = OpenAIImageAPI()
+    client = FakeClient()
+    client.images = SlowImages()
+    monkeypatch.setattr(node, "_resolve_client", lambda *args: (client, "gpt-image-1"))
+
+    args = ("same prompt", "gpt-image-1", "1024x1024", "low", "openai")
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        results = list(executor.map(lambda _: node.generate_image(*args, use_cache=False)[0], range(3)))
+    assert client.images.prompts == ["same prompt"]
+    assert all(tuple(r.shape) == (1, 8, 8, 3) for r in results)
+
+
+def test_submit_returns_handle_and_collect_resolves_it(monkeypatch):
+    """Test the submit node returns before the request finishes and collect waits for it."""
+    import asyncio
+    import threading
+    from src.openai_image_api.jobs import ImageJobManager
+    from src.openai_image_api.nodes import (NODE_CLASS_MAPPINGS, OpenAIImageCollectAPI,
+                                            OpenAIImageSubmitAPI)
+
+    release = threading.Event()
+
+    class BlockedImages(FakeImages):
+        async def generate(self, model, prompt, size, quality):
+            await asyncio.get_running_loop().run_in_executor(None, release.wait, 5)
+            return await super().generate(model, prompt, size, quality)
+
+    monkeypatch.setattr(ImageJobManager, "_instance", ImageJobManager(workers=2))
+    submit = OpenAIImageSubmitAPI()
+    client = FakeClient()
+    client.images = BlockedImages()
+    monkeypatch.setattr(submit, "_resolve_client", lambda *args: (client, "gpt-image-1"))
+
+    assert "partial_images" not in OpenAIImageSubmitAPI.INPUT_TYPES()["optional"]
+    assert NODE_CLASS_MAPPINGS["OpenAI Image Collect API"] is OpenAIImageCollectAPI
+    (job,) = submit.submit_image("a cat", "gpt-image-1", "1024x1024", "low", "openai", use_cache=False)
+    assert ImageJobManager.get().pending() == 1
+    release.set()
+    (image,) = OpenAIImageCollectAPI().collect_image(job)
+    assert tuple(image.shape) == (1, 8, 8, 3)
+    assert client.images.prompts == ["a cat"]
+
+    (job,) = submit.submit_image("a cat", "gpt-image-1", "1024x1024", "low", "openai", mask=image[..., 0])
+    with pytest.raises(RuntimeError, match="requires an input image"):
+        OpenAIImageCollectAPI().collect_image(job)
+
+
+def test_parse_prompts_numbers_repeated_lines():
+    """Test repeated prompt lines get distinct variants so they are not coalesced."""
+    from src.openai_image_api.nodes import OpenAIImageBatchAPI
+
+    assert OpenAIImageBatchAPI.parse_prompts("a cat\na dog\na cat", 2) == [
+        ("a cat", 0), ("a cat", 1), ("a dog", 0), ("a dog", 1), ("a cat", 2), ("a cat", 3)
+    ]
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+"""Tests for the content-addressed response cache."""
+
+from src.openai_image_api.image_request import ImageRequest
+from src.openai_image_api.response_cache import ResponseCache
+
+
+def _request(**overrides):
+    fields = dict(provider="azure", model="gpt-image-1", prompt="a cat", size="1024x1024", quality="low")
+    fields.update(overrides)
+    return ImageRequest(**fields)
+
+
+def test_cache_key_depends_on_every_parameter():
+    base = _request().cache_key
+    assert _request().cache_key == base
+    assert _request(prompt="a dog").cache_key != base
+    assert _request(quality="high").cache_key != base
+    assert _request(variant=1).cache_key != base
+    assert _request(n=1).cache_key == base
+    assert _request(n=4).cache_key != base
+    assert _request(images=(("image_0.png", b"abc"),)).cache_key != base
+    assert _request(images=(("image_0.png", b"abc"),)).cache_key != _request(images=(("image_0.png", b"abd"),)).cache_key
+    assert _request(images=(("image_0.png", b"abc"),), mask=("mask.png", b"m")).cache_key != \
+        _request(images=(("image_0.png", b"abc"),)).cache_key
+
+
+def test_store_and_lookup_round_trip(tmp_path):
+    cache = ResponseCache(cache_dir=str(tmp_path))
+    assert cache.lookup("ab" * 32) is None
+    cache.store("ab" * 32, [b"first", b"second"])
+    assert cache.lookup("ab" * 32) == [b"first", b"second"]
+    # a fresh instance rebuilds its index from disk
+    assert ResponseCache(cache_dir=str(tmp_path)).total_bytes() == len(b"firstsecond")
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResponseCache(cache_dir=str(tmp_path), max_bytes=10)
+    cache.store("aa" * 32, [b"12345"])
+    cache.store("bb" * 32, [b"12345"])
+    assert cache.lookup("aa" * 32) == [b"12345"]  # refresh "aa"
+    cache.store("cc" * 32, [b"12345"])
+    assert cache.lookup("bb" * 32) is None
+    assert cache.lookup("aa" * 32) is not None
+    assert cache.total_bytes() <= 10
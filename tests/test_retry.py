@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""Tests for the rate-limit-aware retry engine."""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from src.openai_image_api.retry import (
+    ErrorKind, RetryPolicy, TokenBucket, call_with_retry, classify_error, parse_duration, retry_after_seconds
+)
+
+
+class FakeStatusError(Exception):
+    def __init__(self, status_code, headers=None, code=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.code = code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+def test_classify_error():
+    assert classify_error(FakeStatusError(429)) == ErrorKind.RATE_LIMIT
+    assert classify_error(FakeStatusError(503)) == ErrorKind.SERVER
+    assert classify_error(FakeStatusError(400, code="content_filter")) == ErrorKind.CONTENT_FILTER
+    assert classify_error(FakeStatusError(401)) == ErrorKind.CLIENT
+    assert classify_error(asyncio.TimeoutError()) == ErrorKind.TIMEOUT
+    assert classify_error(ValueError("boom")) == ErrorKind.UNKNOWN
+
+
+def test_retry_after_headers():
+    assert retry_after_seconds({"retry-after-ms": "1500"}) == 1.5
+    assert retry_after_seconds({"retry-after": "7"}) == 7.0
+    assert retry_after_seconds({}) is None
+    assert retry_after_seconds({"retry-after": "abc"}) is None
+    assert parse_duration("6m0s") == 360.0
+    assert parse_duration("250ms") == 0.25
+
+
+def test_rate_limited_call_is_retried_and_bucket_paused():
+    bucket = TokenBucket()
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        if len(calls) < 3:
+            raise FakeStatusError(429, {"retry-after-ms": "10"})
+        return "ok"
+
+    result = asyncio.run(call_with_retry(attempt, RetryPolicy(max_retries=3), bucket))
+    assert result == "ok"
+    assert len(calls) == 3
+    assert bucket.paused_until > 0
+
+
+def test_non_retryable_errors_raise_immediately():
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        raise FakeStatusError(400, code="content_filter")
+
+    with pytest.raises(FakeStatusError):
+        asyncio.run(call_with_retry(attempt, RetryPolicy(max_retries=3)))
+    assert len(calls) == 1
+
+
+def test_retries_are_bounded():
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        raise FakeStatusError(500, {"retry-after": "0"})
+
+    with pytest.raises(FakeStatusError):
+        asyncio.run(call_with_retry(attempt, RetryPolicy(max_retries=2)))
+    assert len(calls) == 3
+
+
+def test_malformed_retry_after_does_not_mask_the_error():
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        if len(calls) < 2:
+            raise FakeStatusError(429, {"retry-after": "abc"})
+        return "ok"
+
+    assert asyncio.run(call_with_retry(attempt, RetryPolicy(max_retries=2, base_delay=0.01))) == "ok"
+    assert len(calls) == 2
+
+
+def test_exhausted_quota_header_pauses_bucket():
+    bucket = TokenBucket()
+    bucket.observe_headers({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "2s"})
+    assert bucket.paused_until > 0
+
+
+def test_retry_after_above_the_cap_fails_fast(monkeypatch):
+    bucket = TokenBucket()
+    calls = []
+    sleeps = []
+
+    async def attempt():
+        calls.append(1)
+        raise FakeStatusError(429, {"retry-after": "3600"})
+
+    async def sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    with pytest.raises(FakeStatusError):
+        asyncio.run(call_with_retry(attempt, RetryPolicy(max_retries=3, max_delay=60.0), bucket))
+    assert len(calls) == 1
+    assert sleeps == []
+    assert 0 < bucket.paused_until - time.monotonic() <= 60.0
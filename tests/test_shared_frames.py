@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+"""Tests for the host-local shared frame store."""
+
+import errno
+import os
+
+import numpy as np
+import torch
+from src.openai_image_api.shared_frames import SharedFrameStore
+
+
+def test_publish_and_lookup_across_instances(tmp_path):
+    pixels = np.random.randint(0, 256, size=(2, 4, 6, 3), dtype=np.uint8)
+    SharedFrameStore(root=str(tmp_path)).publish("ab" * 32, pixels)
+
+    frames = SharedFrameStore(root=str(tmp_path)).lookup("ab" * 32)
+    assert frames.dtype == torch.float32 and tuple(frames.shape) == (2, 4, 6, 3)
+    assert torch.equal(frames.mul(255).round().to(torch.uint8), torch.from_numpy(pixels))
+    assert SharedFrameStore(root=str(tmp_path)).lookup("cd" * 32) is None
+
+
+def test_truncated_entry_is_ignored(tmp_path):
+    store = SharedFrameStore(root=str(tmp_path))
+    store.publish("ab" * 32, np.zeros((1, 8, 8, 3), dtype=np.uint8))
+    path = tmp_path / f"{'ab' * 32}.u8"
+    path.write_bytes(path.read_bytes()[:40])
+    assert store.lookup("ab" * 32) is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    entry = np.zeros((1, 16, 16, 3), dtype=np.uint8)
+    store = SharedFrameStore(root=str(tmp_path), max_bytes=2 * (entry.nbytes + SharedFrameStore.HEADER.size))
+    store.publish("aa" * 32, entry)
+    store.publish("bb" * 32, entry)
+    os.utime(tmp_path / f"{'aa' * 32}.u8", (1, 1))
+    store.lookup("aa" * 32)
+    os.utime(tmp_path / f"{'bb' * 32}.u8", (2, 2))
+    store.publish("cc" * 32, entry)
+    assert store.lookup("aa" * 32) is not None
+    assert store.lookup("bb" * 32) is None
+    assert store.lookup("cc" * 32) is not None
+
+
+def test_store_can_be_disabled(monkeypatch):
+    monkeypatch.setenv("OPENAI_IMAGE_API_SHARED_FRAMES", "0")
+    assert SharedFrameStore.get() is None
+
+
+def test_full_filesystem_is_recovered_by_eviction(monkeypatch, tmp_path):
+    entry = np.zeros((1, 16, 16, 3), dtype=np.uint8)
+    store = SharedFrameStore(root=str(tmp_path), max_bytes=10 * entry.nbytes)
+    store.publish("aa" * 32, entry)
+    store.publish("bb" * 32, entry)
+    os.utime(tmp_path / f"{'aa' * 32}.u8", (1, 1))
+
+    real_fdopen = os.fdopen
+    failures = []
+
+    def fdopen(fd, *args, **kwargs):
+        if not failures:
+            failures.append(fd)
+            raise OSError(errno.ENOSPC, "No space left on device")
+        return real_fdopen(fd, *args, **kwargs)
+
+    monkeypatch.setattr(os, "fdopen", fdopen)
+    monkeypatch.setattr(store, "_free_bytes", lambda: 0)
+    store.publish("cc" * 32, entry)
+    assert failures
+    assert store.lookup("aa" * 32) is None
+    assert store.lookup("bb" * 32) is not None
+    assert store.lookup("cc" * 32) is not None
+
+
+def test_default_limit_follows_free_space(monkeypatch, tmp_path):
+    monkeypatch.delenv("OPENAI_IMAGE_API_SHARED_FRAMES_MAX_MB", raising=False)
+    monkeypatch.setattr(SharedFrameStore, "_free_bytes", lambda self: 64 * 1024 * 1024)
+    assert SharedFrameStore(root=str(tmp_path)).max_bytes == 16 * 1024 * 1024
+    monkeypatch.setenv("OPENAI_IMAGE_API_SHARED_FRAMES_MAX_MB", "100")
+    assert SharedFrameStore(root=str(tmp_path)).max_bytes == 100 * 1024 * 1024
+
+
+def test_default_directory_is_per_user(monkeypatch):
+    monkeypatch.delenv("OPENAI_IMAGE_API_SHARED_FRAMES_DIR", raising=False)
+    assert SharedFrameStore().root.name == f"comfy_openai_image_api_frames_{os.getuid()}"
+
+
+def test_directory_writable_by_others_disables_the_store(tmp_path):
+    entry = np.zeros((1, 16, 16, 3), dtype=np.uint8)
+    tmp_path.chmod(0o777)
+    store = SharedFrameStore(root=str(tmp_path), max_bytes=10 * entry.nbytes)
+    store.publish("aa" * 32, entry)
+    assert list(tmp_path.iterdir()) == []
+    assert store.lookup("aa" * 32) is None
+
+
+def test_directory_owned_by_another_user_disables_the_store(monkeypatch, tmp_path):
+    entry = np.zeros((1, 16, 16, 3), dtype=np.uint8)
+    SharedFrameStore(root=str(tmp_path), max_bytes=10 * entry.nbytes).publish("aa" * 32, entry)
+    monkeypatch.setattr(os, "getuid", lambda: os.stat(tmp_path).st_uid + 1)
+    assert SharedFrameStore(root=str(tmp_path), max_bytes=10 * entry.nbytes).lookup("aa" * 32) is None
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+"""Tests for coalescing identical in-flight requests."""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.openai_image_api.single_flight import SingleFlight
+
+
+def test_concurrent_identical_calls_share_one_result():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def call():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return ["png"]
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        leader = executor.submit(flight.do, "key", call)
+        started.wait(5)
+        followers = [executor.submit(flight.do, "key", call) for _ in range(2)]
+        time.sleep(0.2)
+        release.set()
+        assert leader.result() == (["png"], False)
+        assert [f.result() for f in followers] == [(["png"], True)] * 2
+    assert len(calls) == 1
+    assert flight.in_flight() == 0
+
+
+def test_errors_propagate_and_are_not_remembered():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        flight.do("key", fail)
+    assert flight.do("key", lambda: 1) == (1, False)
@@ -0,0 +1,38 @@
+import { app } from "../../scripts/app.js";
+import { api } from "../../scripts/api.js";
+
+// Shows streamed partial-image progress on OpenAI Image API nodes.
+// The preview image itself is delivered through ComfyUI's progress preview channel.
+app.registerExtension({
+    name: "openai_image_api.PartialPreview",
+    setup() {
+        api.addEventListener("openai_image_api.partial_image", ({ detail }) => {
+            const node = app.graph.getNodeById(Number(detail.node));
+            if (!node) {
+                return;
+            }
+            node.openaiPartialStatus = detail.done
+                ? null
+                : `partial ${detail.index + 1}/${detail.total}`;
+            node.setDirtyCanvas(true, false);
+        });
+    },
+    async beforeRegisterNodeDef(nodeType, nodeData) {
+        if (nodeData.name !== "OpenAI Image API") {
+            return;
+        }
+        const onDrawForeground = nodeType.prototype.onDrawForeground;
+        nodeType.prototype.onDrawForeground = function (ctx) {
+            onDrawForeground?.apply(this, arguments);
+            if (!this.openaiPartialStatus || this.flags?.collapsed) {
+                return;
+            }
+            ctx.save();
+            ctx.font = "12px sans-serif";
+            ctx.fillStyle = "#8fd";
+            ctx.textAlign = "right";
+            ctx.fillText(this.openaiPartialStatus, this.size[0] - 8, -8);
+            ctx.restore();
+        };
+    },
+});